@@ -1,7 +1,10 @@
 import os
 import logging
-from flask import Flask
+import sqlite3
+import click
+from flask import Flask, current_app
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 from sqlalchemy.orm import DeclarativeBase
 
 # Set up logging
@@ -14,32 +17,144 @@ class Base(DeclarativeBase):
 
 db = SQLAlchemy(model_class=Base)
 
-# create the app
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "dev_secret_key")
 
-# configure the database, relative to the app instance folder
-app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get(
-    "DATABASE_URL", "sqlite:///pkanalysis.db")
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
-app.config["UPLOAD_FOLDER"] = "uploads"
-app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024  # 16MB max upload size
+def load_config(app):
+    """Read the app settings, each overridable through an environment variable of the same name."""
+    app.secret_key = os.environ.get("SESSION_SECRET", "dev_secret_key")
 
-# Ensure upload folder exists
-os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
+    # configure the database, relative to the app instance folder
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get(
+        "DATABASE_URL", "sqlite:///pkanalysis.db")
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        "pool_recycle": 300,
+        "pool_pre_ping": True,
+    }
+    if not app.config["SQLALCHEMY_DATABASE_URI"].startswith("sqlite"):
+        # Connections per process: size so that workers * (pool size + overflow) stays below the server limit
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"].update({
+            "pool_size": int(os.environ.get("DB_POOL_SIZE", 5)),
+            "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+            "pool_timeout": int(os.environ.get("DB_POOL_TIMEOUT", 30)),
+        })
+    # SQLite memory-mapped I/O size in bytes; 0 disables it
+    app.config["SQLITE_MMAP_SIZE"] = int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+    app.config["UPLOAD_FOLDER"] = "uploads"
+    app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024  # 16MB max upload size
+    # The result, derived dataset and response caches below are in-process: every worker process fills its
+    # own copy, so they can take up to workers times their byte limits (size them per worker). The mapped
+    # profile cache files are the exception, shared by all workers through the OS page cache
+    app.config["RESULT_CACHE_SIZE"] = int(os.environ.get("RESULT_CACHE_SIZE", 128))
+    app.config["RESULT_CACHE_MAX_BYTES"] = int(os.environ.get("RESULT_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+    # Per-dataset binary files of the concentration-time data, written at upload and memory-mapped by
+    # analyses instead of loading the samples from the database; empty disables them
+    app.config["PROFILE_CACHE_FOLDER"] = os.environ.get("PROFILE_CACHE_FOLDER", os.path.join("uploads", "profiles"))
+    # Samples per chunk (16 bytes each) when analyses iterate over a mapped dataset
+    app.config["PROFILE_CACHE_CHUNK_SAMPLES"] = int(os.environ.get("PROFILE_CACHE_CHUNK_SAMPLES", 4 * 1024 * 1024))
+    # Materialized arrays of derived datasets; 0 disables caching
+    app.config["DERIVED_DATASET_CACHE_BYTES"] = int(os.environ.get("DERIVED_DATASET_CACHE_BYTES", 128 * 1024 * 1024))
+    # Serialized API responses; compressed when larger than RESPONSE_COMPRESS_MIN_BYTES
+    app.config["RESPONSE_CACHE_SIZE"] = int(os.environ.get("RESPONSE_CACHE_SIZE", 256))
+    app.config["RESPONSE_CACHE_MAX_BYTES"] = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+    app.config["RESPONSE_COMPRESS_MIN_BYTES"] = int(os.environ.get("RESPONSE_COMPRESS_MIN_BYTES", 1024))
+    app.config["RESPONSE_GZIP_LEVEL"] = int(os.environ.get("RESPONSE_GZIP_LEVEL", 6))
+    # Uploads are parsed in chunks of this many rows; 0 reads the whole file at once
+    app.config["INGEST_CHUNKSIZE"] = int(os.environ.get("INGEST_CHUNKSIZE", 100_000))
+    # CSV parser engine for uploads ('c', 'python' or 'pyarrow'); empty uses the pandas default
+    app.config["INGEST_ENGINE"] = os.environ.get("INGEST_ENGINE") or None
+    # Per-request SQL counts and timings, slow-query and N+1 logging; /debug/perf is served in debug mode or when enabled
+    app.config["PERF_INSTRUMENTATION"] = os.environ.get("PERF_INSTRUMENTATION", "1") == "1"
+    app.config["PERF_SLOW_QUERY_MS"] = float(os.environ.get("PERF_SLOW_QUERY_MS", 100))
+    app.config["PERF_N_PLUS_ONE_THRESHOLD"] = int(os.environ.get("PERF_N_PLUS_ONE_THRESHOLD", 5))
+    app.config["PERF_DEBUG_ENDPOINT"] = os.environ.get("PERF_DEBUG_ENDPOINT", "0") == "1"
+    # Analyses and reports are profiled when the request asks for it (profile=sampling or profile=cprofile)
+    app.config["PROFILING"] = os.environ.get("PROFILING", "1") == "1"
+    app.config["PROFILE_SAMPLE_INTERVAL_MS"] = float(os.environ.get("PROFILE_SAMPLE_INTERVAL_MS", 5))
+    # Population simulations: largest allowed population, and memory budget of one chunk of simulated subjects
+    app.config["SIMULATION_MAX_SUBJECTS"] = int(os.environ.get("SIMULATION_MAX_SUBJECTS", 1_000_000))
+    app.config["SIMULATION_CHUNK_BYTES"] = int(os.environ.get("SIMULATION_CHUNK_BYTES", 32 * 1024 * 1024))
+    # Create missing tables, columns and indexes when the app is created. Set AUTO_INIT_DB=0 where several
+    # processes create the app at once, and run `flask init-db` once before starting them instead
+    app.config["AUTO_INIT_DB"] = os.environ.get("AUTO_INIT_DB", "1") == "1"
 
-# initialize the app with the extension
-db.init_app(app)
 
-with app.app_context():
-    # Import models
-    import models  # noqa: F401
+def configure_sqlite(engine, mmap_size):
+    """Enable WAL (readers do not block the writer), relaxed syncing and memory-mapped reads on SQLite."""
+    @event.listens_for(engine, "connect")
+    def configure_sqlite_connection(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
 
-    # Create database tables
-    db.create_all()
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
 
-# Import routes
-from routes import *
+
+def init_db(app):
+    """Create missing tables, then add the columns and indexes that existing tables lack."""
+    from migrations import upgrade_schema
+
+    with app.app_context():
+        db.create_all()
+        return upgrade_schema(db.engine, db.metadata)
+
+
+@click.command("init-db")
+def init_db_command():
+    """Create or upgrade the database schema."""
+    changes = init_db(current_app)
+    click.echo(f"Database ready ({len(changes)} schema changes applied)")
+
+
+def create_app(config=None):
+    """
+    Create and configure the application.
+    
+    Importing this module is cheap: models, routes and the analysis code are
+    imported here, and the numerical libraries only when an analysis first
+    needs them. The schema is created or upgraded here unless AUTO_INIT_DB=0,
+    in which case `flask init-db` does it.
+    
+    Parameters:
+    - config: Optional dictionary of settings overriding the environment defaults
+    
+    Returns:
+    - Flask application
+    """
+    app = Flask(__name__)
+    load_config(app)
+    if config:
+        app.config.update(config)
+    
+    # Ensure upload folder exists
+    os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
+    if app.config["PROFILE_CACHE_FOLDER"]:
+        os.makedirs(app.config["PROFILE_CACHE_FOLDER"], exist_ok=True)
+    
+    # initialize the app with the extension
+    db.init_app(app)
+    
+    with app.app_context():
+        # Import models
+        import models  # noqa: F401
+        
+        configure_sqlite(db.engine, app.config["SQLITE_MMAP_SIZE"])
+    
+    # Request and query instrumentation
+    from perf import init_perf
+    init_perf(app)
+    
+    # Register routes and their caches
+    from responses import init_responses
+    from routes import init_routes
+    init_responses(app)
+    init_routes(app)
+    
+    app.cli.add_command(init_db_command)
+    
+    if app.config["AUTO_INIT_DB"]:
+        init_db(app)
+    
+    return app
@@ -0,0 +1,155 @@
+"""
+Import-time benchmark for application start-up.
+
+Runs `python -X importtime` in fresh interpreters, importing `main` (which
+creates the app, as a server worker does on start) and then the first
+analysis of each type, which pulls in that analysis's numerical libraries.
+Reports the best cumulative import time per target and the slowest modules.
+
+Results can be appended to a history file, keyed by the pk_tools version,
+so import time is tracked across releases; --max-ms fails the run when the
+app import exceeds a budget.
+
+Usage:
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --history benchmarks/import_history.json
+    python benchmarks/bench_import.py --max-ms 1000
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Target name -> statement whose imports are measured, run after `import main`
+TARGETS = {
+    'app': None,
+    'nca': "from pk_tools.nca import calculate_nca_parameters",
+    'compartmental': "from pk_tools.compartmental import fit_subject; "
+                     "fit_subject('1', [1, 2, 4, 8], [8, 6, 3, 1], model_type='one_compartment', absorption='iv_bolus')",
+    'statistics': "from pk_tools.statistics import perform_statistical_analysis; "
+                  "perform_statistical_analysis({'1': {'times': [1, 2], 'concentrations': [2, 1]}})",
+    'bioequivalence': "from pk_tools.bioequivalence import calculate_bioequivalence; "
+                      "calculate_bioequivalence({}, {})",
+    'upload': "from pk_tools.fileio import read_dataset; import pandas",
+    'reports': "from pk_tools.reports import generate_plot; generate_plot({}, 'concentration_time')"
+}
+
+def parse_importtime(stderr):
+    """Return {module: (self us, cumulative us, top-level)} from -X importtime output."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line or '|' not in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        # Nested imports are indented by two spaces per level
+        modules[name.strip()] = (int(self_us), int(cumulative_us), not name[1:].startswith(' '))
+    return modules
+
+def measure(statement, env):
+    """Import main, then run statement; return (ms to import main, ms spent in statement's imports, modules)."""
+    code = "import main"
+    if statement:
+        code += "\nimport sys; sys.stderr.write('import time: -- statement --\\n')\n" + statement
+    
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT, env=env,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    
+    before, _, after = result.stderr.partition('import time: -- statement --')
+    app_modules = parse_importtime(before)
+    statement_modules = parse_importtime(after)
+    
+    app_ms = app_modules['main'][1] / 1000
+    statement_ms = sum(
+        cumulative for _, cumulative, top_level in statement_modules.values() if top_level
+    ) / 1000
+    
+    return app_ms, statement_ms, (statement_modules if statement else app_modules)
+
+def run(repeat, top):
+    tmpdir = tempfile.mkdtemp()
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmpdir, 'bench.db')}")
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    
+    # Warm the bytecode cache so compilation is not counted
+    measure(None, env)
+    
+    results = {}
+    print(f"{'target':<16} {'app ms':>9} {'first use ms':>13}  slowest modules")
+    for target, statement in TARGETS.items():
+        best = None
+        for _ in range(repeat):
+            app_ms, statement_ms, modules = measure(statement, env)
+            if best is None or app_ms + statement_ms < best[0] + best[1]:
+                best = (app_ms, statement_ms, modules)
+        
+        app_ms, statement_ms, modules = best
+        slowest = sorted(((self_us / 1000, name.strip()) for name, (self_us, _, _) in modules.items()), reverse=True)[:top]
+        results[target] = {
+            'app_ms': round(app_ms, 2),
+            'first_use_ms': round(statement_ms, 2),
+            'slowest_modules': [{'module': name, 'self_ms': round(ms, 2)} for ms, name in slowest]
+        }
+        print(f"{target:<16} {app_ms:9.1f} {statement_ms:13.1f}  "
+              f"{', '.join(f'{name} {ms:.0f}' for ms, name in slowest[:3])}")
+    
+    shutil.rmtree(tmpdir)
+    return results
+
+def append_history(path, results):
+    """Append this run to a JSON list of runs, one entry per measurement, keyed by version."""
+    from pk_tools import __version__
+    
+    history = []
+    if os.path.exists(path):
+        with open(path) as f:
+            history = json.load(f)
+    
+    history.append({
+        'version': __version__,
+        'python': sys.version.split()[0],
+        'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'app_ms': results['app']['app_ms'],
+        'first_use_ms': {target: r['first_use_ms'] for target, r in results.items() if target != 'app'}
+    })
+    
+    with open(path, 'w') as f:
+        json.dump(history, f, indent=2)
+    
+    if len(history) > 1:
+        previous = history[-2]
+        change = history[-1]['app_ms'] - previous['app_ms']
+        print(f"\napp import {history[-1]['app_ms']:.1f} ms, {change:+.1f} ms since {previous['version']}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5, help="Interpreter runs per target; the best run is reported")
+    parser.add_argument('--top', type=int, default=10, help="Number of slowest modules reported per target")
+    parser.add_argument('--output', help="Write the results as JSON to this path")
+    parser.add_argument('--history', help="Append a summary of this run to this JSON history file")
+    parser.add_argument('--max-ms', type=float, help="Exit with status 1 if importing the app takes longer")
+    args = parser.parse_args()
+    
+    results = run(args.repeat, args.top)
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    
+    if args.history:
+        append_history(args.history, results)
+    
+    if args.max_ms is not None and results['app']['app_ms'] > args.max_ms:
+        print(f"\nApp import took {results['app']['app_ms']:.1f} ms, over the {args.max_ms:.0f} ms budget")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Upload ingest throughput benchmark.
+
+Generates synthetic concentration-time CSV files (see synthetic.py) and times the readers used
+for uploads: pandas with default dtype inference (the old parse_file), the
+typed single-pass reader, chunked streaming and the pyarrow engine.
+
+Usage:
+    python benchmarks/bench_ingest.py                 # 10 MB file
+    python benchmarks/bench_ingest.py --sizes 10 1024 # 10 MB and 1 GB files
+    python benchmarks/bench_ingest.py --output ingest.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from pk_tools.fileio import read_dataset, ingest_dataset
+from synthetic import write_csv_of_size
+
+def time_reader(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def run(sizes, repeat, chunksize):
+    try:
+        import pyarrow  # noqa: F401
+        has_pyarrow = True
+    except ImportError:
+        has_pyarrow = False
+        print("pyarrow is not installed; skipping the pyarrow engine")
+    
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for size_mb in sizes:
+            path = os.path.join(tmpdir, f'ingest_{size_mb}mb.csv')
+            n_rows = write_csv_of_size(path, size_mb)
+            file_mb = os.path.getsize(path) / (1024 * 1024)
+            
+            readers = {
+                'default_inference': lambda: pd.read_csv(path),
+                'typed': lambda: read_dataset(path),
+                'typed_validated': lambda: ingest_dataset(path),
+                'streaming': lambda: ingest_dataset(path, chunksize=chunksize)
+            }
+            if has_pyarrow:
+                readers['pyarrow'] = lambda: ingest_dataset(path, engine='pyarrow')
+                readers['pyarrow_streaming'] = lambda: ingest_dataset(path, chunksize=chunksize, engine='pyarrow')
+            
+            print(f"\n{file_mb:.1f} MB, {n_rows} rows")
+            for name, func in readers.items():
+                elapsed = time_reader(func, repeat)
+                result = {
+                    'reader': name,
+                    'file_mb': round(file_mb, 2),
+                    'rows': n_rows,
+                    'seconds': round(elapsed, 4),
+                    'mb_per_s': round(file_mb / elapsed, 2),
+                    'rows_per_s': round(n_rows / elapsed)
+                }
+                results.append(result)
+                print(f"  {name:<20} {elapsed:8.3f} s {result['mb_per_s']:10.1f} MB/s {result['rows_per_s']:14,} rows/s")
+            
+            os.remove(path)
+    
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10], help="File sizes in MB (e.g. 10 1024)")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per reader; the best time is reported")
+    parser.add_argument('--chunksize', type=int, default=100_000, help="Rows per chunk in streaming mode")
+    parser.add_argument('--output', help="Write the results as JSON to this path")
+    args = parser.parse_args()
+    
+    results = run(args.sizes, args.repeat, args.chunksize)
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
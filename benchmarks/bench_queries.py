@@ -0,0 +1,189 @@
+"""
+Query benchmark for the common database access paths.
+
+Builds a synthetic SQLite database, then times each access path twice:
+without secondary indexes and with default connection settings (the old
+schema), and after upgrade_schema() has created the indexes, with the
+WAL/mmap connection pragmas applied.
+
+Usage:
+    python benchmarks/bench_queries.py
+    python benchmarks/bench_queries.py --datasets 20 --subjects 500 --output queries.json
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import SAMPLE_TIMES, generate_arrays
+
+# Access path name -> (SQL, parameter kind)
+ACCESS_PATHS = {
+    'subject_page': (
+        "SELECT id, subject_id FROM subject WHERE dataset_id = :id ORDER BY subject_id LIMIT 50",
+        'dataset'
+    ),
+    'load_dataset': (
+        "SELECT subject.subject_id, sample.time, sample.concentration FROM subject "
+        "LEFT OUTER JOIN sample ON sample.subject_id = subject.id "
+        "WHERE subject.dataset_id = :id ORDER BY subject.id, sample.id",
+        'dataset'
+    ),
+    'subject_samples': (
+        "SELECT time, concentration FROM sample WHERE subject_id = :id ORDER BY time",
+        'subject'
+    ),
+    'analysis_by_dataset_type': (
+        "SELECT id FROM analysis WHERE dataset_id = :id AND type = 'NCA' LIMIT 1",
+        'dataset'
+    ),
+    'reports_of_analysis': (
+        "SELECT id, name FROM report WHERE analysis_id = :id",
+        'analysis'
+    ),
+    'derived_datasets': (
+        "SELECT id FROM dataset WHERE parent_id = :id",
+        'dataset'
+    ),
+    'datasets_of_study': (
+        "SELECT id, name FROM dataset WHERE study_id = :id",
+        'study'
+    )
+}
+
+def populate(connection, n_studies, n_datasets, n_subjects, seed=0):
+    """Insert synthetic studies, datasets, subjects, samples, analyses and reports; return the ID ranges."""
+    cursor = connection.cursor()
+    
+    cursor.executemany("INSERT INTO study (id, name) VALUES (?, ?)",
+                       [(i, f'Study {i}') for i in range(1, n_studies + 1)])
+    cursor.executemany("INSERT INTO dataset (id, name, study_id) VALUES (?, ?, ?)",
+                       [(i, f'Dataset {i}', (i - 1) % n_studies + 1) for i in range(1, n_datasets + 1)])
+    
+    subject_pk = 0
+    for dataset_id in range(1, n_datasets + 1):
+        subjects = []
+        samples = []
+        times, concentrations = generate_arrays(n_subjects, seed=(seed, dataset_id))
+        times = times.tolist()
+        for i, row in enumerate(concentrations.tolist()):
+            subject_pk += 1
+            subjects.append((subject_pk, f'S{i:05d}', dataset_id))
+            samples.extend((t, c, subject_pk) for t, c in zip(times, row))
+        cursor.executemany("INSERT INTO subject (id, subject_id, dataset_id) VALUES (?, ?, ?)", subjects)
+        cursor.executemany("INSERT INTO sample (time, concentration, subject_id) VALUES (?, ?, ?)", samples)
+    
+    analyses = []
+    reports = []
+    for dataset_id in range(1, n_datasets + 1):
+        for analysis_type in ('Statistics', 'Compartmental', 'NCA'):
+            analysis_id = len(analyses) + 1
+            analyses.append((analysis_id, f'Analysis {analysis_id}', analysis_type, '{}', '{}', dataset_id))
+            reports.append((f'Report {analysis_id}', analysis_id))
+    cursor.executemany(
+        "INSERT INTO analysis (id, name, type, parameters, results, dataset_id) VALUES (?, ?, ?, ?, ?, ?)", analyses
+    )
+    cursor.executemany("INSERT INTO report (name, analysis_id) VALUES (?, ?)", reports)
+    connection.commit()
+    
+    return {
+        'study': n_studies,
+        'dataset': n_datasets,
+        'subject': subject_pk,
+        'analysis': len(analyses)
+    }
+
+def time_access_paths(connection, id_ranges, repeat, seed=0):
+    """Return {access path: mean milliseconds per query} over repeat random IDs."""
+    rng = random.Random(seed)
+    timings = {}
+    for name, (sql, kind) in ACCESS_PATHS.items():
+        ids = [rng.randint(1, id_ranges[kind]) for _ in range(repeat)]
+        start = time.perf_counter()
+        for value in ids:
+            connection.execute(sql, {'id': value}).fetchall()
+        timings[name] = (time.perf_counter() - start) * 1000 / repeat
+    return timings
+
+def query_plans(connection):
+    return {
+        name: [row[-1] for row in connection.execute(f"EXPLAIN QUERY PLAN {sql}", {'id': 1})]
+        for name, (sql, _) in ACCESS_PATHS.items()
+    }
+
+def run(n_studies, n_datasets, n_subjects, repeat):
+    tmpdir = tempfile.mkdtemp()
+    path = os.path.join(tmpdir, 'bench.db')
+    
+    # The schema (with indexes) is created in the database named here
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    from app import create_app, db, init_db
+    from migrations import upgrade_schema
+    
+    app = create_app()
+    init_db(app)
+    with app.app_context():
+        index_names = [index.name for table in db.metadata.sorted_tables for index in table.indexes]
+        db.engine.dispose()
+        
+        # Old schema: no secondary indexes, default journal and no memory-mapped I/O
+        connection = sqlite3.connect(path)
+        connection.execute("PRAGMA journal_mode=DELETE")
+        for name in index_names:
+            connection.execute(f'DROP INDEX IF EXISTS "{name}"')
+        id_ranges = populate(connection, n_studies, n_datasets, n_subjects)
+        connection.execute("ANALYZE")
+        before = time_access_paths(connection, id_ranges, repeat)
+        connection.close()
+        
+        # Upgraded schema through the app's engine (WAL and mmap pragmas on connect)
+        upgrade_schema(db.engine, db.metadata)
+        raw = db.engine.raw_connection()
+        raw.execute("ANALYZE")
+        after = time_access_paths(raw.driver_connection, id_ranges, repeat)
+        plans = query_plans(raw.driver_connection)
+        raw.close()
+        db.engine.dispose()
+    
+    results = []
+    print(f"\n{n_datasets} datasets x {n_subjects} subjects x {len(SAMPLE_TIMES)} samples, {repeat} queries per path")
+    print(f"{'access path':<26} {'before ms':>10} {'after ms':>10} {'speedup':>8}  plan")
+    for name in ACCESS_PATHS:
+        speedup = before[name] / after[name] if after[name] > 0 else float('inf')
+        results.append({
+            'access_path': name,
+            'before_ms': round(before[name], 4),
+            'after_ms': round(after[name], 4),
+            'speedup': round(speedup, 2),
+            'plan': plans[name]
+        })
+        print(f"{name:<26} {before[name]:10.3f} {after[name]:10.3f} {speedup:7.1f}x  {'; '.join(plans[name])}")
+    
+    shutil.rmtree(tmpdir)  # Including the WAL files
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--studies', type=int, default=5)
+    parser.add_argument('--datasets', type=int, default=20)
+    parser.add_argument('--subjects', type=int, default=200, help="Subjects per dataset")
+    parser.add_argument('--repeat', type=int, default=50, help="Queries per access path")
+    parser.add_argument('--output', help="Write the results as JSON to this path")
+    args = parser.parse_args()
+    
+    results = run(args.studies, args.datasets, args.subjects, args.repeat)
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+Dataset handoff benchmark for process-pool analyses.
+
+Runs the same per-range task (Cmax of every subject) in a process pool over
+synthetic populations (see synthetic.py), handing the data to the workers
+in four ways:
+- pickle_dict: each task pickles its subjects in the dict-of-lists format
+- pickle_arrays: each task pickles its subjects as a ProfileSet
+- shm: workers map a shared memory block once; tasks carry only subject ranges
+- mmap: the same through a memory-mapped temp file
+
+The task is cheap on purpose, so the timings are dominated by the handoff.
+For each way the benchmark reports the best wall time, pool start-up
+included, and the bytes pickled to the workers.
+
+Usage:
+    python benchmarks/bench_sharedmem.py
+    python benchmarks/bench_sharedmem.py --subjects 100000 1000000 --workers 4
+    python benchmarks/bench_sharedmem.py --start-method spawn --output sharedmem.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import pickle
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from pk_tools.profiles import ProfileSet, as_profile_set
+from pk_tools.sharedmem import SharedProfileSet, map_subject_ranges, subject_ranges
+from synthetic import generate_arrays
+
+MODES = ('pickle_dict', 'pickle_arrays', 'shm', 'mmap')
+
+def range_cmax(subjects_data):
+    """The task: sum of the subjects' Cmax (a small result, so returning it costs nothing)."""
+    profiles = as_profile_set(subjects_data)
+    starts = profiles.offsets[:-1][profiles.lengths() > 0]
+    if starts.size == 0:
+        return 0.0
+    return float(np.maximum.reduceat(profiles.concentrations, starts).sum())
+
+def build_population(n_subjects, n_samples, seed=0):
+    times, concentrations = generate_arrays(n_subjects, n_samples, seed=seed)
+    return ProfileSet(
+        [f'S{i:07d}' for i in range(n_subjects)],
+        np.arange(n_subjects + 1, dtype=np.int64) * n_samples,
+        np.tile(times, n_subjects),
+        concentrations.ravel(),
+        presorted=True
+    )
+
+def make_tasks(mode, profiles, ranges):
+    """The arguments pickled to the workers for each range with a pickling mode."""
+    if mode == 'pickle_dict':
+        subjects_data = profiles.to_dict()
+        return [{s: subjects_data[s] for s in profiles.subject_ids[start:stop]} for start, stop in ranges]
+    return [profiles.subset(start, stop) for start, stop in ranges]
+
+def pickled_bytes(mode, profiles, ranges, workers):
+    """Bytes pickled to the workers by one run of a mode."""
+    if mode in ('shm', 'mmap'):
+        # Every worker receives the spec once; each task only its range
+        with SharedProfileSet(profiles, backend=mode) as shared:
+            spec_bytes = len(pickle.dumps(shared.spec))
+        return spec_bytes * workers + sum(len(pickle.dumps((start, stop))) for start, stop in ranges)
+    return sum(len(pickle.dumps(task)) for task in make_tasks(mode, profiles, ranges))
+
+def run_mode(mode, profiles, ranges, workers, mp_context):
+    """Run one handoff mode over all ranges; returns the summed task results."""
+    if mode in ('shm', 'mmap'):
+        return sum(map_subject_ranges(range_cmax, profiles, workers=workers, n_ranges=len(ranges),
+                                      backend=mode, mp_context=mp_context))
+    
+    tasks = make_tasks(mode, profiles, ranges)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as pool:
+        return sum(pool.map(range_cmax, tasks))
+
+def run(sizes, n_samples, workers, n_ranges, repeat, start_method=None):
+    mp_context = multiprocessing.get_context(start_method) if start_method else None
+    results = []
+    
+    for n_subjects in sizes:
+        profiles = build_population(n_subjects, n_samples)
+        ranges = subject_ranges(profiles, n_ranges or 4 * workers)
+        expected = range_cmax(profiles)
+        print(f"\n{n_subjects:,} subjects, {len(profiles.times):,} samples "
+              f"({profiles.nbytes / 2**20:.1f} MB), {workers} workers, {len(ranges)} ranges")
+        
+        for mode in MODES:
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                total = run_mode(mode, profiles, ranges, workers, mp_context)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            
+            if not np.isclose(total, expected):
+                raise RuntimeError(f"{mode} returned {total}, expected {expected}")
+            
+            sent = pickled_bytes(mode, profiles, ranges, workers)
+            result = {
+                'mode': mode,
+                'subjects': n_subjects,
+                'samples': len(profiles.times),
+                'workers': workers,
+                'ranges': len(ranges),
+                'seconds': round(best, 4),
+                'pickled_mb': round(sent / 2**20, 3)
+            }
+            results.append(result)
+            print(f"  {mode:<14} {best:8.3f} s {result['pickled_mb']:12.3f} MB pickled")
+    
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--subjects', type=int, nargs='+', default=[10_000, 100_000],
+                        help="Population sizes (e.g. 100000 1000000)")
+    parser.add_argument('--samples', type=int, default=13, help="Samples per subject")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument('--ranges', type=int, help="Subject ranges per run (default: four per worker)")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per mode; the best time is reported")
+    parser.add_argument('--start-method', choices=multiprocessing.get_all_start_methods(),
+                        help="Process start method of the pools (default: the platform default)")
+    parser.add_argument('--output', help="Write the results as JSON to this path")
+    args = parser.parse_args()
+    
+    results = run(args.subjects, args.samples, args.workers, args.ranges, args.repeat, args.start_method)
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
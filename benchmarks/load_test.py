@@ -0,0 +1,220 @@
+"""
+Local load test of the API endpoints.
+
+Seeds a temporary database with a synthetic study (one dataset and its NCA
+analysis), starts gunicorn with gunicorn.conf.py for each worker count, and
+drives the read-only API endpoints from several client processes for a fixed
+duration. Reports requests per second and latency percentiles, so scaling
+with worker processes can be compared. Pass --url to load an already running
+server instead (its database must already hold dataset and analysis 1).
+
+Usage:
+    python benchmarks/load_test.py                          # 1, 2 and 4 workers
+    python benchmarks/load_test.py --workers 1 8 --duration 20 --concurrency 32
+    python benchmarks/load_test.py --url http://127.0.0.1:5000 --output load.json
+"""
+import argparse
+import http.client
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import write_csv
+
+# Read-only endpoints exercised by the clients, weighted equally
+ENDPOINTS = [
+    '/api/dataset/1/preview',
+    '/api/dataset/1/subjects',
+    '/api/dataset/1/plot-data?max_points=200&per_page=50',
+    '/api/analysis/1/plot-data?max_points=200',
+    '/api/nca-parameters?analysis_id=1&parameter=cmax&parameter=auc_last',
+]
+
+def seed_database(database_url, workdir, n_subjects):
+    """Create study 1, dataset 1 and NCA analysis 1 through the app's own upload and analysis views."""
+    os.environ['DATABASE_URL'] = database_url
+    cwd = os.getcwd()
+    os.chdir(workdir)  # Uploads are stored relative to the working directory
+    try:
+        from app import create_app, init_db
+        
+        app = create_app({'PERF_INSTRUMENTATION': False})
+        init_db(app)
+        client = app.test_client()
+        client.post('/studies', data={'name': 'Load test', 'description': ''})
+        csv_path = os.path.join(workdir, 'synthetic.csv')
+        write_csv(csv_path, n_subjects)
+        with open(csv_path, 'rb') as f:
+            client.post('/study/1/upload', content_type='multipart/form-data', data={
+                'name': 'Synthetic', 'description': '', 'file': (f, 'synthetic.csv')
+            })
+        client.post('/nca', data={'dataset_id': '1', 'analysis_name': 'NCA', 'dose': '100'})
+        with app.app_context():
+            from app import db
+            db.engine.dispose()
+    finally:
+        os.chdir(cwd)
+
+def wait_until_ready(host, port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection(host, port, timeout=2)
+            connection.request('GET', ENDPOINTS[0])
+            status = connection.getresponse().status
+            connection.close()
+            if status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server on {host}:{port} did not become ready")
+
+def start_server(workers, threads, port, env, workdir):
+    env = dict(env, WEB_CONCURRENCY=str(workers), GUNICORN_THREADS=str(threads), PORT=str(port),
+               PYTHONPATH=ROOT)
+    return subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py'),
+         '--chdir', workdir, '--log-level', 'warning', 'wsgi:app'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True
+    )
+
+def stop_server(process):
+    os.killpg(process.pid, signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+
+def client_process(host, port, n_threads, duration, offset):
+    """Run n_threads keep-alive clients for duration seconds; return (latencies in ms, errors)."""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+    
+    def worker(index):
+        connection = http.client.HTTPConnection(host, port, timeout=30)
+        local = []
+        i = offset + index
+        while time.perf_counter() < stop_at:
+            path = ENDPOINTS[i % len(ENDPOINTS)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                connection.request('GET', path, headers={'Accept-Encoding': 'gzip'})
+                response = connection.getresponse()
+                response.read()
+                if response.status != 200:
+                    with lock:
+                        errors[0] += 1
+                    continue
+            except (OSError, http.client.HTTPException):
+                with lock:
+                    errors[0] += 1
+                connection.close()
+                connection = http.client.HTTPConnection(host, port, timeout=30)
+                continue
+            local.append((time.perf_counter() - start) * 1000)
+        connection.close()
+        with lock:
+            latencies.extend(local)
+    
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0]
+
+def run_load(host, port, concurrency, processes, duration):
+    """Drive the endpoints with concurrency connections spread over client processes."""
+    per_process = [concurrency // processes + (i < concurrency % processes) for i in range(processes)]
+    with ProcessPoolExecutor(processes) as pool:
+        futures = [pool.submit(client_process, host, port, n, duration, i * 7)
+                   for i, n in enumerate(per_process) if n]
+        results = [future.result() for future in futures]
+    
+    latencies = np.array([ms for result in results for ms in result[0]])
+    errors = sum(result[1] for result in results)
+    if latencies.size == 0:
+        return {'requests': 0, 'errors': errors, 'rps': 0.0}
+    
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        'requests': int(latencies.size),
+        'errors': errors,
+        'rps': round(latencies.size / duration, 1),
+        'p50_ms': round(float(p50), 2),
+        'p95_ms': round(float(p95), 2),
+        'p99_ms': round(float(p99), 2)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help="Worker counts to compare")
+    parser.add_argument('--threads', type=int, default=4, help="Threads per worker")
+    parser.add_argument('--concurrency', type=int, default=16, help="Concurrent client connections")
+    parser.add_argument('--clients', type=int, default=max(1, min(4, os.cpu_count() // 2)),
+                        help="Client processes the connections are spread over")
+    parser.add_argument('--duration', type=float, default=10, help="Seconds of load per run")
+    parser.add_argument('--subjects', type=int, default=500, help="Subjects in the seeded dataset")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--url', help="Load this running server instead of starting gunicorn")
+    parser.add_argument('--output', help="Write the results as JSON to this path")
+    args = parser.parse_args()
+    
+    results = []
+    print(f"{'workers':>7} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    
+    if args.url:
+        url = urllib.parse.urlsplit(args.url)
+        runs = [(None, url.hostname, url.port or 80)]
+    else:
+        runs = [(workers, '127.0.0.1', args.port) for workers in args.workers]
+        workdir = tempfile.mkdtemp()
+        database_url = f"sqlite:///{os.path.join(workdir, 'load.db')}"
+        seed_database(database_url, workdir, args.subjects)
+        env = dict(os.environ, DATABASE_URL=database_url)
+    
+    try:
+        for workers, host, port in runs:
+            server = None
+            if workers is not None:
+                server = start_server(workers, args.threads, port, env, workdir)
+            try:
+                wait_until_ready(host, port)
+                run_load(host, port, args.concurrency, args.clients, min(2.0, args.duration))  # Warm-up
+                result = run_load(host, port, args.concurrency, args.clients, args.duration)
+            finally:
+                if server is not None:
+                    stop_server(server)
+            
+            result['workers'] = workers
+            results.append(result)
+            print(f"{str(workers or '-'):>7} {result['rps']:9.1f} {result.get('p50_ms', 0):8.2f} "
+                  f"{result.get('p95_ms', 0):8.2f} {result.get('p99_ms', 0):8.2f} {result['errors']:7d}")
+    finally:
+        if not args.url:
+            shutil.rmtree(workdir)
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+"""
+End-to-end benchmark suite for the analysis functions and the upload path.
+
+Every case runs on seeded synthetic populations (see synthetic.py) at several
+scales. Each case/scale is timed (best of --repeat runs) and run once more
+under tracemalloc for its peak Python/NumPy allocation; the setup of the
+inputs is excluded from both. Results are printed and can be written as JSON.
+
+A stored baseline turns the run into a regression check: any case that is
+slower, or allocates more, than the baseline by more than --threshold makes
+the run exit with status 1.
+
+Usage:
+    python benchmarks/run_benchmarks.py                              # 100 to 100k subjects
+    python benchmarks/run_benchmarks.py --scales 100 1000 --cases nca statistics_ttest
+    python benchmarks/run_benchmarks.py --save-baseline benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --baseline benchmarks/baseline.json --threshold 0.2
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from pk_tools import __version__
+from synthetic import SAMPLE_TIMES, generate_study, write_csv
+
+DOSE = 100.0
+
+def setup_population(n_subjects):
+    return generate_study(n_subjects, seed=n_subjects)
+
+def setup_nca_pair(n_subjects):
+    """NCA results of a test and a reference population (the inputs of calculate_bioequivalence)."""
+    from pk_tools.nca import calculate_nca_parameters
+    
+    test = calculate_nca_parameters(generate_study(n_subjects, seed=1), dose=DOSE)
+    reference = calculate_nca_parameters(generate_study(n_subjects, seed=2), dose=DOSE)
+    return test, reference
+
+def setup_report(n_subjects):
+    """An NCA analysis record as generate_report receives it from the database."""
+    from pk_tools.nca import calculate_nca_parameters
+    
+    results = calculate_nca_parameters(setup_population(n_subjects), dose=DOSE)
+    return SimpleNamespace(name=f'Synthetic NCA ({n_subjects} subjects)', type='NCA',
+                           parameters=json.dumps({'dose': DOSE, 'method': 'linear-log'}),
+                           results=json.dumps(results, default=float))
+
+def setup_upload(n_subjects):
+    """A CSV file, and an app with a study in a temporary SQLite database to upload it to."""
+    from app import create_app
+    
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, 'upload.csv')
+    write_csv(path, n_subjects, seed=n_subjects)
+    
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, 'benchmark.db'),
+        'UPLOAD_FOLDER': os.path.join(workdir, 'uploads'),
+        'PROFILE_CACHE_FOLDER': os.path.join(workdir, 'uploads', 'profiles'),
+        'MAX_CONTENT_LENGTH': None,
+        'PERF_INSTRUMENTATION': False,
+        'AUTO_INIT_DB': True
+    })
+    client = app.test_client()
+    client.post('/studies', data={'name': 'Benchmark', 'description': ''})
+    return SimpleNamespace(app=app, client=client, path=path, workdir=workdir)
+
+def run_nca(subjects_data):
+    from pk_tools.nca import calculate_nca_parameters
+    return calculate_nca_parameters(subjects_data, dose=DOSE)
+
+def run_compartmental(subjects_data):
+    from pk_tools.compartmental import fit_compartmental_model
+    return fit_compartmental_model(subjects_data, model_type='one_compartment', dose=DOSE, absorption='first-order')
+
+def run_statistics(stat_type):
+    def run(subjects_data):
+        from pk_tools.statistics import perform_statistical_analysis
+        return perform_statistical_analysis(subjects_data, stat_type=stat_type)
+    return run
+
+def run_bioequivalence(pair):
+    from pk_tools.bioequivalence import calculate_bioequivalence
+    return calculate_bioequivalence(*pair)
+
+def run_report(analysis):
+    from pk_tools.reports import generate_report
+    return generate_report(analysis)
+
+def run_upload(inputs):
+    """
+    The upload view: parse and validate the file, bulk insert its subjects and
+    samples, and write the dataset's profile cache file. Every run adds a new
+    dataset to the same database.
+    """
+    from models import Dataset
+    
+    with inputs.app.app_context():
+        n_datasets = Dataset.query.count()
+    
+    with open(inputs.path, 'rb') as f:
+        inputs.client.post('/study/1/upload', content_type='multipart/form-data', data={
+            'name': 'Synthetic', 'description': '', 'file': (f, 'upload.csv')
+        })
+    
+    with inputs.app.app_context():
+        if Dataset.query.count() != n_datasets + 1:
+            raise RuntimeError("The upload did not create a dataset")
+
+def cleanup_upload(inputs):
+    from app import db
+    
+    with inputs.app.app_context():
+        db.engine.dispose()
+    shutil.rmtree(inputs.workdir)
+
+# Case name -> (setup(n_subjects), run(inputs), largest default scale, cleanup(inputs) or None)
+CASES = {
+    'upload': (setup_upload, run_upload, 100_000, cleanup_upload),
+    'nca': (setup_population, run_nca, 100_000, None),
+    'compartmental': (setup_population, run_compartmental, 10_000, None),
+    'statistics_ttest': (setup_population, run_statistics('ttest'), 100_000, None),
+    'statistics_regression': (setup_population, run_statistics('regression'), 100_000, None),
+    'bioequivalence': (setup_nca_pair, run_bioequivalence, 100_000, None),
+    'report': (setup_report, run_report, 1_000, None),
+}
+
+def time_case(run, inputs, repeat):
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        run(inputs)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def peak_memory(run, inputs):
+    """Peak traced allocation in MB while running the case once."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run(inputs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / (1024 * 1024)
+
+def run_suite(case_names, scales, repeat, max_subjects=None):
+    results = []
+    print(f"{'case':<24} {'subjects':>9} {'seconds':>10} {'subjects/s':>12} {'peak MB':>9}")
+    for name in case_names:
+        setup, run, largest, cleanup = CASES[name]
+        for n_subjects in scales:
+            if n_subjects > (max_subjects or largest):
+                continue
+            
+            inputs = setup(n_subjects)
+            run(inputs)  # Warm-up, including the first-use imports
+            seconds = time_case(run, inputs, repeat if n_subjects <= 10_000 else 1)
+            peak_mb = peak_memory(run, inputs)
+            if cleanup is not None:
+                cleanup(inputs)
+            del inputs
+            
+            result = {
+                'case': name,
+                'subjects': n_subjects,
+                'samples_per_subject': len(SAMPLE_TIMES),
+                'seconds': round(seconds, 5),
+                'subjects_per_s': round(n_subjects / seconds, 1),
+                'peak_mb': round(peak_mb, 2)
+            }
+            results.append(result)
+            print(f"{name:<24} {n_subjects:9,} {seconds:10.4f} {result['subjects_per_s']:12,.0f} {peak_mb:9.1f}")
+    return results
+
+def environment():
+    return {
+        'pk_tools_version': __version__,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor() or platform.machine(),
+        'cpus': os.cpu_count(),
+        'date': datetime.now(timezone.utc).isoformat(timespec='seconds')
+    }
+
+def compare_to_baseline(results, baseline, threshold):
+    """
+    Compare results with a baseline run.
+    
+    Parameters:
+    - results: List of results of this run
+    - baseline: Output of an earlier run (as written by --output or --save-baseline)
+    - threshold: Allowed relative increase, e.g. 0.25 for 25%
+    
+    Returns:
+    - List of regressions, as strings
+    """
+    previous = {(r['case'], r['subjects']): r for r in baseline['results']}
+    regressions = []
+    
+    print(f"\nAgainst baseline from {baseline['environment'].get('date', '?')} "
+          f"(pk_tools {baseline['environment'].get('pk_tools_version', '?')}), threshold {threshold:.0%}")
+    for result in results:
+        old = previous.get((result['case'], result['subjects']))
+        if old is None:
+            continue
+        
+        for metric in ('seconds', 'peak_mb'):
+            if old[metric] <= 0:
+                continue
+            change = result[metric] / old[metric] - 1
+            flag = 'REGRESSION' if change > threshold else ''
+            print(f"  {result['case']:<24} {result['subjects']:9,} {metric:<8} "
+                  f"{old[metric]:10.4f} -> {result[metric]:10.4f} {change:+7.1%} {flag}")
+            if flag:
+                regressions.append(f"{result['case']} at {result['subjects']} subjects: {metric} {change:+.1%}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), default=list(CASES))
+    parser.add_argument('--scales', type=int, nargs='+', default=[100, 1_000, 10_000, 100_000],
+                        help="Numbers of subjects")
+    parser.add_argument('--max-subjects', type=int,
+                        help="Largest scale run for every case (default: a per-case limit, e.g. 10k for fits)")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per case up to 10k subjects; the best is kept")
+    parser.add_argument('--output', help="Write the results as JSON to this path")
+    parser.add_argument('--save-baseline', help="Write the results as the baseline for later runs")
+    parser.add_argument('--baseline', help="Compare against this baseline and fail on regressions")
+    parser.add_argument('--threshold', type=float, default=0.25, help="Allowed relative slowdown or memory growth")
+    args = parser.parse_args()
+    
+    results = run_suite(args.cases, sorted(args.scales), args.repeat, args.max_subjects)
+    output = {'environment': environment(), 'results': results}
+    
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(output, f, indent=2)
+    
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s):")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+Seeded generator of synthetic concentration-time studies for the benchmarks.
+
+Profiles are evaluated with the model functions of pk_tools.compartmental,
+with log-normal between-subject variability on every model parameter and a
+combined proportional and additive residual error. Values below the limit of
+quantification are set to zero, as an assay would report them.
+    
+    from synthetic import generate_study
+    subjects_data = generate_study(1000, seed=1)
+"""
+import os
+
+import numpy as np
+
+from pk_tools.compartmental import (one_compartment_first_order, one_compartment_iv_bolus,
+                                    two_compartment_first_order)
+
+# Typical oral sampling schedule in hours
+SAMPLE_TIMES = [0.25, 0.5, 1, 1.5, 2, 3, 4, 6, 8, 12, 24, 36, 48]
+
+# Model name -> (model function, typical parameter values, between-subject CV of each parameter)
+MODELS = {
+    'one_compartment_first_order': (
+        lambda t, ka, V, k, dose: one_compartment_first_order(t, ka, V, k, D=dose),
+        {'ka': 1.5, 'V': 50.0, 'k': 0.1},
+        {'ka': 0.4, 'V': 0.25, 'k': 0.3}
+    ),
+    'one_compartment_iv_bolus': (
+        lambda t, V, k, dose: dose * one_compartment_iv_bolus(t, V, k),
+        {'V': 50.0, 'k': 0.1},
+        {'V': 0.25, 'k': 0.3}
+    ),
+    'two_compartment_first_order': (
+        lambda t, ka, A, alpha, B, beta, dose: two_compartment_first_order(t, ka, A, alpha, B, beta) * dose / 100,
+        {'ka': 1.5, 'A': 1.5, 'alpha': 0.8, 'B': 0.5, 'beta': 0.05},
+        {'ka': 0.4, 'A': 0.3, 'alpha': 0.2, 'B': 0.3, 'beta': 0.3}
+    )
+}
+
+def sample_times(n_samples, t_max=48.0):
+    """The standard schedule when n_samples matches it, otherwise n_samples log-spaced times up to t_max."""
+    if n_samples == len(SAMPLE_TIMES):
+        return np.array(SAMPLE_TIMES, dtype=np.float64)
+    return np.geomspace(0.25, t_max, n_samples)
+
+def generate_arrays(n_subjects, n_samples=len(SAMPLE_TIMES), model='one_compartment_first_order', dose=100.0,
+                    proportional_error=0.1, additive_error=0.01, lloq=0.05, seed=0):
+    """
+    Generate a synthetic population as dense arrays.
+    
+    Parameters:
+    - n_subjects: Number of subjects
+    - n_samples: Samples per subject
+    - model: Key of MODELS
+    - dose: Dose given to every subject
+    - proportional_error: Standard deviation of the proportional residual error
+    - additive_error: Standard deviation of the additive residual error, in concentration units
+    - lloq: Lower limit of quantification; lower values are reported as 0
+    - seed: Random seed; the same seed always gives the same population
+    
+    Returns:
+    - tuple: (times of shape (n_samples,), concentrations of shape (n_subjects, n_samples))
+    """
+    func, typical, cv = MODELS[model]
+    rng = np.random.default_rng(seed)
+    times = sample_times(n_samples)
+    
+    # Log-normal between-subject variability, one column per subject
+    params = {
+        name: value * np.exp(rng.normal(0, np.sqrt(np.log(1 + cv[name] ** 2)), (n_subjects, 1)))
+        for name, value in typical.items()
+    }
+    if 'ka' in params and 'k' in params:
+        # Keep ka and k apart so the first-order absorption model stays defined
+        params['ka'] = np.maximum(params['ka'], params['k'] * 1.1)
+    
+    with np.errstate(over='ignore', invalid='ignore'):
+        concentrations = func(times[None, :], dose=dose, **params)
+    concentrations = concentrations * (1 + proportional_error * rng.standard_normal(concentrations.shape))
+    concentrations += additive_error * rng.standard_normal(concentrations.shape)
+    concentrations = np.nan_to_num(concentrations, nan=0.0, posinf=0.0, neginf=0.0)
+    concentrations[concentrations < lloq] = 0.0
+    
+    return times, np.round(concentrations, 4)
+
+def generate_study(n_subjects, n_samples=len(SAMPLE_TIMES), seed=0, **kwargs):
+    """
+    Generate a synthetic population in the subjects_data format.
+    
+    Takes the same arguments as generate_arrays.
+    
+    Returns:
+    - Dictionary with subject IDs as keys and dicts with 'times' and 'concentrations' as values
+    """
+    times, concentrations = generate_arrays(n_subjects, n_samples, seed=seed, **kwargs)
+    times = times.tolist()
+    return {
+        f'S{i:06d}': {'times': times, 'concentrations': row}
+        for i, row in enumerate(concentrations.tolist())
+    }
+
+def write_csv(path, n_subjects, n_samples=len(SAMPLE_TIMES), seed=0, block_subjects=10_000, **kwargs):
+    """
+    Write a synthetic population as an upload CSV, in blocks to bound memory.
+    
+    Returns:
+    - Number of data rows written
+    """
+    n_rows = 0
+    with open(path, 'w') as f:
+        f.write('subject_id,time,concentration\n')
+        for first in range(0, n_subjects, block_subjects):
+            n_block = min(block_subjects, n_subjects - first)
+            times, concentrations = generate_arrays(n_block, n_samples, seed=(seed, first), **kwargs)
+            
+            subject_ids = np.repeat([f'S{i:07d}' for i in range(first, first + n_block)], len(times))
+            rows = zip(subject_ids.tolist(), np.tile(times, n_block).tolist(), concentrations.ravel().tolist())
+            f.writelines(f'{s},{t},{c}\n' for s, t, c in rows)
+            n_rows += n_block * len(times)
+    return n_rows
+
+def write_csv_of_size(path, size_mb, seed=0, **kwargs):
+    """
+    Write a synthetic CSV of roughly size_mb megabytes.
+    
+    Returns:
+    - Number of data rows written
+    """
+    # Measure the bytes per subject on a small sample, then write the whole file in one pass
+    sample_path = path + '.sample'
+    write_csv(sample_path, 100, seed=seed, **kwargs)
+    with open(sample_path) as f:
+        bytes_per_subject = (len(f.read()) - len('subject_id,time,concentration\n')) / 100
+    os.remove(sample_path)
+    
+    n_subjects = max(1, int(size_mb * 1024 * 1024 / bytes_per_subject))
+    return write_csv(path, n_subjects, seed=seed, **kwargs)
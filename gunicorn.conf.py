@@ -0,0 +1,44 @@
+"""
+gunicorn settings for serving the app with several worker processes.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Every setting can be overridden through the environment:
+- PORT: Port to listen on (default 5000)
+- WEB_CONCURRENCY: Worker processes (default: one per CPU core, since analyses are CPU-bound)
+- GUNICORN_THREADS: Threads per worker (default 4); requests waiting on the database overlap
+- GUNICORN_TIMEOUT: Seconds before a silent worker is restarted (default 120, fits take a while)
+- DB_MAX_CONNECTIONS: Connections the database server allows this app (default 100); each
+  worker's pool is sized so that all workers together stay below it
+
+The result, derived dataset and response caches are per worker: each worker
+computes and stores its own entries, so their memory limits (RESULT_CACHE_MAX_BYTES,
+DERIVED_DATASET_CACHE_BYTES, RESPONSE_CACHE_MAX_BYTES) apply per worker. The
+datasets' profile cache files are mapped from disk and shared by all workers.
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+worker_class = "gthread" if threads > 1 else "sync"
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+keepalive = 5
+
+# Import the app and the numerical libraries once in the master; workers share them copy-on-write
+preload_app = True
+
+# Per-worker pool: one connection per thread, with overflow up to this worker's share of the server limit
+max_connections = int(os.environ.get("DB_MAX_CONNECTIONS", 100))
+os.environ.setdefault("DB_POOL_SIZE", str(threads))
+os.environ.setdefault("DB_MAX_OVERFLOW", str(max(0, max_connections // workers - threads)))
+
+def post_fork(server, worker):
+    """Give each worker its own connections instead of the ones inherited from the master."""
+    from app import db
+    from wsgi import app
+    
+    with app.app_context():
+        # close=False leaves the master's connections open for the master
+        db.engine.dispose(close=False)
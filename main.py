@@ -1,4 +1,7 @@
-from app import app
+from app import create_app
+
+# Creates or upgrades the schema unless AUTO_INIT_DB=0
+app = create_app()
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
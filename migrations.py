@@ -0,0 +1,62 @@
+import logging
+
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
+
+logger = logging.getLogger(__name__)
+
+def _add_missing_columns(connection, table, existing_columns):
+    """Add nullable columns that the model defines but the database table lacks."""
+    added = []
+    for column in table.columns:
+        if column.name in existing_columns:
+            continue
+        if not column.nullable:
+            logger.warning("Cannot add non-nullable column %s.%s to an existing table", table.name, column.name)
+            continue
+        
+        column_type = column.type.compile(dialect=connection.dialect)
+        connection.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+        added.append(column.name)
+    return added
+
+def upgrade_schema(engine, metadata):
+    """
+    Bring an existing database up to date with the models.
+    
+    db.create_all() creates missing tables but leaves existing ones alone, so
+    columns and indexes added to the models later are created here. Every
+    step checks what already exists, so running this on an up-to-date
+    database is a no-op.
+    
+    Parameters:
+    - engine: SQLAlchemy engine
+    - metadata: MetaData of the models
+    
+    Returns:
+    - List of applied changes, as strings
+    """
+    applied = []
+    
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        existing_tables = set(inspector.get_table_names())
+        
+        for table in metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column_name in _add_missing_columns(connection, table, existing_columns):
+                applied.append(f"add column {table.name}.{column_name}")
+            
+            existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    connection.execute(CreateIndex(index))
+                    applied.append(f"create index {index.name}")
+    
+    for change in applied:
+        logger.info("Schema upgrade: %s", change)
+    
+    return applied
@@ -18,13 +18,22 @@ class Dataset(db.Model):
     file_path = db.Column(db.String(255))
     file_type = db.Column(db.String(20))  # CSV, Excel, etc.
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    study_id = db.Column(db.Integer, db.ForeignKey('study.id'), nullable=False)
+    study_id = db.Column(db.Integer, db.ForeignKey('study.id'), nullable=False, index=True)
+    # Derived datasets store no samples: they are the parent's data with transform_pipeline applied
+    parent_id = db.Column(db.Integer, db.ForeignKey('dataset.id'), index=True)
+    transform_pipeline = db.Column(db.JSON)  # List of transformation names, applied in order
     subjects = db.relationship('Subject', backref='dataset', lazy=True, cascade="all, delete-orphan")
+    parent = db.relationship('Dataset', remote_side=[id], backref='derived_datasets')
     
     def __repr__(self):
         return f"<Dataset {self.name}>"
 
 class Subject(db.Model):
+    __table_args__ = (
+        # Subject browsing: one dataset, ordered by subject ID
+        db.Index('ix_subject_dataset_subject', 'dataset_id', 'subject_id'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     subject_id = db.Column(db.String(50), nullable=False)
     dataset_id = db.Column(db.Integer, db.ForeignKey('dataset.id'), nullable=False)
@@ -34,6 +43,11 @@ class Subject(db.Model):
         return f"<Subject {self.subject_id}>"
 
 class Sample(db.Model):
+    __table_args__ = (
+        # Per-subject samples in time order (previews, paging)
+        db.Index('ix_sample_subject_time', 'subject_id', 'time'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     time = db.Column(db.Float, nullable=False)
     concentration = db.Column(db.Float)
@@ -43,11 +57,18 @@ class Sample(db.Model):
         return f"<Sample {self.id} at {self.time}h: {self.concentration}>"
 
 class Analysis(db.Model):
+    __table_args__ = (
+        # Analyses of a dataset by type (bioequivalence inputs, listings)
+        db.Index('ix_analysis_dataset_type', 'dataset_id', 'type'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     type = db.Column(db.String(50), nullable=False)  # NCA, Compartmental, Bioequivalence
     parameters = db.Column(db.JSON)
     results = db.Column(db.JSON)
+    metrics = db.Column(db.JSON)  # Stage timings and counters of the run (see pk_tools.metrics)
+    profile_path = db.Column(db.String(255))  # Profile captured on request (see pk_tools.profiling)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     dataset_id = db.Column(db.Integer, db.ForeignKey('dataset.id'), nullable=False)
     dataset = db.relationship('Dataset')
@@ -59,9 +80,27 @@ class Report(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     file_path = db.Column(db.String(255))
+    profile_path = db.Column(db.String(255))  # Profile captured on request (see pk_tools.profiling)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    analysis_id = db.Column(db.Integer, db.ForeignKey('analysis.id'), nullable=False)
+    analysis_id = db.Column(db.Integer, db.ForeignKey('analysis.id'), nullable=False, index=True)
     analysis = db.relationship('Analysis')
     
     def __repr__(self):
         return f"<Report {self.name}>"
+
+class NCAParameter(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('analysis_id', 'subject_id', 'parameter', name='uq_nca_parameter'),
+        # Covers the BE/report access path: one analysis, a few parameters, all subjects
+        db.Index('ix_nca_parameter_lookup', 'analysis_id', 'parameter', 'subject_id', 'value'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    analysis_id = db.Column(db.Integer, db.ForeignKey('analysis.id'), nullable=False)
+    subject_id = db.Column(db.String(50), nullable=False)
+    parameter = db.Column(db.String(50), nullable=False)
+    value = db.Column(db.Float)
+    analysis = db.relationship('Analysis', backref=db.backref('nca_parameters', lazy=True, cascade="all, delete-orphan"))
+    
+    def __repr__(self):
+        return f"<NCAParameter {self.subject_id} {self.parameter}={self.value}>"
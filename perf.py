@@ -0,0 +1,191 @@
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter, deque
+
+from flask import current_app, g, has_request_context, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('perf')
+
+# Literals are collapsed so executions of the same statement with different parameters group together
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_WHITESPACE = re.compile(r'\s+')
+
+def normalize_statement(statement):
+    """Reduce an SQL statement to its shape, for grouping repeated executions."""
+    return _WHITESPACE.sub(' ', _LITERALS.sub('?', statement)).strip()
+
+class PerfMonitor:
+    """
+    Per-request SQL instrumentation.
+    
+    Counts and times every statement executed while handling a request, logs
+    slow statements, and flags likely N+1 patterns: the same statement shape
+    executed many times in one request, which is what lazy-loading a
+    relationship inside a loop produces. Each request is logged as one JSON
+    line and kept, with per-endpoint aggregates, for the /debug/perf endpoint.
+    """
+    
+    def __init__(self, slow_query_ms=100, n_plus_one_threshold=5, history=200):
+        self.slow_query_ms = slow_query_ms
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.recent_requests = deque(maxlen=history)
+        self.slow_queries = deque(maxlen=history)
+        self.n_plus_one = deque(maxlen=history)
+        self.endpoints = {}
+        self._lock = threading.Lock()
+    
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and 'perf' in g:
+            conn.info.setdefault('perf_start', []).append(time.perf_counter())
+    
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if not (has_request_context() and 'perf' in g) or not conn.info.get('perf_start'):
+            return
+        
+        duration_ms = (time.perf_counter() - conn.info['perf_start'].pop()) * 1000
+        stats = g.perf
+        stats['queries'] += 1
+        stats['sql_ms'] += duration_ms
+        stats['statements'][normalize_statement(statement)] += 1
+        
+        if duration_ms >= self.slow_query_ms:
+            entry = {
+                'event': 'slow_query',
+                'endpoint': request.endpoint,
+                'path': request.path,
+                'duration_ms': round(duration_ms, 3),
+                'statement': _WHITESPACE.sub(' ', statement).strip()
+            }
+            self.slow_queries.append(entry)
+            logger.warning(json.dumps(entry))
+    
+    def start_request(self):
+        g.perf = {'start': time.perf_counter(), 'queries': 0, 'sql_ms': 0.0, 'statements': Counter()}
+    
+    def finish_request(self, response):
+        stats = g.pop('perf', None)
+        if stats is None:
+            return response
+        
+        total_ms = (time.perf_counter() - stats['start']) * 1000
+        repeated = [
+            {'statement': statement, 'count': count}
+            for statement, count in stats['statements'].most_common()
+            if count >= self.n_plus_one_threshold
+        ]
+        
+        entry = {
+            'event': 'request',
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'duration_ms': round(total_ms, 3),
+            'queries': stats['queries'],
+            'sql_ms': round(stats['sql_ms'], 3)
+        }
+        
+        if repeated:
+            warning = dict(entry, event='n_plus_one', repeated=repeated)
+            self.n_plus_one.append(warning)
+            logger.warning(json.dumps(warning))
+        
+        with self._lock:
+            self.recent_requests.append(entry)
+            aggregate = self.endpoints.setdefault(request.endpoint or request.path, {
+                'requests': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'queries': 0, 'sql_ms': 0.0
+            })
+            aggregate['requests'] += 1
+            aggregate['total_ms'] += total_ms
+            aggregate['max_ms'] = max(aggregate['max_ms'], total_ms)
+            aggregate['queries'] += stats['queries']
+            aggregate['sql_ms'] += stats['sql_ms']
+        
+        logger.info(json.dumps(entry))
+        response.headers['Server-Timing'] = (
+            f'db;dur={stats["sql_ms"]:.1f};desc="{stats["queries"]} queries", total;dur={total_ms:.1f}'
+        )
+        return response
+    
+    def report(self, limit=50):
+        """Summary for the /debug/perf endpoint."""
+        with self._lock:
+            endpoints = {
+                endpoint: {
+                    'requests': a['requests'],
+                    'mean_ms': round(a['total_ms'] / a['requests'], 3),
+                    'max_ms': round(a['max_ms'], 3),
+                    'mean_queries': round(a['queries'] / a['requests'], 2),
+                    'mean_sql_ms': round(a['sql_ms'] / a['requests'], 3)
+                }
+                for endpoint, a in self.endpoints.items()
+            }
+            recent = list(self.recent_requests)[-limit:]
+        
+        return {
+            'settings': {
+                'slow_query_ms': self.slow_query_ms,
+                'n_plus_one_threshold': self.n_plus_one_threshold
+            },
+            'endpoints': endpoints,
+            'recent_requests': recent,
+            'slow_queries': list(self.slow_queries)[-limit:],
+            'n_plus_one': list(self.n_plus_one)[-limit:]
+        }
+
+def _monitor():
+    """The monitor of the app handling the current request, if it is instrumented."""
+    if has_request_context() and 'perf' in g:
+        return current_app.extensions.get('perf')
+    return None
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    monitor = _monitor()
+    if monitor is not None:
+        monitor.before_cursor_execute(conn, cursor, statement, parameters, context, executemany)
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    monitor = _monitor()
+    if monitor is not None:
+        monitor.after_cursor_execute(conn, cursor, statement, parameters, context, executemany)
+
+def init_perf(app):
+    """
+    Instrument an app's requests and register the /debug/perf endpoint.
+    
+    Controlled by the PERF_* settings: PERF_INSTRUMENTATION turns the
+    instrumentation on, PERF_SLOW_QUERY_MS and PERF_N_PLUS_ONE_THRESHOLD
+    set the logging thresholds, and the endpoint is only served when
+    PERF_DEBUG_ENDPOINT is set or the app runs in debug mode.
+    """
+    if not app.config['PERF_INSTRUMENTATION']:
+        return None
+    
+    monitor = PerfMonitor(
+        slow_query_ms=app.config['PERF_SLOW_QUERY_MS'],
+        n_plus_one_threshold=app.config['PERF_N_PLUS_ONE_THRESHOLD']
+    )
+    
+    # Installed once for all engines; each event is routed to the current app's monitor
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    app.before_request(monitor.start_request)
+    app.after_request(monitor.finish_request)
+    
+    def debug_perf():
+        if not (app.debug or app.config['PERF_DEBUG_ENDPOINT']):
+            return jsonify({'success': False, 'error': 'Not found'}), 404
+        return jsonify({
+            'success': True,
+            'data': monitor.report(limit=request.args.get('limit', 50, type=int))
+        })
+    
+    app.add_url_rule('/debug/perf', 'debug_perf', debug_perf)
+    app.extensions['perf'] = monitor
+    return monitor
@@ -1 +1,4 @@
 # Initialize the package
+
+# Bump whenever a change alters analysis output; it is part of the result cache key
+__version__ = '1.0.0'
@@ -0,0 +1,313 @@
+import numpy as np
+
+class RunningStats:
+    """
+    Single-pass mean/variance/min/max using Welford's algorithm.
+    
+    Partial results from separate chunks or worker processes can be combined
+    with merge(). remove() undoes an earlier add() for mean and variance; the
+    minimum and maximum are left untouched and should be refreshed by the
+    caller if the removed value was an extreme.
+    """
+    
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+    
+    def add(self, value):
+        """Add a single value."""
+        value = float(value)
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+        
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+    
+    def add_many(self, values):
+        """Add an array of values in one vectorized step."""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if values.size == 0:
+            return
+        
+        batch = RunningStats()
+        batch.n = values.size
+        batch.mean = float(np.mean(values))
+        batch.m2 = float(np.sum((values - batch.mean) ** 2))
+        batch.min = float(np.min(values))
+        batch.max = float(np.max(values))
+        self.merge(batch)
+    
+    def remove(self, value):
+        """Remove a previously added value from the mean and variance."""
+        value = float(value)
+        if self.n <= 1:
+            self.n = 0
+            self.mean = 0.0
+            self.m2 = 0.0
+            return
+        
+        mean = (self.n * self.mean - value) / (self.n - 1)
+        self.m2 = max(self.m2 - (value - mean) * (value - self.mean), 0.0)
+        self.mean = mean
+        self.n -= 1
+    
+    def merge(self, other):
+        """Combine another RunningStats into this one (Chan et al. parallel update)."""
+        if other.n == 0:
+            return
+        if self.n == 0:
+            self.n, self.mean, self.m2 = other.n, other.mean, other.m2
+            self.min, self.max = other.min, other.max
+            return
+        
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self.m2 += other.m2 + delta * delta * self.n * other.n / n
+        self.n = n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+    
+    def variance(self, ddof=0):
+        """Variance with the given delta degrees of freedom (0 matches np.var)."""
+        if self.n <= ddof:
+            return None
+        return self.m2 / (self.n - ddof)
+    
+    def std(self, ddof=0):
+        """Standard deviation with the given delta degrees of freedom (0 matches np.std)."""
+        variance = self.variance(ddof)
+        return None if variance is None else float(np.sqrt(variance))
+
+class GeometricStats:
+    """
+    Geometric mean and geometric CV accumulated in log space.
+    
+    Non-positive values have no logarithm; they are counted in n_excluded
+    and otherwise ignored.
+    """
+    
+    def __init__(self):
+        self.log_stats = RunningStats()
+        self.n_excluded = 0
+    
+    def add(self, value):
+        if value > 0:
+            self.log_stats.add(np.log(value))
+        else:
+            self.n_excluded += 1
+    
+    def add_many(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        positive = values > 0
+        self.log_stats.add_many(np.log(values[positive]))
+        self.n_excluded += int(values.size - np.count_nonzero(positive))
+    
+    def remove(self, value):
+        if value > 0:
+            self.log_stats.remove(np.log(value))
+        else:
+            self.n_excluded -= 1
+    
+    def merge(self, other):
+        self.log_stats.merge(other.log_stats)
+        self.n_excluded += other.n_excluded
+    
+    @property
+    def n(self):
+        return self.log_stats.n
+    
+    def geomean(self):
+        return float(np.exp(self.log_stats.mean)) if self.n else None
+    
+    def geocv(self):
+        """Geometric CV% from the sample (ddof=1) log-space variance."""
+        variance = self.log_stats.variance(ddof=1)
+        return None if variance is None else float(100 * np.sqrt(np.exp(variance) - 1))
+
+class TDigest:
+    """
+    Mergeable streaming quantile sketch (merging t-digest with the k1 scale function).
+    
+    Values are buffered and periodically compressed into weighted centroids.
+    Small sets keep one centroid per value, so quantiles are exact there and
+    match np.percentile's linear interpolation; larger sets keep roughly
+    `compression` centroids with the best resolution in the tails.
+    """
+    
+    def __init__(self, compression=200):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self._buffer = []
+        self._buffer_size = 5 * compression
+        self.min = None
+        self.max = None
+    
+    @property
+    def n(self):
+        return float(np.sum(self.weights)) + len(self._buffer)
+    
+    def add(self, value):
+        value = float(value)
+        self._buffer.append(value)
+        
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        
+        if len(self._buffer) >= self._buffer_size:
+            self._compress()
+    
+    def add_many(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if values.size == 0:
+            return
+        
+        self.min = float(np.min(values)) if self.min is None else min(self.min, float(np.min(values)))
+        self.max = float(np.max(values)) if self.max is None else max(self.max, float(np.max(values)))
+        self._compress(values, np.ones_like(values))
+    
+    def merge(self, other):
+        """Combine another digest into this one."""
+        other._compress()
+        if other.means.size == 0:
+            return
+        
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self._compress(other.means, other.weights)
+    
+    def _scale(self, q):
+        return self.compression / (2 * np.pi) * np.arcsin(2 * q - 1)
+    
+    def _compress(self, extra_means=None, extra_weights=None):
+        means = [self.means, np.asarray(self._buffer, dtype=np.float64)]
+        weights = [self.weights, np.ones(len(self._buffer))]
+        if extra_means is not None:
+            means.append(extra_means)
+            weights.append(extra_weights)
+        
+        means = np.concatenate(means)
+        weights = np.concatenate(weights)
+        self._buffer = []
+        
+        if means.size == 0:
+            return
+        
+        order = np.argsort(means, kind='stable')
+        means = means[order]
+        weights = weights[order]
+        
+        # Group centroids whose left cumulative quantile falls in the same unit of k
+        cumulative = np.cumsum(weights)
+        q_left = (cumulative - weights) / cumulative[-1]
+        bins = np.floor(self._scale(q_left) - self._scale(0.0)).astype(np.int64)
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(bins)) + 1))
+        
+        self.weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / self.weights
+    
+    def quantile(self, q):
+        """Estimate the q-th quantile (0 <= q <= 1)."""
+        self._compress()
+        if self.means.size == 0:
+            return None
+        if self.means.size == 1:
+            return float(self.means[0])
+        
+        # Interpolate between centroid centres; for unit weights this is np.percentile's rule
+        centres = np.cumsum(self.weights) - self.weights / 2
+        target = q * (centres[-1] - centres[0]) + centres[0]
+        value = float(np.interp(target, centres, self.means))
+        return min(max(value, self.min), self.max)
+
+class ParameterSummary:
+    """
+    Summary statistics for one PK parameter accumulated in a single pass.
+    
+    Combines arithmetic (Welford), geometric (log-space) and quantile
+    (t-digest) accumulators. Summaries built on separate chunks or workers
+    can be combined with merge().
+    """
+    
+    # Percentiles reported by as_dict(), as (key suffix, quantile)
+    QUANTILES = [('p05', 0.05), ('median', 0.5), ('p95', 0.95)]
+    
+    def __init__(self, compression=200):
+        self.stats = RunningStats()
+        self.geometric = GeometricStats()
+        self.digest = TDigest(compression)
+    
+    @property
+    def n(self):
+        return self.stats.n
+    
+    def add(self, value):
+        self.stats.add(value)
+        self.geometric.add(value)
+        self.digest.add(value)
+    
+    def add_many(self, values):
+        self.stats.add_many(values)
+        self.geometric.add_many(values)
+        self.digest.add_many(values)
+    
+    def remove(self, value):
+        """
+        Remove a previously added value.
+        
+        Mean, SD and geometric statistics are updated in place; extremes and
+        quantiles cannot be un-added, so refresh() must be called with the
+        remaining values before the next as_dict().
+        """
+        self.stats.remove(value)
+        self.geometric.remove(value)
+    
+    def refresh(self, values):
+        """Rebuild the extremes and quantile sketch from the remaining values."""
+        values = np.asarray(list(values), dtype=np.float64)
+        self.stats.min = float(np.min(values)) if values.size else None
+        self.stats.max = float(np.max(values)) if values.size else None
+        self.digest = TDigest(self.digest.compression)
+        self.digest.add_many(values)
+    
+    def merge(self, other):
+        self.stats.merge(other.stats)
+        self.geometric.merge(other.geometric)
+        self.digest.merge(other.digest)
+    
+    def as_dict(self, prefix):
+        """
+        Return the summary as {f'{prefix}_{statistic}': value}.
+        
+        SD and CV use the population (ddof=0) variance, as np.std does.
+        """
+        if self.n == 0:
+            return {}
+        
+        mean = self.stats.mean
+        sd = self.stats.std()
+        
+        summary = {
+            f'{prefix}_mean': mean,
+            f'{prefix}_sd': sd,
+            f'{prefix}_cv': 100 * sd / mean if mean > 0 else None,
+            f'{prefix}_min': self.stats.min,
+            f'{prefix}_max': self.stats.max,
+            f'{prefix}_geomean': self.geometric.geomean(),
+            f'{prefix}_geocv': self.geometric.geocv()
+        }
+        
+        for suffix, q in self.QUANTILES:
+            summary[f'{prefix}_{suffix}'] = self.digest.quantile(q)
+        
+        return summary
@@ -0,0 +1,373 @@
+"""
+Headless batch runner for directories of study files.
+
+Parses and validates each file as an upload would, runs the requested
+analyses in a process pool, writes the results next to each other in an
+output directory and prints per-stage throughput. Nothing here touches the
+web app or its database.
+
+Usage:
+    python -m pk_tools.batch data/ -o results/
+    python -m pk_tools.batch data/*.csv -o results/ --analyses nca compartmental --formats parquet pdf
+    python -m pk_tools.batch data/ -o results/ --analyses nca bioequivalence --reference data/reference.csv
+    python -m pk_tools.batch data/slow.csv -o results/ --analyses compartmental --profile sampling
+
+Bioequivalence compares files paired by name (<name>_test.* with
+<name>_reference.* or <name>_ref.*), or every file with --reference.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from types import SimpleNamespace
+
+from pk_tools.fileio import FILE_TYPES, frame_to_subjects, ingest_dataset
+from pk_tools.profiling import PROFILE_MODES, profile
+from pk_tools.utils import format_validation_issue, to_json
+
+# Analyses run on each file, in order
+FILE_ANALYSES = ['nca', 'compartmental', 'statistics']
+
+# Analysis name -> type stored on analyses (and used by generate_report)
+ANALYSIS_TYPES = {
+    'nca': 'NCA',
+    'compartmental': 'Compartmental',
+    'statistics': 'Statistics',
+    'bioequivalence': 'Bioequivalence'
+}
+
+OUTPUT_FORMATS = ['parquet', 'csv', 'json', 'pdf']
+
+def find_files(paths):
+    """Expand files and directories into the sorted list of dataset files they contain."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            candidates = glob.glob(os.path.join(path, '*'))
+        else:
+            candidates = glob.glob(path) or [path]
+        files.extend(
+            candidate for candidate in candidates
+            if os.path.isfile(candidate) and os.path.splitext(candidate)[1].lstrip('.').lower() in FILE_TYPES
+        )
+    return sorted(set(files))
+
+def file_stem(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+def find_be_pairs(files, reference=None):
+    """
+    Pair test and reference files for bioequivalence.
+    
+    Parameters:
+    - files: Dataset file paths
+    - reference: Optional reference file compared with every other file
+    
+    Returns:
+    - List of (test path, reference path) tuples
+    """
+    if reference:
+        return [(path, reference) for path in files if os.path.abspath(path) != os.path.abspath(reference)]
+    
+    by_stem = {file_stem(path).lower(): path for path in files}
+    pairs = []
+    for stem, path in sorted(by_stem.items()):
+        if not stem.endswith('_test'):
+            continue
+        prefix = stem[:-len('_test')]
+        for suffix in ('_reference', '_ref'):
+            if prefix + suffix in by_stem:
+                pairs.append((path, by_stem[prefix + suffix]))
+                break
+    return pairs
+
+def analysis_parameters(name, options):
+    """Parameters recorded for an analysis, as the web views store them."""
+    if name == 'nca':
+        return {'method': 'linear-log', 'dose': options['dose']}
+    if name == 'compartmental':
+        return {'model_type': options['model_type'], 'absorption': options['absorption'], 'dose': options['dose']}
+    if name == 'statistics':
+        return {'stat_type': options['stat_type']}
+    return {'design': options['design'], 'alpha': 0.05}
+
+def run_analysis(name, subjects_data, options):
+    if name == 'nca':
+        from pk_tools.nca import calculate_nca_parameters
+        return calculate_nca_parameters(subjects_data, dose=options['dose'])
+    if name == 'compartmental':
+        from pk_tools.compartmental import fit_compartmental_model
+        return fit_compartmental_model(subjects_data, model_type=options['model_type'],
+                                       dose=options['dose'], absorption=options['absorption'])
+    if name == 'statistics':
+        from pk_tools.statistics import perform_statistical_analysis
+        return perform_statistical_analysis(subjects_data, stat_type=options['stat_type'])
+    raise ValueError(f"Unknown analysis: {name}")
+
+def _flat_row(key_name, key, values):
+    """One table row: scalar values, with nested dictionaries flattened one level."""
+    row = {key_name: key}
+    for name, value in values.items():
+        if isinstance(value, dict):
+            for sub_name, sub_value in value.items():
+                if sub_value is None or isinstance(sub_value, (int, float, str, bool)):
+                    row[f'{name}_{sub_name}'] = sub_value
+        elif value is None or isinstance(value, (int, float, str, bool)):
+            row[name] = value
+    return row
+
+def results_table(name, results):
+    """
+    Tabulate analysis results: one row per subject, per time point (t-test/ANOVA) or
+    per parameter (bioequivalence). Time series and other lists are left to the JSON output.
+    
+    Returns:
+    - List of row dictionaries
+    """
+    if name == 'statistics':
+        if 'time_results' in results:
+            return [_flat_row('time', float(t), values) for t, values in results['time_results'].items()]
+        return [_flat_row('subject_id', s, values) for s, values in results.get('regression_results', {}).items()]
+    
+    key_name = 'parameter' if name == 'bioequivalence' else 'subject_id'
+    return [
+        _flat_row(key_name, key, values)
+        for key, values in results.items()
+        if key != 'summary' and isinstance(values, dict)
+    ]
+
+def write_outputs(name, results, parameters, output_dir, stem, formats):
+    """Write one analysis's results in each requested format; return the paths written."""
+    import pandas as pd
+    
+    base = os.path.join(output_dir, f'{stem}_{name}')
+    written = []
+    
+    if 'parquet' in formats or 'csv' in formats:
+        table = pd.DataFrame(results_table(name, results))
+        if 'parquet' in formats:
+            table.to_parquet(base + '.parquet', index=False)
+            written.append(base + '.parquet')
+        if 'csv' in formats:
+            table.to_csv(base + '.csv', index=False)
+            written.append(base + '.csv')
+    
+    if 'json' in formats:
+        with open(base + '.json', 'w') as f:
+            f.write(to_json({'analysis': name, 'parameters': parameters, 'results': results}))
+        written.append(base + '.json')
+    
+    if 'pdf' in formats:
+        from pk_tools.reports import generate_report
+        
+        # generate_report reads these fields of an Analysis record
+        analysis = SimpleNamespace(name=f'{stem} {ANALYSIS_TYPES[name]}', type=ANALYSIS_TYPES[name],
+                                   parameters=json.dumps(parameters), results=to_json(results))
+        with open(base + '.pdf', 'wb') as f:
+            f.write(generate_report(analysis))
+        written.append(base + '.pdf')
+    
+    return written
+
+def process_file(path, analyses, options, output_dir, formats, keep_nca=False, profile_mode=None):
+    """
+    Parse, validate and analyse one file. Runs in a worker process.
+    
+    With profile_mode ('sampling' or 'cprofile') the whole job is profiled and
+    the profile is written with the results as <name>_profile.folded or .prof.
+    
+    Returns:
+    - Dictionary with the file, subject count, seconds per stage, any errors and,
+      when keep_nca is set, the NCA results for bioequivalence
+    """
+    with profile(profile_mode) as profiler:
+        outcome = _process_file(path, analyses, options, output_dir, formats, keep_nca)
+    
+    if profiler is not None:
+        profile_path = os.path.join(output_dir, f'{file_stem(path)}_profile{profiler.extension}')
+        profiler.save(profile_path)
+        outcome['outputs'].append(profile_path)
+    return outcome
+
+def _process_file(path, analyses, options, output_dir, formats, keep_nca):
+    stem = file_stem(path)
+    outcome = {'file': path, 'subjects': 0, 'stages': {}, 'errors': [], 'outputs': []}
+    
+    start = time.perf_counter()
+    try:
+        df, report = ingest_dataset(path)
+    except Exception as e:
+        outcome['errors'].append(f'parse: {e}')
+        return outcome
+    if not report['valid']:
+        outcome['errors'].append('invalid: ' + '; '.join(format_validation_issue(i) for i in report['errors']))
+        return outcome
+    subjects_data = frame_to_subjects(df)
+    outcome['subjects'] = len(subjects_data)
+    outcome['stages']['parse'] = time.perf_counter() - start
+    
+    for name in analyses:
+        start = time.perf_counter()
+        try:
+            results = run_analysis(name, subjects_data, options)
+        except Exception as e:
+            outcome['errors'].append(f'{name}: {e}')
+            continue
+        outcome['stages'][name] = time.perf_counter() - start
+        
+        if name == 'nca' and keep_nca:
+            outcome['nca'] = results
+        
+        start = time.perf_counter()
+        outcome['outputs'].extend(
+            write_outputs(name, results, analysis_parameters(name, options), output_dir, stem, formats)
+        )
+        outcome['stages']['write'] = outcome['stages'].get('write', 0.0) + time.perf_counter() - start
+    
+    return outcome
+
+def _stage_totals(outcomes):
+    stages = {}
+    for outcome in outcomes:
+        for stage, seconds in outcome['stages'].items():
+            entry = stages.setdefault(stage, {'files': 0, 'subjects': 0, 'seconds': 0.0})
+            entry['files'] += 1
+            entry['subjects'] += outcome['subjects']
+            entry['seconds'] += seconds
+    return stages
+
+def _print_stage(stage, entry):
+    rate = entry['subjects'] / entry['seconds'] if entry['seconds'] > 0 else float('inf')
+    print(f"{stage:<24} {entry['files']:6d} {entry['subjects']:10,} {entry['seconds']:10.2f} {rate:12,.0f}")
+
+def print_throughput(outcomes, wall_seconds):
+    """
+    Print files, subjects, summed worker seconds and subjects per second for each stage.
+    
+    Bioequivalence outcomes cover pairs of files that are already counted, so
+    they get a row of their own (its files column counts pairs) and are left
+    out of the file and subject totals.
+    """
+    file_outcomes = [outcome for outcome in outcomes if 'pair' not in outcome]
+    pair_outcomes = [outcome for outcome in outcomes if 'pair' in outcome]
+    stages = _stage_totals(file_outcomes)
+    
+    print(f"\n{'stage':<24} {'files':>6} {'subjects':>10} {'seconds':>10} {'subjects/s':>12}")
+    for stage, entry in stages.items():
+        _print_stage(stage, entry)
+    
+    pair_stages = _stage_totals(pair_outcomes)
+    for stage, entry in pair_stages.items():
+        _print_stage(f'{stage} (pairs)', entry)
+    stages.update(pair_stages)
+    
+    n_files = len(file_outcomes)
+    n_subjects = sum(outcome['subjects'] for outcome in file_outcomes)
+    print(f"\n{n_files} files, {n_subjects:,} subjects in {wall_seconds:.2f} s wall time "
+          f"({n_files / wall_seconds:.2f} files/s, {n_subjects / wall_seconds:,.0f} subjects/s)")
+    if pair_outcomes:
+        print(f"{len(pair_outcomes)} bioequivalence pair{'s' if len(pair_outcomes) != 1 else ''} of those files")
+    return stages
+
+def run_batch(paths, output_dir, analyses=FILE_ANALYSES, formats=('parquet',), workers=None, reference=None,
+              options=None, profile_mode=None):
+    """
+    Run analyses over many dataset files.
+    
+    Parameters:
+    - paths: Files, directories or glob patterns
+    - output_dir: Directory the results are written to
+    - analyses: Names from FILE_ANALYSES, plus 'bioequivalence'
+    - formats: Output formats from OUTPUT_FORMATS
+    - workers: Worker processes; defaults to the number of CPUs
+    - reference: Reference file for bioequivalence; files are paired by name if omitted
+    - options: Analysis settings (dose, model_type, absorption, stat_type, design)
+    - profile_mode: Profile each file's job with this profiler ('sampling' or 'cprofile')
+    
+    Returns:
+    - List of per-file outcomes (see process_file), with bioequivalence outcomes appended; these
+      have a 'pair' entry with the (test, reference) files
+    """
+    options = dict({'dose': 1.0, 'model_type': 'one_compartment', 'absorption': 'first-order',
+                    'stat_type': 'regression', 'design': 'crossover'}, **(options or {}))
+    files = find_files(paths)
+    if reference and reference not in files:
+        files.append(reference)
+    os.makedirs(output_dir, exist_ok=True)
+    
+    run_be = 'bioequivalence' in analyses
+    file_analyses = [name for name in FILE_ANALYSES if name in analyses]
+    if run_be and 'nca' not in file_analyses:
+        file_analyses.insert(0, 'nca')  # Bioequivalence compares NCA parameters
+    
+    start = time.perf_counter()
+    outcomes = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(process_file, path, file_analyses, options, output_dir, formats, run_be, profile_mode)
+                   for path in files]
+        for future in as_completed(futures):
+            outcome = future.result()
+            outcomes.append(outcome)
+            status = '; '.join(outcome['errors']) or f"{outcome['subjects']} subjects"
+            print(f"{outcome['file']}: {status}")
+    
+    if run_be:
+        from pk_tools.bioequivalence import calculate_bioequivalence
+        
+        nca_results = {outcome['file']: outcome.get('nca') for outcome in outcomes}
+        for test, ref in find_be_pairs(files, reference):
+            outcome = {'file': f'{test} vs {ref}', 'pair': (test, ref), 'subjects': 0, 'stages': {}, 'errors': [],
+                       'outputs': []}
+            if nca_results.get(test) is None or nca_results.get(ref) is None:
+                outcome['errors'].append('bioequivalence: NCA results missing')
+            else:
+                be_start = time.perf_counter()
+                results = calculate_bioequivalence(nca_results[test], nca_results[ref], design=options['design'])
+                outcome['subjects'] = len([s for s in nca_results[test] if s != 'summary'])
+                outcome['stages']['bioequivalence'] = time.perf_counter() - be_start
+                outcome['outputs'] = write_outputs('bioequivalence', results, analysis_parameters('bioequivalence', options),
+                                                   output_dir, f'{file_stem(test)}_vs_{file_stem(ref)}', formats)
+            outcomes.append(outcome)
+            print(f"{outcome['file']}: {'; '.join(outcome['errors']) or 'bioequivalence done'}")
+        
+        for outcome in outcomes:
+            outcome.pop('nca', None)
+    
+    print_throughput(outcomes, time.perf_counter() - start)
+    return outcomes
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('paths', nargs='+', help="Dataset files, directories or glob patterns")
+    parser.add_argument('-o', '--output-dir', required=True, help="Directory the results are written to")
+    parser.add_argument('--analyses', nargs='+', choices=FILE_ANALYSES + ['bioequivalence'], default=FILE_ANALYSES)
+    parser.add_argument('--formats', nargs='+', choices=OUTPUT_FORMATS, default=['parquet'])
+    parser.add_argument('--workers', type=int, help="Worker processes (default: number of CPUs)")
+    parser.add_argument('--dose', type=float, default=1.0)
+    parser.add_argument('--model-type', default='one_compartment', choices=['one_compartment', 'two_compartment'])
+    parser.add_argument('--absorption', default='first-order', choices=['first-order', 'zero-order', 'iv_bolus'])
+    parser.add_argument('--stat-type', default='regression', choices=['ttest', 'anova', 'regression'])
+    parser.add_argument('--design', default='crossover', choices=['crossover', 'parallel'])
+    parser.add_argument('--reference', help="Reference file every other file is compared with for bioequivalence")
+    parser.add_argument('--profile', choices=list(PROFILE_MODES),
+                        help="Profile each file's job; 'sampling' writes collapsed stacks for flame graphs")
+    args = parser.parse_args(argv)
+    
+    if 'parquet' in args.formats:
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            parser.error("Parquet output requires pyarrow; install it or choose --formats csv")
+    
+    outcomes = run_batch(args.paths, args.output_dir, analyses=args.analyses, formats=args.formats,
+                         workers=args.workers, reference=args.reference, profile_mode=args.profile,
+                         options={'dose': args.dose, 'model_type': args.model_type, 'absorption': args.absorption,
+                                  'stat_type': args.stat_type, 'design': args.design})
+    
+    return 1 if any(outcome['errors'] for outcome in outcomes) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,4 @@
 import numpy as np
-import scipy.stats as stats
-import pandas as pd
 
 def calculate_bioequivalence(test_results, ref_results, design='crossover', alpha=0.05):
     """
@@ -15,6 +13,9 @@ def calculate_bioequivalence(test_results, ref_results, design='crossover', alph
     Returns:
     - Dictionary with bioequivalence statistics
     """
+    import pandas as pd
+    import scipy.stats as stats
+    
     # Parameters to analyze for bioequivalence
     be_parameters = ['cmax', 'auc_last', 'auc_inf']
     
@@ -107,7 +108,7 @@ def calculate_bioequivalence(test_results, ref_results, design='crossover', alph
                 'is_bioequivalent': is_bioequivalent,
                 'intra_subject_cv': np.sqrt(np.exp(mse) - 1) * 100  # Intra-subject CV%
             }
-            
+        
         # For parallel design
         elif design == 'parallel':
             # Two-sample t-test approach for parallel design
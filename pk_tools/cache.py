@@ -0,0 +1,138 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from pk_tools import __version__
+from pk_tools.profiles import ProfileSet
+
+def hash_subjects_data(subjects_data):
+    """
+    Compute a content hash of concentration-time data.
+    
+    Parameters:
+    - subjects_data: ProfileSet, or dictionary with subject IDs as keys and dicts with
+      'times' and 'concentrations' as values
+    
+    Returns:
+    - Hex digest that changes whenever any subject ID, time or concentration changes
+    """
+    digest = hashlib.sha256()
+    
+    if isinstance(subjects_data, ProfileSet):
+        # Read subject by subject, so a mapped dataset is paged in one chunk at a time
+        items = ((profile.subject_id, profile) for profile in subjects_data.subjects())
+    else:
+        items = subjects_data.items()
+    
+    for subject_id, data in items:
+        times = np.asarray(data['times'], dtype=np.float64)
+        concentrations = np.asarray(data['concentrations'], dtype=np.float64)
+        
+        digest.update(str(subject_id).encode('utf-8'))
+        digest.update(len(times).to_bytes(8, 'little'))
+        digest.update(times.tobytes())
+        digest.update(concentrations.tobytes())
+    
+    return digest.hexdigest()
+
+def make_cache_key(subjects_data, analysis_type, parameters=None, version=__version__):
+    """
+    Build a content-addressed cache key for an analysis run.
+    
+    Parameters:
+    - subjects_data: ProfileSet, or dictionary with subject IDs as keys and dicts with
+      'times' and 'concentrations' as values
+    - analysis_type: Analysis type, e.g. 'NCA' or 'Compartmental'
+    - parameters: Dictionary of the arguments that influence the computation
+    - version: Code version; defaults to the pk_tools version
+    
+    Returns:
+    - Hex digest identifying the analysis result
+    """
+    digest = hashlib.sha256()
+    digest.update(hash_subjects_data(subjects_data).encode('ascii'))
+    digest.update(str(analysis_type).encode('utf-8'))
+    digest.update(json.dumps(parameters or {}, sort_keys=True, default=str).encode('utf-8'))
+    digest.update(str(version).encode('utf-8'))
+    
+    return digest.hexdigest()
+
+class ResultCache:
+    """
+    Thread-safe in-memory LRU cache for analysis results.
+    
+    Entries are evicted least-recently-used first once either the entry count
+    or the total size of the stored values exceeds its limit.
+    
+    The cache lives in one process: worker processes of a server do not share
+    it, and each builds its own entries.
+    """
+    
+    def __init__(self, max_entries=128, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, key, default=None):
+        """Return the cached value for key, or default if it is not cached."""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+    
+    def put(self, key, value, size=None):
+        """Store a value; size defaults to len(value) for str/bytes values and 0 otherwise."""
+        if size is None:
+            size = len(value) if isinstance(value, (str, bytes)) else 0
+        
+        with self._lock:
+            if key in self._entries:
+                self._total_bytes -= self._sizes.pop(key)
+                del self._entries[key]
+            
+            self._entries[key] = value
+            self._sizes[key] = size
+            self._total_bytes += size
+            
+            while self._entries and (
+                len(self._entries) > self.max_entries or
+                (self.max_bytes is not None and self._total_bytes > self.max_bytes and len(self._entries) > 1)
+            ):
+                evicted_key, _ = self._entries.popitem(last=False)
+                self._total_bytes -= self._sizes.pop(evicted_key)
+                self.evictions += 1
+    
+    def clear(self):
+        """Remove all entries; counters are kept."""
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._total_bytes = 0
+    
+    def stats(self):
+        """Return hit/miss/eviction counters and current occupancy."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else None
+            }
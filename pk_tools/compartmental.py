@@ -1,8 +1,8 @@
 import numpy as np
-from scipy.optimize import curve_fit
-import matplotlib.pyplot as plt
-from io import BytesIO
-import base64
+
+from pk_tools.accumulators import ParameterSummary
+from pk_tools.metrics import increment, stage
+from pk_tools.profiles import as_profile_set
 
 # Define compartmental models
 def one_compartment_iv_bolus(t, V, k):
@@ -48,7 +48,7 @@ def calculate_parameters(model_type, params):
         derived_params['k'] = k
         derived_params['CL'] = V * k
         derived_params['half_life'] = np.log(2) / k
-        
+    
     elif model_type == 'one_compartment_first_order':
         ka, V, k = params[:3]
         derived_params['ka'] = ka
@@ -58,7 +58,7 @@ def calculate_parameters(model_type, params):
         derived_params['absorption_half_life'] = np.log(2) / ka
         derived_params['elimination_half_life'] = np.log(2) / k
         derived_params['tmax'] = np.log(ka / k) / (ka - k) if ka != k else 1 / k
-        
+    
     elif model_type == 'one_compartment_zero_order':
         k0, V, k, tdur = params
         derived_params['k0'] = k0
@@ -68,7 +68,7 @@ def calculate_parameters(model_type, params):
         derived_params['CL'] = V * k
         derived_params['elimination_half_life'] = np.log(2) / k
         derived_params['tmax'] = tdur if k * tdur < np.log(2) else -np.log(k * tdur) / k
-        
+    
     elif model_type == 'two_compartment_iv_bolus':
         A, alpha, B, beta = params
         derived_params['A'] = A
@@ -83,7 +83,7 @@ def calculate_parameters(model_type, params):
         derived_params['CL'] = derived_params['V1'] * derived_params['k10']
         derived_params['alpha_half_life'] = np.log(2) / alpha
         derived_params['beta_half_life'] = np.log(2) / beta
-        
+    
     elif model_type == 'two_compartment_first_order':
         ka, A, alpha, B, beta = params
         derived_params['ka'] = ka
@@ -138,22 +138,13 @@ def calculate_goodness_of_fit(observed, predicted):
         'residuals': residuals.tolist()
     }
 
-def fit_compartmental_model(subjects_data, model_type='one_compartment_first_order', dose=1, absorption='first-order'):
+def select_model(model_type, absorption, dose=1):
     """
-    Fit compartmental models to concentration-time data.
-    
-    Parameters:
-    - subjects_data: Dictionary with subject IDs as keys and dicts with 'times' and 'concentrations' as values
-    - model_type: Type of compartmental model to fit
-    - dose: Dose administered
-    - absorption: Absorption type for oral models ('first-order', 'zero-order')
+    Select the model function and initial parameter guess for a model/absorption combination.
     
     Returns:
-    - Dictionary with fitted parameters and derived parameters for each subject
+    - tuple: (model_func, p0)
     """
-    results = {}
-    
-    # Select model function based on model_type
     if model_type == 'one_compartment':
         if absorption == 'iv_bolus':
             model_func = one_compartment_iv_bolus
@@ -180,121 +171,172 @@ def fit_compartmental_model(subjects_data, model_type='one_compartment_first_ord
     else:
         raise ValueError(f"Unknown model type: {model_type}")
     
-    for subject_id, data in subjects_data.items():
-        times = np.array(data['times'])
-        concentrations = np.array(data['concentrations'])
-        
-        # Sort data by time
+    return model_func, p0
+
+def fit_subject(subject_id, times, concentrations, model_type='one_compartment_first_order', dose=1, absorption='first-order',
+                presorted=False):
+    """
+    Fit a compartmental model to a single subject's concentration-time data.
+    
+    presorted skips sorting samples that are already in time order (e.g. a ProfileSet subject).
+    
+    Returns:
+    - Dictionary with fitted and derived parameters, a dict with an 'error' key if the
+      fit failed, or None if the subject has too few data points to fit
+    """
+    from scipy.optimize import curve_fit
+    
+    model_func, p0 = select_model(model_type, absorption, dose)
+    
+    times = np.asarray(times)
+    concentrations = np.asarray(concentrations)
+    
+    # Sort data by time
+    if not presorted:
         sorted_indices = np.argsort(times)
         times = times[sorted_indices]
         concentrations = concentrations[sorted_indices]
+    
+    # Filter out invalid data (negative or zero concentrations for log transformation)
+    valid_idx = concentrations > 0
+    if not np.all(valid_idx):
+        print(f"Warning: Removed {np.sum(~valid_idx)} non-positive concentration values for subject {subject_id}")
+        times = times[valid_idx]
+        concentrations = concentrations[valid_idx]
+    
+    if len(times) < len(p0):
+        print(f"Warning: Not enough data points for subject {subject_id} to fit model.")
+        increment('fits_skipped')
+        return None
+    
+    increment('fits')
+    try:
+        # Fit model
+        if model_type == 'one_compartment' and absorption == 'first-order':
+            # Fix dose and bioavailability
+            def model_fixed_dose(t, ka, V, k):
+                return one_compartment_first_order(t, ka, V, k, F=1, D=dose)
+            
+            popt, pcov, info, _, _ = curve_fit(model_fixed_dose, times, concentrations, p0=p0[:3], 
+                                   bounds=([0.01, 0.01, 0.001], [10, 100, 1]), full_output=True)
+            
+            # Add fixed parameters
+            popt = np.append(popt, [1, dose])
+            
+            # Generate prediction times (more points for smooth curve)
+            pred_times = np.linspace(0, max(times)*1.2, 100)
+            predictions = model_fixed_dose(pred_times, *popt[:3])
+            
+            # Calculate observed vs predicted for goodness-of-fit
+            obs_predictions = model_fixed_dose(times, *popt[:3])
         
-        # Filter out invalid data (negative or zero concentrations for log transformation)
-        valid_idx = concentrations > 0
-        if not np.all(valid_idx):
-            print(f"Warning: Removed {np.sum(~valid_idx)} non-positive concentration values for subject {subject_id}")
-            times = times[valid_idx]
-            concentrations = concentrations[valid_idx]
-        
-        if len(times) < len(p0):
-            print(f"Warning: Not enough data points for subject {subject_id} to fit model.")
-            continue
-        
-        try:
-            # Fit model
-            if model_type == 'one_compartment' and absorption == 'first-order':
-                # Fix dose and bioavailability
-                def model_fixed_dose(t, ka, V, k):
-                    return one_compartment_first_order(t, ka, V, k, F=1, D=dose)
-                
-                popt, pcov = curve_fit(model_fixed_dose, times, concentrations, p0=p0[:3], 
-                                       bounds=([0.01, 0.01, 0.001], [10, 100, 1]))
-                
-                # Add fixed parameters
-                popt = np.append(popt, [1, dose])
-                
-                # Generate prediction times (more points for smooth curve)
-                pred_times = np.linspace(0, max(times)*1.2, 100)
-                predictions = model_fixed_dose(pred_times, *popt[:3])
-                
-                # Calculate observed vs predicted for goodness-of-fit
-                obs_predictions = model_fixed_dose(times, *popt[:3])
-                
-            elif model_type == 'one_compartment' and absorption == 'zero-order':
-                # Need to estimate infusion duration
-                p0[3] = max(times) * 0.3  # Initial guess for tdur
-                
-                popt, pcov = curve_fit(one_compartment_zero_order, times, concentrations, p0=p0, 
-                                       bounds=([0.01, 0.01, 0.001, 0.1], [10, 100, 1, max(times)]))
-                
-                # Generate prediction times
-                pred_times = np.linspace(0, max(times)*1.2, 100)
-                predictions = one_compartment_zero_order(pred_times, *popt)
-                
-                # Calculate observed vs predicted
-                obs_predictions = one_compartment_zero_order(times, *popt)
-                
-            else:
-                popt, pcov = curve_fit(model_func, times, concentrations, p0=p0, 
-                                       bounds=([0.01] * len(p0), [10] * len(p0)))
-                
-                # Generate prediction times
-                pred_times = np.linspace(0, max(times)*1.2, 100)
-                predictions = model_func(pred_times, *popt)
-                
-                # Calculate observed vs predicted
-                obs_predictions = model_func(times, *popt)
+        elif model_type == 'one_compartment' and absorption == 'zero-order':
+            # Need to estimate infusion duration
+            p0[3] = max(times) * 0.3  # Initial guess for tdur
             
-            # Calculate parameter error (standard deviation)
-            perr = np.sqrt(np.diag(pcov))
+            popt, pcov, info, _, _ = curve_fit(one_compartment_zero_order, times, concentrations, p0=p0, 
+                                   bounds=([0.01, 0.01, 0.001, 0.1], [10, 100, 1, max(times)]), full_output=True)
             
-            # Calculate derived parameters
-            derived_params = calculate_parameters(f"{model_type}_{absorption}", popt)
+            # Generate prediction times
+            pred_times = np.linspace(0, max(times)*1.2, 100)
+            predictions = one_compartment_zero_order(pred_times, *popt)
             
-            # Calculate goodness-of-fit metrics
-            gof = calculate_goodness_of_fit(concentrations, obs_predictions)
+            # Calculate observed vs predicted
+            obs_predictions = one_compartment_zero_order(times, *popt)
+        
+        else:
+            popt, pcov, info, _, _ = curve_fit(model_func, times, concentrations, p0=p0, 
+                                   bounds=([0.01] * len(p0), [10] * len(p0)), full_output=True)
             
-            # Store results
-            results[subject_id] = {
-                'fitted_parameters': popt.tolist(),
-                'parameter_errors': perr.tolist(),
-                'derived_parameters': derived_params,
-                'goodness_of_fit': gof,
-                'observed_times': times.tolist(),
-                'observed_concentrations': concentrations.tolist(),
-                'predicted_times': pred_times.tolist(),
-                'predicted_concentrations': predictions.tolist()
-            }
+            # Generate prediction times
+            pred_times = np.linspace(0, max(times)*1.2, 100)
+            predictions = model_func(pred_times, *popt)
             
-        except Exception as e:
-            print(f"Error fitting model for subject {subject_id}: {e}")
-            results[subject_id] = {
-                'error': str(e)
-            }
-    
-    # Calculate mean and SD of parameters across subjects
-    if len(results) > 0:
-        # Get parameter names from the first successful fit
-        successful_subject = next((s for s in results if 'error' not in results[s]), None)
+            # Calculate observed vs predicted
+            obs_predictions = model_func(times, *popt)
+        
+        increment('fit_iterations', int(info['nfev']))
         
-        if successful_subject:
-            derived_param_keys = results[successful_subject]['derived_parameters'].keys()
+        # Calculate parameter error (standard deviation)
+        perr = np.sqrt(np.diag(pcov))
+        
+        # Calculate derived parameters
+        derived_params = calculate_parameters(f"{model_type}_{absorption}", popt)
+        
+        # Calculate goodness-of-fit metrics
+        gof = calculate_goodness_of_fit(concentrations, obs_predictions)
+        
+        return {
+            'fitted_parameters': popt.tolist(),
+            'parameter_errors': perr.tolist(),
+            'derived_parameters': derived_params,
+            'goodness_of_fit': gof,
+            'observed_times': times.tolist(),
+            'observed_concentrations': concentrations.tolist(),
+            'predicted_times': pred_times.tolist(),
+            'predicted_concentrations': predictions.tolist()
+        }
+    
+    except Exception as e:
+        print(f"Error fitting model for subject {subject_id}: {e}")
+        increment('fit_failures')
+        return {
+            'error': str(e)
+        }
+
+def _fit_subjects(profiles, model_type, dose, absorption):
+    """Fit every subject of a ProfileSet; subjects with too few points are left out."""
+    results = {}
+    for profile in profiles.subjects():
+        result = fit_subject(profile.subject_id, profile.times, profile.concentrations,
+                             model_type=model_type, dose=dose, absorption=absorption, presorted=True)
+        if result is not None:
+            results[profile.subject_id] = result
+    return results
+
+def fit_compartmental_model(subjects_data, model_type='one_compartment_first_order', dose=1, absorption='first-order',
+                            workers=None):
+    """
+    Fit compartmental models to concentration-time data.
+    
+    Parameters:
+    - subjects_data: ProfileSet, or dictionary with subject IDs as keys and dicts with
+      'times' and 'concentrations' as values
+    - model_type: Type of compartmental model to fit
+    - dose: Dose administered
+    - absorption: Absorption type for oral models ('first-order', 'zero-order')
+    - workers: Fit in this many processes, handing the data over through shared memory;
+      fit counters are then not recorded in the current run's metrics
+    
+    Returns:
+    - Dictionary with fitted parameters and derived parameters for each subject
+    """
+    # Validate the model selection before fitting any subject
+    select_model(model_type, absorption, dose)
+    profiles = as_profile_set(subjects_data)
+    
+    with stage('fit'):
+        if workers is not None and workers > 1:
+            from pk_tools.sharedmem import map_subject_ranges
             
-            # Initialize summary
-            summary = {'derived_parameters': {}}
+            results = {}
+            for part in map_subject_ranges(_fit_subjects, profiles, workers=workers,
+                                           model_type=model_type, dose=dose, absorption=absorption):
+                results.update(part)
+        else:
+            results = _fit_subjects(profiles, model_type, dose, absorption)
+    
+    # Calculate mean, SD, geometric mean and percentiles of parameters across subjects
+    with stage('summary'):
+        if any('error' not in result for result in results.values()):
+            accumulators = {}
+            for result in results.values():
+                for param, value in result.get('derived_parameters', {}).items():
+                    accumulators.setdefault(param, ParameterSummary()).add(value)
             
-            # Calculate statistics for each parameter
-            for param in derived_param_keys:
-                values = [results[subject_id]['derived_parameters'][param] 
-                          for subject_id in results 
-                          if 'derived_parameters' in results[subject_id] and param in results[subject_id]['derived_parameters']]
-                
-                if values:
-                    summary['derived_parameters'][f'{param}_mean'] = np.mean(values)
-                    summary['derived_parameters'][f'{param}_sd'] = np.std(values)
-                    summary['derived_parameters'][f'{param}_cv'] = 100 * np.std(values) / np.mean(values) if np.mean(values) != 0 else None
-                    summary['derived_parameters'][f'{param}_min'] = np.min(values)
-                    summary['derived_parameters'][f'{param}_max'] = np.max(values)
+            summary = {'derived_parameters': {}}
+            for param, accumulator in accumulators.items():
+                summary['derived_parameters'].update(accumulator.as_dict(param))
             
             results['summary'] = summary
     
@@ -0,0 +1,161 @@
+import json
+import mmap
+import os
+import struct
+import uuid
+
+import numpy as np
+
+from pk_tools.profiles import ProfileSet, as_profile_set
+from pk_tools.sharedmem import _layout, _views
+
+# File header: magic, number of subjects, number of samples, byte length of the subject IDs
+_MAGIC = b'PKPROF01'
+_HEADER = struct.Struct('<8sqqq')
+# The arrays start on a page boundary of the file, after the header
+_DATA_AT = mmap.PAGESIZE
+
+# Samples per chunk when iterating over a mapped dataset (16 bytes per sample)
+DEFAULT_CHUNK_SAMPLES = 4 * 1024 * 1024
+
+def write_profile_cache(path, subjects_data):
+    """
+    Write a dataset's concentration-time data to a binary file that open_profile_cache maps.
+    
+    The offsets, times and concentrations are stored back to back in the
+    layout of a SharedProfileSet, followed by the subject IDs as JSON. The
+    file is written next to path and renamed into place, so readers never
+    see a partial file.
+    
+    Parameters:
+    - path: Path of the cache file
+    - subjects_data: ProfileSet, or dictionary with subject IDs as keys and dicts with
+      'times' and 'concentrations' as values
+    
+    Returns:
+    - Size of the file in bytes
+    """
+    profiles = as_profile_set(subjects_data)
+    n_subjects, n_samples = len(profiles), len(profiles.times)
+    subject_ids = json.dumps([str(subject_id) for subject_id in profiles.subject_ids]).encode('utf-8')
+    
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, n_subjects, n_samples, len(subject_ids)))
+            f.seek(_DATA_AT)
+            f.write(profiles.offsets.astype('<i8', copy=False).tobytes())
+            f.write(profiles.times.astype('<f8', copy=False).tobytes())
+            f.write(profiles.concentrations.astype('<f8', copy=False).tobytes())
+            f.write(subject_ids)
+            size = f.tell()
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    
+    return size
+
+def open_profile_cache(path, chunk_samples=DEFAULT_CHUNK_SAMPLES):
+    """
+    Map a file written by write_profile_cache, without reading its samples.
+    
+    Parameters:
+    - path: Path of the cache file
+    - chunk_samples: Samples per chunk when iterating over the subjects
+    
+    Returns:
+    - Read-only MappedProfileSet
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < _HEADER.size:
+            raise ValueError(f"Not a profile cache file: {path}")
+        magic, n_subjects, n_samples, ids_length = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != _MAGIC:
+            raise ValueError(f"Not a profile cache file: {path}")
+        
+        ids_at = _DATA_AT + 8 * (n_subjects + 1 + 2 * n_samples)
+        if size != ids_at + ids_length:
+            raise ValueError(f"Truncated profile cache file: {path}")
+        
+        # The mapping stays open as long as any array views it
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    
+    subject_ids = json.loads(buffer[ids_at:ids_at + ids_length].decode('utf-8'))
+    offsets, times, concentrations = _views(memoryview(buffer)[_DATA_AT:ids_at], n_subjects, n_samples)
+    return MappedProfileSet(subject_ids, offsets, times, concentrations, buffer, path, chunk_samples)
+
+def chunk_ranges(profiles, chunk_samples):
+    """
+    Split the subjects into contiguous (start, stop) ranges of up to chunk_samples samples.
+    
+    A subject with more samples than chunk_samples gets a range of its own.
+    """
+    n_subjects = len(profiles)
+    ranges = []
+    start = 0
+    while start < n_subjects:
+        limit = profiles.offsets[start] + max(chunk_samples, 1)
+        stop = int(np.searchsorted(profiles.offsets, limit, side='right')) - 1
+        stop = min(max(stop, start + 1), n_subjects)
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+class MappedProfileSet(ProfileSet):
+    """
+    A ProfileSet whose arrays are read-only views of a memory-mapped cache file.
+    
+    Samples are paged in from the file as they are read. subjects() walks the
+    dataset in chunks of chunk_samples samples and, after each chunk, tells
+    the kernel its pages can be dropped, so iterating over a dataset takes
+    memory in proportion to the chunk size rather than the dataset size.
+    Dropped pages are read back from the file if they are used again.
+    """
+    
+    __slots__ = ('_buffer', 'path', 'chunk_samples')
+    
+    def __init__(self, subject_ids, offsets, times, concentrations, buffer, path, chunk_samples=DEFAULT_CHUNK_SAMPLES):
+        super().__init__(subject_ids, offsets, times, concentrations, presorted=True)
+        self._buffer = buffer
+        self.path = path
+        self.chunk_samples = chunk_samples
+    
+    def __reduce__(self):
+        # Other processes map the same file instead of receiving a copy of the samples
+        return open_profile_cache, (self.path, self.chunk_samples)
+    
+    def __repr__(self):
+        return f'MappedProfileSet({len(self.subject_ids)} subjects, {len(self.times)} samples)'
+    
+    def chunks(self):
+        """Iterate over the subjects as ProfileSets of up to chunk_samples samples, releasing each chunk's pages after use."""
+        for start, stop in chunk_ranges(self, self.chunk_samples):
+            yield self.subset(start, stop)
+            self.release(start, stop)
+    
+    def subjects(self):
+        """Iterate over the SubjectProfile of every subject, in order, one chunk at a time."""
+        for chunk in self.chunks():
+            yield from chunk.subjects()
+    
+    def release(self, start, stop):
+        """Let the kernel drop the pages holding the samples of subjects start to stop - 1."""
+        if not hasattr(mmap, 'MADV_DONTNEED'):
+            return
+        
+        first, last = int(self.offsets[start]), int(self.offsets[stop])
+        if last == first:
+            return
+        
+        n_subjects, n_samples = len(self.subject_ids), len(self.times)
+        for _, at in _layout(n_subjects, n_samples)[1:]:
+            # Only whole pages inside the range, so neighbouring chunks keep theirs
+            begin = _DATA_AT + 8 * (at + first)
+            end = _DATA_AT + 8 * (at + last)
+            begin += -begin % mmap.PAGESIZE
+            end -= end % mmap.PAGESIZE
+            if end > begin:
+                self._buffer.madvise(mmap.MADV_DONTNEED, begin, end - begin)
@@ -0,0 +1,160 @@
+import warnings
+
+import numpy as np
+
+def lttb_indices(x, y, threshold):
+    """
+    Select points with the Largest-Triangle-Three-Buckets algorithm.
+    
+    The first and last points are always kept; every bucket in between
+    contributes the point forming the largest triangle with the previously
+    selected point and the average of the next bucket, which preserves peaks
+    and troughs far better than regular decimation.
+    
+    Parameters:
+    - x: Array of x values, sorted ascending
+    - y: Array of y values
+    - threshold: Number of points to keep
+    
+    Returns:
+    - Array of indices of the selected points, in ascending order
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    
+    every = (n - 2) / (threshold - 2)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    a = 0
+    
+    for i in range(threshold - 2):
+        # Average of the next bucket (the last bucket averages the final point only)
+        avg_start = int(np.floor((i + 1) * every)) + 1
+        avg_end = min(int(np.floor((i + 2) * every)) + 1, n)
+        avg_x = x[avg_start:avg_end].mean()
+        avg_y = y[avg_start:avg_end].mean()
+        
+        # Candidates of the current bucket
+        start = int(np.floor(i * every)) + 1
+        end = int(np.floor((i + 1) * every)) + 1
+        areas = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        
+        a = start + int(np.argmax(np.nan_to_num(areas, nan=-1.0)))
+        selected[i + 1] = a
+    
+    selected[-1] = n - 1
+    return selected
+
+def viewport_indices(x, x_min=None, x_max=None):
+    """
+    Return the indices of sorted x values inside [x_min, x_max].
+    
+    One point on either side of the viewport is included, so lines drawn from
+    the selection still reach the edges of the plot.
+    """
+    n = len(x)
+    lo = 0 if x_min is None else max(int(np.searchsorted(x, x_min, side='left')) - 1, 0)
+    hi = n if x_max is None else min(int(np.searchsorted(x, x_max, side='right')) + 1, n)
+    return np.arange(lo, hi)
+
+def downsample_indices(x, y, max_points=None, x_min=None, x_max=None):
+    """
+    Select the points of a series to plot at a given resolution and viewport.
+    
+    Parameters:
+    - x: Array of x values
+    - y: Array of y values
+    - max_points: Maximum number of points to return (None keeps all points)
+    - x_min: Lower bound of the viewport (optional)
+    - x_max: Upper bound of the viewport (optional)
+    
+    Returns:
+    - Array of indices into x and y, ordered by x
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    
+    if x.size > 1 and np.any(np.diff(x) < 0):
+        order = np.argsort(x, kind='stable')
+    else:
+        order = np.arange(x.size)
+    
+    if x_min is not None or x_max is not None:
+        order = order[viewport_indices(x[order], x_min, x_max)]
+    
+    if max_points is not None and order.size > max_points:
+        order = order[lttb_indices(x[order], y[order], max_points)]
+    
+    return order
+
+def downsample_series(x, y, max_points=None, x_min=None, x_max=None):
+    """Downsample a series as with downsample_indices, returning (x, y) lists."""
+    if max_points is None and x_min is None and x_max is None:
+        return list(x), list(y)
+    
+    indices = downsample_indices(x, y, max_points, x_min, x_max)
+    return np.asarray(x, dtype=np.float64)[indices].tolist(), np.asarray(y, dtype=np.float64)[indices].tolist()
+
+def percentile_bands(series, percentiles=(5, 50, 95), n_points=100, x_min=None, x_max=None):
+    """
+    Aggregate many series into percentile bands across subjects.
+    
+    Each series is linearly interpolated onto a common time grid: the distinct
+    sampling times when there are at most n_points of them (the usual case for
+    nominal sampling schedules), otherwise n_points evenly spaced times. A
+    series contributes only inside its own time range.
+    
+    Parameters:
+    - series: Iterable of (times, concentrations) pairs
+    - percentiles: Percentiles to compute (50 is reported as 'median')
+    - n_points: Maximum number of grid points
+    - x_min: Lower bound of the grid (optional)
+    - x_max: Upper bound of the grid (optional)
+    
+    Returns:
+    - Dictionary with 'times', 'n' (series contributing at each time) and one
+      list per percentile (e.g. 'p05', 'median', 'p95'); None where no series contributes
+    """
+    prepared = []
+    for times, concentrations in series:
+        times = np.asarray(times, dtype=np.float64)
+        concentrations = np.asarray(concentrations, dtype=np.float64)
+        valid = np.isfinite(times) & np.isfinite(concentrations)
+        if not np.any(valid):
+            continue
+        
+        times = times[valid]
+        concentrations = concentrations[valid]
+        order = np.argsort(times, kind='stable')
+        prepared.append((times[order], concentrations[order]))
+    
+    keys = ['median' if p == 50 else f'p{p:02d}' for p in percentiles]
+    if not prepared:
+        return dict({'times': [], 'n': []}, **{key: [] for key in keys})
+    
+    grid = np.unique(np.concatenate([times for times, _ in prepared]))
+    if x_min is not None:
+        grid = grid[grid >= x_min]
+    if x_max is not None:
+        grid = grid[grid <= x_max]
+    if grid.size > n_points:
+        grid = np.linspace(grid[0], grid[-1], n_points)
+    
+    values = np.full((len(prepared), grid.size), np.nan)
+    for i, (times, concentrations) in enumerate(prepared):
+        values[i] = np.interp(grid, times, concentrations, left=np.nan, right=np.nan)
+    
+    counts = np.sum(~np.isnan(values), axis=0)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # All-NaN columns
+        bands = np.nanpercentile(values, percentiles, axis=0)
+    
+    result = {'times': grid.tolist(), 'n': counts.tolist()}
+    for key, band in zip(keys, bands):
+        result[key] = [None if count == 0 else value for value, count in zip(band.tolist(), counts.tolist())]
+    
+    return result
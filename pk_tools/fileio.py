@@ -0,0 +1,370 @@
+import os
+
+import numpy as np
+
+from pk_tools.profiles import ProfileSet
+from pk_tools.utils import DatasetValidator
+
+# Explicit dtypes for the required columns, so pandas does not have to infer them
+INGEST_DTYPES = {'subject_id': 'category', 'time': 'float64', 'concentration': 'float64'}
+
+# Used when a file holds non-numeric cells (e.g. BLQ markers) so that validation can report them
+FALLBACK_DTYPES = {'subject_id': 'category', 'time': 'str', 'concentration': 'str'}
+
+# File extensions accepted by read_dataset, mapped to file types
+FILE_TYPES = {
+    'csv': 'csv',
+    'xlsx': 'excel',
+    'xls': 'excel',
+    'parquet': 'parquet',
+    'arrow': 'arrow',
+    'feather': 'arrow',
+    'ipc': 'arrow'
+}
+
+# Formats write_dataset can produce, with their file extension and MIME type
+EXPORT_FORMATS = {
+    'csv': ('csv', 'text/csv'),
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'arrow': ('arrow', 'application/vnd.apache.arrow.file')
+}
+
+def get_file_type(path):
+    """Return the file type ('csv', 'excel', 'parquet' or 'arrow') for a path, based on its extension."""
+    ext = os.path.splitext(path)[1].lstrip('.').lower()
+    if ext not in FILE_TYPES:
+        raise ValueError(f"Unsupported file type: {ext}")
+    return FILE_TYPES[ext]
+
+def _require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise ImportError("The pyarrow engine requires the pyarrow package to be installed")
+
+def _open_ipc(path):
+    """Open an Arrow IPC file (or stream) from a memory map, so column buffers are not copied."""
+    import pyarrow as pa
+    
+    source = pa.memory_map(path)
+    try:
+        return pa.ipc.open_file(source)
+    except pa.ArrowInvalid:
+        source.seek(0)
+        return pa.ipc.open_stream(source)
+
+def _read_arrow_table(path, file_type):
+    _require_pyarrow()
+    
+    if file_type == 'parquet':
+        import pyarrow.parquet as pq
+        return pq.read_table(path, memory_map=True)
+    
+    return _open_ipc(path).read_all()
+
+def _iter_arrow_batches(path, file_type, chunksize):
+    _require_pyarrow()
+    
+    if file_type == 'parquet':
+        import pyarrow.parquet as pq
+        yield from pq.ParquetFile(path, memory_map=True).iter_batches(batch_size=chunksize)
+        return
+    
+    reader = _open_ipc(path)
+    if hasattr(reader, 'num_record_batches'):
+        for i in range(reader.num_record_batches):
+            yield reader.get_batch(i)
+    else:
+        yield from reader
+
+def _arrow_column(column):
+    """Convert a numeric Arrow column to float64 numpy, without copying where the buffers allow it."""
+    import pyarrow as pa
+    
+    if not (pa.types.is_floating(column.type) or pa.types.is_integer(column.type)):
+        return column.to_pandas()  # Left as-is for validation to report
+    
+    column = column.cast(pa.float64())
+    if isinstance(column, pa.ChunkedArray) and column.num_chunks == 1:
+        column = column.chunk(0)
+    if isinstance(column, pa.Array) and column.null_count == 0:
+        return column.to_numpy(zero_copy_only=True)
+    return column.to_numpy()  # Nulls become NaN
+
+def _arrow_to_frame(table):
+    """Convert an Arrow table or record batch to a DataFrame in the ingest dtypes."""
+    import pandas as pd
+    import pyarrow as pa
+    
+    columns = {}
+    for name in table.column_names:
+        column = table.column(name)
+        if name == 'subject_id':
+            if not (pa.types.is_dictionary(column.type) and pa.types.is_string(column.type.value_type)):
+                column = column.cast(pa.string()).dictionary_encode()
+            columns[name] = column.to_pandas()
+        elif name in ('time', 'concentration'):
+            columns[name] = _arrow_column(column)
+        else:
+            columns[name] = column.to_pandas()
+    
+    return pd.DataFrame(columns, copy=False)
+
+def _read_excel(path):
+    import pandas as pd
+    
+    df = pd.read_excel(path, dtype={'subject_id': str})
+    
+    for column in ('time', 'concentration'):
+        if column in df.columns:
+            try:
+                df[column] = df[column].astype('float64')
+            except (ValueError, TypeError):
+                pass  # Left as-is for validation to report
+    
+    if 'subject_id' in df.columns:
+        df['subject_id'] = df['subject_id'].astype('category')
+    
+    return df
+
+def read_dataset(path, file_type=None, engine=None):
+    """
+    Read a dataset file in a single pass with explicit dtypes.
+    
+    Parameters:
+    - path: Path of the saved file
+    - file_type: 'csv', 'excel', 'parquet' or 'arrow'; inferred from the extension if omitted
+    - engine: Optional CSV engine ('c', 'python' or 'pyarrow')
+    
+    Returns:
+    - DataFrame with float64 time/concentration columns and a categorical subject_id column.
+      Columns holding non-numeric cells are returned as strings for validation to report.
+    """
+    import pandas as pd
+    
+    file_type = file_type or get_file_type(path)
+    
+    if file_type == 'excel':
+        return _read_excel(path)
+    
+    if file_type in ('parquet', 'arrow'):
+        return _arrow_to_frame(_read_arrow_table(path, file_type))
+    
+    if engine == 'pyarrow':
+        return _read_pyarrow_csv(path)
+    
+    try:
+        df = pd.read_csv(path, dtype=INGEST_DTYPES, engine=engine)
+    except ValueError:
+        df = pd.read_csv(path, dtype=FALLBACK_DTYPES, engine=engine)
+    
+    if 'subject_id' in df.columns:
+        df['subject_id'] = df['subject_id'].astype('category')
+    
+    return df
+
+def iter_dataset_chunks(path, file_type=None, chunksize=100_000, engine=None):
+    """
+    Stream a dataset file as DataFrame chunks of about chunksize rows.
+    
+    CSV files are parsed incrementally, so memory is bounded by the chunk size. With
+    engine='pyarrow' the file is read in blocks by pyarrow's streaming CSV reader.
+    Parquet and Arrow IPC files are read batch by batch. Excel files cannot be
+    streamed; they are read whole and then sliced.
+    """
+    import pandas as pd
+    
+    file_type = file_type or get_file_type(path)
+    
+    if file_type in ('parquet', 'arrow'):
+        for batch in _iter_arrow_batches(path, file_type, chunksize):
+            yield _arrow_to_frame(batch)
+        return
+    
+    if file_type == 'excel':
+        df = _read_excel(path)
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize]
+        return
+    
+    if engine == 'pyarrow':
+        yield from _iter_pyarrow_csv(path, chunksize)
+        return
+    
+    # Probe the typed read on the first chunk; fall back to strings if values do not parse
+    try:
+        reader = pd.read_csv(path, dtype=INGEST_DTYPES, chunksize=chunksize, engine=engine)
+        first = next(reader, None)
+    except ValueError:
+        reader = pd.read_csv(path, dtype=FALLBACK_DTYPES, chunksize=chunksize, engine=engine)
+        first = next(reader, None)
+    
+    if first is None:
+        return
+    yield first
+    
+    typed = first['time'].dtype == 'float64' if 'time' in first.columns else False
+    rows_read = len(first)
+    try:
+        for chunk in reader:
+            rows_read += len(chunk)
+            yield chunk
+    except ValueError:
+        if not typed:
+            raise
+        
+        # A later chunk has non-numeric cells: continue from where the typed reader stopped
+        reader = pd.read_csv(path, dtype=FALLBACK_DTYPES, chunksize=chunksize, engine=engine,
+                             skiprows=range(1, rows_read + 1))
+        yield from reader
+
+def _csv_convert_options(value_type):
+    """pyarrow CSV conversion with subject IDs as strings and times and concentrations as value_type."""
+    import pyarrow as pa
+    from pyarrow import csv
+    
+    # Typed at parse time: pandas' pyarrow engine infers the IDs as integers first, so '001' would become '1'
+    return csv.ConvertOptions(column_types={'time': value_type, 'concentration': value_type,
+                                            'subject_id': pa.string()})
+
+def _read_pyarrow_csv(path):
+    _require_pyarrow()
+    import pyarrow as pa
+    from pyarrow import csv
+    
+    try:
+        table = csv.read_csv(path, convert_options=_csv_convert_options(pa.float64()))
+    except pa.ArrowInvalid:
+        # Non-numeric cells: read the values as strings for validation to report
+        table = csv.read_csv(path, convert_options=_csv_convert_options(pa.string()))
+    return _batch_to_frame(table)
+
+def _iter_pyarrow_csv(path, chunksize):
+    _require_pyarrow()
+    import pyarrow as pa
+    from pyarrow import csv
+    
+    # Roughly 32 bytes per row for subject/time/concentration records
+    read_options = csv.ReadOptions(block_size=max(chunksize * 32, 1 << 20))
+    
+    batches_read = 0
+    try:
+        convert_options = _csv_convert_options(pa.float64())
+        for batch in csv.open_csv(path, read_options=read_options, convert_options=convert_options):
+            batches_read += 1
+            yield _batch_to_frame(batch)
+    except pa.ArrowInvalid:
+        # Non-numeric cells: re-read as strings, skipping the batches already yielded
+        # (block boundaries do not depend on the column types)
+        convert_options = _csv_convert_options(pa.string())
+        reader = csv.open_csv(path, read_options=read_options, convert_options=convert_options)
+        for i, batch in enumerate(reader):
+            if i >= batches_read:
+                yield _batch_to_frame(batch)
+
+def _batch_to_frame(batch):
+    df = batch.to_pandas()
+    if 'subject_id' in df.columns:
+        df['subject_id'] = df['subject_id'].astype('category')
+    return df
+
+def ingest_dataset(path, file_type=None, chunksize=None, engine=None):
+    """
+    Read and validate a dataset file in one pass.
+    
+    Parameters:
+    - path: Path of the saved file
+    - file_type: 'csv', 'excel', 'parquet' or 'arrow'; inferred from the extension if omitted
+    - chunksize: If given, stream the file in chunks of this many rows, validating each
+      chunk as it is read
+    - engine: Optional CSV engine ('c', 'python' or 'pyarrow')
+    
+    Returns:
+    - tuple: (DataFrame, validation report)
+    """
+    import pandas as pd
+    
+    validator = DatasetValidator()
+    
+    if chunksize is None:
+        df = read_dataset(path, file_type=file_type, engine=engine)
+        validator.validate_chunk(df)
+        return df, validator.report()
+    
+    chunks = []
+    for chunk in iter_dataset_chunks(path, file_type=file_type, chunksize=chunksize, engine=engine):
+        validator.validate_chunk(chunk)
+        chunks.append(chunk)
+    
+    if not chunks:
+        df = pd.DataFrame(columns=list(INGEST_DTYPES))
+    else:
+        df = pd.concat(chunks, ignore_index=True)
+        # Chunks carry different category sets; restore a single categorical column
+        if 'subject_id' in df.columns:
+            df['subject_id'] = df['subject_id'].astype('category')
+    
+    return df, validator.report()
+
+def frame_to_subjects(df):
+    """
+    Group a validated dataset frame into a ProfileSet.
+    
+    Parameters:
+    - df: DataFrame as returned by ingest_dataset
+    
+    Returns:
+    - ProfileSet with the subjects in file order and each subject's samples in time order
+    """
+    codes, subject_ids = df['subject_id'].factorize(sort=False)
+    keep = codes >= 0
+    return ProfileSet.from_codes(
+        [str(subject_id) for subject_id in subject_ids],
+        codes[keep],
+        df['time'].to_numpy(dtype=np.float64)[keep],
+        df['concentration'].to_numpy(dtype=np.float64)[keep]
+    )
+
+def write_dataset(flat, sink, file_format):
+    """
+    Write a dataset in long format (subject_id, time, concentration).
+    
+    Parameters:
+    - flat: (subject_ids, offsets, times, concentrations) as returned by flatten_subjects
+    - sink: Path or writable binary file object
+    - file_format: 'csv', 'parquet' or 'arrow' (Arrow IPC file)
+    """
+    import pandas as pd
+    
+    subject_ids, offsets, times, concentrations = flat
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {file_format}")
+    
+    # Subject IDs are stored once and referenced by index from each row
+    codes = np.repeat(np.arange(len(subject_ids), dtype=np.int32), np.diff(offsets))
+    
+    if file_format == 'csv':
+        df = pd.DataFrame({
+            'subject_id': pd.Categorical.from_codes(codes, categories=pd.Index([str(s) for s in subject_ids])),
+            'time': times,
+            'concentration': concentrations
+        }, copy=False)
+        df.to_csv(sink, index=False)
+        return
+    
+    _require_pyarrow()
+    import pyarrow as pa
+    
+    table = pa.table({
+        'subject_id': pa.DictionaryArray.from_arrays(pa.array(codes), pa.array([str(s) for s in subject_ids],
+                                                                                 type=pa.string())),
+        'time': pa.array(np.asarray(times, dtype=np.float64)),
+        'concentration': pa.array(np.asarray(concentrations, dtype=np.float64))
+    })
+    
+    if file_format == 'parquet':
+        import pyarrow.parquet as pq
+        pq.write_table(table, sink)
+    else:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
@@ -0,0 +1,147 @@
+import threading
+
+from pk_tools.accumulators import ParameterSummary
+from pk_tools.cache import hash_subjects_data
+from pk_tools.nca import calculate_subject_nca, SUMMARY_PARAMETERS
+from pk_tools.compartmental import select_model, fit_subject
+from pk_tools.metrics import increment, stage
+from pk_tools.profiles import as_profile_set
+
+class IncrementalAnalysis:
+    """
+    Re-run NCA or compartmental analysis over an evolving dataset.
+    
+    Per-subject results are kept together with a content hash of the subject's
+    data, so each update only recomputes subjects that were added or changed.
+    The population summary is rebuilt from running ParameterSummary
+    aggregates that are adjusted for the changed subjects only.
+    
+    An instance can be shared between threads: updates and summaries hold a
+    lock, so concurrent runs never add or remove the same subject twice.
+    
+    Parameters:
+    - analysis_type: 'NCA' or 'Compartmental'
+    - kwargs: Arguments of calculate_nca_parameters or fit_compartmental_model
+    """
+    
+    def __init__(self, analysis_type, **kwargs):
+        if analysis_type == 'NCA':
+            self._analyze_subject = self._nca_subject
+        elif analysis_type == 'Compartmental':
+            # Fail early on an invalid model selection
+            select_model(kwargs.get('model_type'), kwargs.get('absorption', 'first-order'), kwargs.get('dose', 1))
+            self._analyze_subject = self._compartmental_subject
+        else:
+            raise ValueError(f"Incremental analysis is not supported for {analysis_type}")
+        
+        self.analysis_type = analysis_type
+        self.kwargs = kwargs
+        self.subject_hashes = {}
+        self.subject_results = {}
+        self.aggregates = {}
+        self.parameter_values = {}
+        self._stale = set()
+        self.recomputed = 0
+        self._lock = threading.RLock()
+    
+    def _nca_subject(self, subject_id, data):
+        return calculate_subject_nca(data.times, data.concentrations, dose=self.kwargs.get('dose'), presorted=True)
+    
+    def _compartmental_subject(self, subject_id, data):
+        return fit_subject(subject_id, data.times, data.concentrations, presorted=True, **self.kwargs)
+    
+    def _summary_values(self, result):
+        """Return the parameter values a subject result contributes to the summary."""
+        if result is None:
+            return {}
+        
+        if self.analysis_type == 'NCA':
+            return {param: result[param] for param in SUMMARY_PARAMETERS if result[param] is not None}
+        
+        return result.get('derived_parameters', {})
+    
+    def _add(self, subject_id, result):
+        for param, value in self._summary_values(result).items():
+            if param not in self.aggregates:
+                self.aggregates[param] = ParameterSummary()
+                self.parameter_values[param] = {}
+            self.aggregates[param].add(value)
+            self.parameter_values[param][subject_id] = value
+    
+    def _remove(self, subject_id):
+        for param, value in self._summary_values(self.subject_results.get(subject_id)).items():
+            self.aggregates[param].remove(value)
+            del self.parameter_values[param][subject_id]
+            self._stale.add(param)
+    
+    def update(self, subjects_data):
+        """
+        Bring the results up to date with the given data.
+        
+        Parameters:
+        - subjects_data: ProfileSet, or dictionary with subject IDs as keys and dicts with
+          'times' and 'concentrations' as values
+        
+        Returns:
+        - Results in the same format as calculate_nca_parameters / fit_compartmental_model
+        """
+        with self._lock:
+            self.recomputed = 0
+            subjects_data = as_profile_set(subjects_data)
+            
+            # Drop subjects that are no longer part of the dataset
+            for subject_id in [s for s in self.subject_results if s not in subjects_data]:
+                self._remove(subject_id)
+                del self.subject_results[subject_id]
+                del self.subject_hashes[subject_id]
+            
+            with stage('fit' if self.analysis_type == 'Compartmental' else 'compute'):
+                for data in subjects_data.subjects():
+                    subject_id = data.subject_id
+                    subject_hash = hash_subjects_data({subject_id: data})
+                    if self.subject_hashes.get(subject_id) == subject_hash:
+                        continue
+                    
+                    self._remove(subject_id)
+                    result = self._analyze_subject(subject_id, data)
+                    self.subject_results[subject_id] = result
+                    self.subject_hashes[subject_id] = subject_hash
+                    self._add(subject_id, result)
+                    self.recomputed += 1
+            increment('subjects_recomputed', self.recomputed)
+            
+            results = {}
+            for subject_id in subjects_data:
+                if self.subject_results[subject_id] is not None:
+                    results[subject_id] = self.subject_results[subject_id]
+            
+            with stage('summary'):
+                summary = self.summary(results)
+            if summary is not None:
+                results['summary'] = summary
+            
+            return results
+    
+    def summary(self, results=None):
+        """Build the population summary block from the running aggregates."""
+        with self._lock:
+            # Extremes and percentiles cannot be un-added; rebuild them where subjects were removed
+            for param in self._stale:
+                self.aggregates[param].refresh(self.parameter_values[param].values())
+            self._stale.clear()
+            
+            if self.analysis_type == 'NCA':
+                summary = {}
+                for param in SUMMARY_PARAMETERS:
+                    if param in self.aggregates:
+                        summary.update(self.aggregates[param].as_dict(param))
+                return summary
+            
+            # Compartmental: only summarise when at least one subject was fitted
+            if results is not None and not any('error' not in r for s, r in results.items() if s != 'summary'):
+                return None
+            
+            summary = {'derived_parameters': {}}
+            for param, aggregate in self.aggregates.items():
+                summary['derived_parameters'].update(aggregate.as_dict(param))
+            return summary
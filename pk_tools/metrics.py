@@ -0,0 +1,216 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Histogram buckets for stage and run durations, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Counter name -> help text of the exported pk_analysis_<name>_total metric
+COUNTERS = {
+    'subjects': 'Subjects in the analysed datasets.',
+    'subjects_recomputed': 'Subjects recomputed by incremental analyses (the rest were reused).',
+    'result_cache_hits': 'Analysis runs answered from the result cache.',
+    'fits': 'Compartmental model fits attempted.',
+    'fit_iterations': 'Model function evaluations spent by compartmental fits.',
+    'fit_failures': 'Compartmental fits that raised an error.',
+    'fits_skipped': 'Subjects with too few data points to fit.',
+    'simulated_subjects': 'Virtual subjects simulated.',
+    'mapped_datasets': 'Datasets read from their memory-mapped profile cache file instead of the database.'
+}
+
+_current_run = ContextVar('pk_tools_current_run', default=None)
+
+class RunMetrics:
+    """
+    Stage durations and counters of one analysis run.
+    
+    Stages that run more than once in a run (e.g. one per dataset) are summed.
+    Stages can nest, e.g. 'fit' inside 'compute', so they need not add up to
+    the total.
+    """
+    
+    def __init__(self, analysis_type):
+        self.analysis_type = analysis_type
+        self.status = 'ok'
+        self.error = None
+        self.stages = {}
+        self.counters = {}
+        self._active = set()
+        self._start = time.perf_counter()
+        self.total_seconds = None
+    
+    def add_stage(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+    
+    def increment(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+    
+    def fail(self, error):
+        """Mark the run as failed, e.g. when the caller handles the exception itself."""
+        self.status = 'error'
+        self.error = str(error)
+    
+    def elapsed(self):
+        return self.total_seconds if self.total_seconds is not None else time.perf_counter() - self._start
+    
+    def as_dict(self):
+        """Snapshot for storing with the analysis record."""
+        metrics = {
+            'analysis_type': self.analysis_type,
+            'status': self.status,
+            'total_seconds': round(self.elapsed(), 6),
+            'stages': {name: round(seconds, 6) for name, seconds in self.stages.items()},
+            'counters': dict(self.counters)
+        }
+        if self.error is not None:
+            metrics['error'] = self.error
+        return metrics
+
+@contextmanager
+def track_run(analysis_type, registry=None):
+    """
+    Collect the metrics of an analysis run.
+    
+    While the block runs, stage() and increment() calls anywhere below it
+    (including inside pk_tools functions) are recorded on the yielded
+    RunMetrics. An exception leaving the block marks the run as failed. On
+    exit the run is added to the registry, if given.
+    
+    Usage:
+        with track_run('NCA', registry) as run:
+            with stage('compute'):
+                results = calculate_nca_parameters(subjects_data)
+        run.as_dict()
+    """
+    run = RunMetrics(analysis_type)
+    token = _current_run.set(run)
+    try:
+        yield run
+    except Exception as e:
+        run.fail(e)
+        raise
+    finally:
+        _current_run.reset(token)
+        run.total_seconds = time.perf_counter() - run._start
+        if registry is not None:
+            registry.observe_run(run)
+
+def current_run():
+    """The RunMetrics being collected in this context, or None outside track_run."""
+    return _current_run.get()
+
+@contextmanager
+def stage(name):
+    """
+    Time a block as a stage of the current run.
+    
+    A no-op outside track_run, and inside a stage of the same name, so a
+    function that times its own 'compute' stage can be called from one.
+    """
+    run = _current_run.get()
+    if run is None or name in run._active:
+        yield
+        return
+    
+    run._active.add(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        run._active.discard(name)
+        run.add_stage(name, time.perf_counter() - start)
+
+def increment(name, amount=1):
+    """Add to a counter of the current run; a no-op outside track_run."""
+    run = _current_run.get()
+    if run is not None:
+        run.increment(name, amount)
+
+def _labels(labels):
+    return ','.join(f'{name}="{value}"' for name, value in labels)
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class MetricsRegistry:
+    """
+    Process-wide aggregate of analysis runs, exported in the Prometheus text format.
+    
+    Each worker process keeps its own registry: with several gunicorn
+    workers a scrape is answered by one of them, so the numbers are per
+    worker and restart with it.
+    """
+    
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+    
+    def _count(self, name, labels, amount=1):
+        key = (name, labels)
+        self._counters[key] = self._counters.get(key, 0) + amount
+    
+    def _observe(self, name, labels, value):
+        histogram = self._histograms.get((name, labels))
+        if histogram is None:
+            histogram = self._histograms[(name, labels)] = {
+                'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0
+            }
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                histogram['buckets'][i] += 1
+        histogram['sum'] += value
+        histogram['count'] += 1
+    
+    def observe_run(self, run):
+        """Add a finished RunMetrics to the aggregates."""
+        analysis_type = (('analysis_type', run.analysis_type),)
+        with self._lock:
+            self._count('pk_analysis_runs_total', analysis_type + (('status', run.status),))
+            self._observe('pk_analysis_duration_seconds', analysis_type, run.elapsed())
+            for name, seconds in run.stages.items():
+                self._observe('pk_analysis_stage_seconds', analysis_type + (('stage', name),), seconds)
+            for name, amount in run.counters.items():
+                self._count(f'pk_analysis_{name}_total', analysis_type, amount)
+    
+    def render(self):
+        """The registry in the Prometheus text exposition format."""
+        help_texts = {
+            'pk_analysis_runs_total': ('counter', 'Analysis runs by type and outcome.'),
+            'pk_analysis_duration_seconds': ('histogram', 'Duration of analysis runs.'),
+            'pk_analysis_stage_seconds': ('histogram', 'Duration of the stages of analysis runs.')
+        }
+        for name, text in COUNTERS.items():
+            help_texts[f'pk_analysis_{name}_total'] = ('counter', text)
+        
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, dict(h, buckets=list(h['buckets']))) for key, h in self._histograms.items()
+            )
+        
+        lines = []
+        described = set()
+        
+        def describe(name):
+            if name not in described:
+                metric_type, text = help_texts.get(name, ('counter', 'Analysis counter.'))
+                lines.append(f'# HELP {name} {text}')
+                lines.append(f'# TYPE {name} {metric_type}')
+                described.add(name)
+        
+        for (name, labels), value in counters:
+            describe(name)
+            lines.append(f'{name}{{{_labels(labels)}}} {_format_value(value)}')
+        
+        for (name, labels), histogram in histograms:
+            describe(name)
+            for bound, count in zip(self.buckets, histogram['buckets']):
+                lines.append(f'{name}_bucket{{{_labels(labels + (("le", bound),))}}} {count}')
+            lines.append(f'{name}_bucket{{{_labels(labels + (("le", "+Inf"),))}}} {histogram["count"]}')
+            lines.append(f'{name}_sum{{{_labels(labels)}}} {_format_value(histogram["sum"])}')
+            lines.append(f'{name}_count{{{_labels(labels)}}} {histogram["count"]}')
+        
+        return '\n'.join(lines) + '\n'
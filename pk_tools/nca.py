@@ -1,6 +1,11 @@
 import numpy as np
-from scipy import integrate
-import pandas as pd
+
+from pk_tools.accumulators import ParameterSummary
+from pk_tools.metrics import stage
+from pk_tools.profiles import as_profile_set
+
+# Parameters summarised across subjects
+SUMMARY_PARAMETERS = ['tmax', 'cmax', 'auc_last', 'auc_inf', 'half_life', 'mrt']
 
 def linear_trapezoidal(times, concentrations):
     """Calculate AUC using linear trapezoidal method."""
@@ -109,108 +114,131 @@ def calculate_half_life(lambda_z):
 
 def find_tmax_cmax(times, concentrations):
     """Find time and concentration at maximum observed concentration."""
-    if not times or not concentrations:
+    if len(times) == 0 or len(concentrations) == 0:
         return None, None
     
     max_idx = np.argmax(concentrations)
     return times[max_idx], concentrations[max_idx]
 
-def calculate_nca_parameters(subjects_data, dose=None):
+def calculate_subject_nca(times, concentrations, dose=None, presorted=False):
     """
-    Calculate NCA parameters for each subject.
+    Calculate NCA parameters for a single subject.
     
     Parameters:
-    - subjects_data: Dictionary with subject IDs as keys and dicts with 'times' and 'concentrations' as values
+    - times: List or array of sampling times
+    - concentrations: List or array of concentrations at those times
     - dose: Optional dose value for calculating dose-normalized parameters
+    - presorted: The samples are already in time order (e.g. a ProfileSet subject)
     
     Returns:
-    - Dictionary with calculated parameters for each subject
+    - Dictionary with calculated parameters for the subject
     """
-    results = {}
-    
-    for subject_id, data in subjects_data.items():
-        times = data['times']
-        concentrations = data['concentrations']
-        
+    if presorted:
+        # The per-sample loops below run faster on Python floats than on array elements
+        times = times.tolist() if isinstance(times, np.ndarray) else list(times)
+        concentrations = concentrations.tolist() if isinstance(concentrations, np.ndarray) else list(concentrations)
+    else:
         # Sort data by time
         sorted_indices = np.argsort(times)
         times = [times[i] for i in sorted_indices]
         concentrations = [concentrations[i] for i in sorted_indices]
-        
-        # Find Tmax and Cmax
-        tmax, cmax = find_tmax_cmax(times, concentrations)
-        
-        # Calculate AUC using linear trapezoidal method
-        auc_last = linear_trapezoidal(times, concentrations)
-        
-        # Calculate terminal elimination rate constant
-        lambda_z, r_squared, intercept, adjusted_points = calculate_lambda_z(times, concentrations)
-        
-        # Calculate half-life
-        half_life = calculate_half_life(lambda_z)
-        
-        # Calculate AUC extrapolated to infinity
-        auc_extrap = extrapolate_auc_inf(times, concentrations, lambda_z)
-        
-        # Calculate total AUC (to infinity)
-        auc_inf = auc_last + (auc_extrap if auc_extrap is not None else 0)
-        
-        # Calculate percent extrapolation
-        pct_extrap = 100 * auc_extrap / auc_inf if auc_inf > 0 and auc_extrap is not None else None
-        
-        # Calculate MRT
-        aumc_last = 0
-        for i in range(1, len(times)):
-            dt = times[i] - times[i-1]
-            aumc_last += 0.5 * (times[i]*concentrations[i] + times[i-1]*concentrations[i-1]) * dt
-        
-        # Extrapolate AUMC to infinity if possible
-        aumc_extrap = None
-        if lambda_z is not None and lambda_z > 0 and concentrations[-1] > 0:
-            aumc_extrap = concentrations[-1] * times[-1] / lambda_z + concentrations[-1] / (lambda_z**2)
-        
-        aumc_inf = aumc_last + (aumc_extrap if aumc_extrap is not None else 0)
-        
-        # Mean residence time
-        mrt = aumc_inf / auc_inf if auc_inf > 0 else None
-        
-        # Store results
-        results[subject_id] = {
-            'tmax': tmax,
-            'cmax': cmax,
-            'auc_last': auc_last,
-            'auc_inf': auc_inf,
-            'auc_extrap': auc_extrap,
-            'pct_extrap': pct_extrap,
-            'lambda_z': lambda_z,
-            'r_squared': r_squared,
-            'half_life': half_life,
-            'mrt': mrt,
-            'aumc_last': aumc_last,
-            'aumc_inf': aumc_inf,
-            'times': times,
-            'concentrations': concentrations,
-            'adjusted_points': adjusted_points
-        }
-        
-        # Add dose-normalized parameters if dose is provided
-        if dose is not None and dose > 0:
-            results[subject_id]['cmax_dn'] = cmax / dose
-            results[subject_id]['auc_last_dn'] = auc_last / dose
-            results[subject_id]['auc_inf_dn'] = auc_inf / dose
-    
-    # Calculate mean and SD across subjects
-    parameter_keys = ['tmax', 'cmax', 'auc_last', 'auc_inf', 'half_life', 'mrt']
-    summary = {}
-    
-    for param in parameter_keys:
-        values = [results[subject_id][param] for subject_id in results if results[subject_id][param] is not None]
-        if values:
-            summary[f'{param}_mean'] = np.mean(values)
-            summary[f'{param}_sd'] = np.std(values)
-            summary[f'{param}_cv'] = 100 * np.std(values) / np.mean(values) if np.mean(values) > 0 else None
-            summary[f'{param}_min'] = np.min(values)
-            summary[f'{param}_max'] = np.max(values)
+    
+    # Find Tmax and Cmax
+    tmax, cmax = find_tmax_cmax(times, concentrations)
+    
+    # Calculate AUC using linear trapezoidal method
+    auc_last = linear_trapezoidal(times, concentrations)
+    
+    # Calculate terminal elimination rate constant
+    lambda_z, r_squared, intercept, adjusted_points = calculate_lambda_z(times, concentrations)
+    
+    # Calculate half-life
+    half_life = calculate_half_life(lambda_z)
+    
+    # Calculate AUC extrapolated to infinity
+    auc_extrap = extrapolate_auc_inf(times, concentrations, lambda_z)
+    
+    # Calculate total AUC (to infinity)
+    auc_inf = auc_last + (auc_extrap if auc_extrap is not None else 0)
+    
+    # Calculate percent extrapolation
+    pct_extrap = 100 * auc_extrap / auc_inf if auc_inf > 0 and auc_extrap is not None else None
+    
+    # Calculate MRT
+    aumc_last = 0
+    for i in range(1, len(times)):
+        dt = times[i] - times[i-1]
+        aumc_last += 0.5 * (times[i]*concentrations[i] + times[i-1]*concentrations[i-1]) * dt
+    
+    # Extrapolate AUMC to infinity if possible
+    aumc_extrap = None
+    if lambda_z is not None and lambda_z > 0 and concentrations[-1] > 0:
+        aumc_extrap = concentrations[-1] * times[-1] / lambda_z + concentrations[-1] / (lambda_z**2)
+    
+    aumc_inf = aumc_last + (aumc_extrap if aumc_extrap is not None else 0)
+    
+    # Mean residence time
+    mrt = aumc_inf / auc_inf if auc_inf > 0 else None
+    
+    # Store results
+    result = {
+        'tmax': tmax,
+        'cmax': cmax,
+        'auc_last': auc_last,
+        'auc_inf': auc_inf,
+        'auc_extrap': auc_extrap,
+        'pct_extrap': pct_extrap,
+        'lambda_z': lambda_z,
+        'r_squared': r_squared,
+        'half_life': half_life,
+        'mrt': mrt,
+        'aumc_last': aumc_last,
+        'aumc_inf': aumc_inf,
+        'times': times,
+        'concentrations': concentrations,
+        'adjusted_points': adjusted_points
+    }
+    
+    # Add dose-normalized parameters if dose is provided
+    if dose is not None and dose > 0:
+        result['cmax_dn'] = cmax / dose
+        result['auc_last_dn'] = auc_last / dose
+        result['auc_inf_dn'] = auc_inf / dose
+    
+    return result
+
+def calculate_nca_parameters(subjects_data, dose=None):
+    """
+    Calculate NCA parameters for each subject.
+    
+    Parameters:
+    - subjects_data: ProfileSet, or dictionary with subject IDs as keys and dicts with
+      'times' and 'concentrations' as values
+    - dose: Optional dose value for calculating dose-normalized parameters
+    
+    Returns:
+    - Dictionary with calculated parameters for each subject
+    """
+    results = {}
+    profiles = as_profile_set(subjects_data)
+    
+    # Summary statistics are accumulated in the same pass over subjects
+    accumulators = {param: ParameterSummary() for param in SUMMARY_PARAMETERS}
+    
+    with stage('compute'):
+        for profile in profiles.subjects():
+            subject_id = profile.subject_id
+            results[subject_id] = calculate_subject_nca(profile.times, profile.concentrations, dose=dose, presorted=True)
+            
+            for param, accumulator in accumulators.items():
+                if results[subject_id][param] is not None:
+                    accumulator.add(results[subject_id][param])
+    
+    # Calculate mean, SD, geometric mean and percentiles across subjects
+    with stage('summary'):
+        summary = {}
+        for param, accumulator in accumulators.items():
+            summary.update(accumulator.as_dict(param))
     
     results['summary'] = summary
     
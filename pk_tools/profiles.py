@@ -0,0 +1,225 @@
+from collections.abc import Mapping
+
+import numpy as np
+
+def flatten_subjects(subjects_data):
+    """
+    Flatten subjects data into contiguous arrays.
+    
+    Parameters:
+    - subjects_data: ProfileSet, or dictionary with subject IDs as keys and dicts with
+      'times' and 'concentrations' as values
+    
+    Returns:
+    - tuple: (subject_ids, offsets, times, concentrations) where subject i owns
+      times[offsets[i]:offsets[i+1]] and concentrations[offsets[i]:offsets[i+1]]
+    """
+    if isinstance(subjects_data, ProfileSet):
+        return list(subjects_data.subject_ids), subjects_data.offsets, subjects_data.times, subjects_data.concentrations
+    
+    subject_ids = list(subjects_data.keys())
+    
+    lengths = np.fromiter((len(data['times']) for data in subjects_data.values()),
+                          dtype=np.int64, count=len(subject_ids))
+    offsets = np.zeros(len(subject_ids) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    
+    if subject_ids:
+        times = np.concatenate([np.asarray(data['times'], dtype=np.float64) for data in subjects_data.values()])
+        concentrations = np.concatenate([np.asarray(data['concentrations'], dtype=np.float64)
+                                         for data in subjects_data.values()])
+    else:
+        times = np.empty(0)
+        concentrations = np.empty(0)
+    
+    return subject_ids, offsets, times, concentrations
+
+def unflatten_subjects(subject_ids, offsets, times, concentrations):
+    """Inverse of flatten_subjects: rebuild the subjects data dictionary with list values."""
+    # Convert each array to a list once rather than once per subject
+    times = times.tolist()
+    concentrations = concentrations.tolist()
+    
+    return {
+        subject_id: {
+            'times': times[offsets[i]:offsets[i+1]],
+            'concentrations': concentrations[offsets[i]:offsets[i+1]]
+        }
+        for i, subject_id in enumerate(subject_ids)
+    }
+
+def _read_only(array):
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+class SubjectProfile:
+    """
+    One subject's samples: read-only views into the arrays of a ProfileSet.
+    
+    Indexing with 'times' or 'concentrations' works as on the dict format, so
+    code written for {'times': [...], 'concentrations': [...]} accepts it.
+    """
+    
+    __slots__ = ('subject_id', 'times', 'concentrations')
+    
+    def __init__(self, subject_id, times, concentrations):
+        self.subject_id = subject_id
+        self.times = times
+        self.concentrations = concentrations
+    
+    def __len__(self):
+        return len(self.times)
+    
+    def __getitem__(self, key):
+        if key == 'times':
+            return self.times
+        if key == 'concentrations':
+            return self.concentrations
+        raise KeyError(key)
+    
+    def __contains__(self, key):
+        return key in ('times', 'concentrations')
+    
+    def keys(self):
+        return ('times', 'concentrations')
+    
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+    
+    def __repr__(self):
+        return f'SubjectProfile({self.subject_id!r}, {len(self.times)} samples)'
+
+class ProfileSet(Mapping):
+    """
+    Concentration-time data of a dataset in compressed sparse row layout.
+    
+    All samples live in two contiguous float64 arrays; subject i owns
+    times[offsets[i]:offsets[i+1]] and the same slice of concentrations.
+    Each subject's samples are sorted by time once, when the set is built
+    (stably, so equal times keep their original order), and the arrays are
+    read-only, so analyses can rely on the order without sorting again.
+    
+    A ProfileSet is a mapping of subject ID to SubjectProfile and can be
+    passed wherever the {subject_id: {'times': ..., 'concentrations': ...}}
+    dict format is accepted; as_profile_set converts that format.
+    
+    Parameters:
+    - subject_ids: Subject IDs, in order
+    - offsets: len(subject_ids) + 1 start offsets into the sample arrays
+    - times: Sampling times of all subjects
+    - concentrations: Concentrations at those times
+    - presorted: Skip sorting when the caller guarantees each subject is already in time order
+    """
+    
+    __slots__ = ('subject_ids', 'offsets', 'times', 'concentrations', '_index')
+    
+    def __init__(self, subject_ids, offsets, times, concentrations, presorted=False):
+        subject_ids = list(subject_ids)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        times = np.ascontiguousarray(times, dtype=np.float64)
+        concentrations = np.ascontiguousarray(concentrations, dtype=np.float64)
+        
+        if len(offsets) != len(subject_ids) + 1 or offsets[0] != 0 or offsets[-1] != len(times):
+            raise ValueError("Offsets must run from 0 to the number of samples, one more than there are subjects")
+        if len(times) != len(concentrations):
+            raise ValueError("Time and concentration arrays must have the same length")
+        if np.any(np.diff(offsets) < 0):
+            raise ValueError("Offsets must be non-decreasing")
+        
+        index = {subject_id: i for i, subject_id in enumerate(subject_ids)}
+        if len(index) != len(subject_ids):
+            raise ValueError("Subject IDs must be unique")
+        
+        if not presorted and len(times) > 1:
+            codes = np.repeat(np.arange(len(subject_ids)), np.diff(offsets))
+            # Out of order only where time decreases within a subject
+            if np.any((times[1:] < times[:-1]) & (codes[1:] == codes[:-1])):
+                order = np.lexsort((times, codes))
+                times = times[order]
+                concentrations = concentrations[order]
+        
+        self.subject_ids = subject_ids
+        self.offsets = _read_only(offsets)
+        self.times = _read_only(times)
+        self.concentrations = _read_only(concentrations)
+        self._index = index
+    
+    @classmethod
+    def from_dict(cls, subjects_data):
+        """Build a ProfileSet from the {subject_id: {'times': ..., 'concentrations': ...}} format."""
+        return cls(*flatten_subjects(subjects_data))
+    
+    @classmethod
+    def from_codes(cls, subject_ids, codes, times, concentrations):
+        """
+        Build a ProfileSet from flat rows in any order.
+        
+        Parameters:
+        - subject_ids: Subject IDs; subjects without rows are kept, with no samples
+        - codes: Position in subject_ids of each row's subject
+        - times: Sampling time of each row
+        - concentrations: Concentration of each row
+        """
+        codes = np.asarray(codes, dtype=np.int64)
+        times = np.asarray(times, dtype=np.float64)
+        concentrations = np.asarray(concentrations, dtype=np.float64)
+        
+        # Group by subject and sort by time in one stable sort
+        order = np.lexsort((times, codes))
+        offsets = np.searchsorted(codes[order], np.arange(len(subject_ids) + 1))
+        return cls(subject_ids, offsets, times[order], concentrations[order], presorted=True)
+    
+    def __len__(self):
+        return len(self.subject_ids)
+    
+    def __iter__(self):
+        return iter(self.subject_ids)
+    
+    def __contains__(self, subject_id):
+        return subject_id in self._index
+    
+    def __getitem__(self, subject_id):
+        return self.subject(self._index[subject_id])
+    
+    def __repr__(self):
+        return f'ProfileSet({len(self.subject_ids)} subjects, {len(self.times)} samples)'
+    
+    def subject(self, i):
+        """The SubjectProfile of the i-th subject."""
+        start, stop = self.offsets[i], self.offsets[i + 1]
+        return SubjectProfile(self.subject_ids[i], self.times[start:stop], self.concentrations[start:stop])
+    
+    def subjects(self):
+        """Iterate over the SubjectProfile of every subject, in order."""
+        for i in range(len(self.subject_ids)):
+            yield self.subject(i)
+    
+    def subset(self, start, stop):
+        """The subjects start to stop - 1 as a ProfileSet of views, without copying samples."""
+        first, last = self.offsets[start], self.offsets[stop]
+        return ProfileSet(self.subject_ids[start:stop], self.offsets[start:stop + 1] - first,
+                          self.times[first:last], self.concentrations[first:last], presorted=True)
+    
+    def lengths(self):
+        """Number of samples of each subject."""
+        return np.diff(self.offsets)
+    
+    @property
+    def nbytes(self):
+        return self.offsets.nbytes + self.times.nbytes + self.concentrations.nbytes
+    
+    def to_dict(self):
+        """The data in the {subject_id: {'times': list, 'concentrations': list}} format."""
+        return unflatten_subjects(self.subject_ids, self.offsets, self.times, self.concentrations)
+
+def as_profile_set(subjects_data):
+    """
+    Return subjects data as a ProfileSet.
+    
+    A ProfileSet is returned as is; the dict format is converted, sorting
+    each subject by time.
+    """
+    if isinstance(subjects_data, ProfileSet):
+        return subjects_data
+    return ProfileSet.from_dict(subjects_data)
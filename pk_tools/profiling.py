@@ -0,0 +1,155 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Profiler name -> extension of the file it writes
+PROFILE_MODES = {
+    'sampling': '.folded',  # Collapsed stacks: flamegraph.pl, speedscope, inferno
+    'cprofile': '.prof'     # pstats dump: snakeviz, flameprof, gprof2dot
+}
+
+def _frame_label(code):
+    """Function name and location of a frame, e.g. 'fit_subject (pk_tools/compartmental.py:174)'."""
+    path = code.co_filename.replace(os.sep, '/')
+    short_path = '/'.join(path.rsplit('/', 2)[-2:])
+    return f'{code.co_qualname} ({short_path}:{code.co_firstlineno})'
+
+class SamplingProfiler:
+    """
+    Statistical profiler for one thread.
+    
+    A background thread records the target thread's call stack every
+    interval seconds. The result is written in the collapsed-stack format
+    (one 'outer;...;inner count' line per distinct stack) that flame graph
+    tools read directly. The overhead is independent of how many Python
+    calls the profiled code makes, unlike cProfile's.
+    
+    Parameters:
+    - interval: Seconds between samples
+    - thread_id: Thread to sample; defaults to the thread calling start()
+    """
+    
+    extension = PROFILE_MODES['sampling']
+    
+    def __init__(self, interval=0.005, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id
+        self.stacks = Counter()
+        self.samples = 0
+        self.duration = 0.0
+        self._labels = {}
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = _frame_label(code)
+        return label
+    
+    def _sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+        
+        stack = []
+        while frame is not None:
+            stack.append(self._label(frame.f_code))
+            frame = frame.f_back
+        self.stacks[';'.join(reversed(stack))] += 1
+        self.samples += 1
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+    
+    def start(self):
+        if self.thread_id is None:
+            self.thread_id = threading.get_ident()
+        self._start = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name='pk-sampling-profiler', daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self._start
+    
+    def collapsed(self):
+        """The samples as collapsed stacks, most frequent first."""
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+    
+    def save(self, path):
+        with open(path, 'w') as f:
+            f.write(self.collapsed())
+
+class CProfiler:
+    """
+    Deterministic profiler (cProfile) of the calling thread.
+    
+    Exact call counts and per-function times, at the cost of slowing down
+    code that makes many small Python calls. The result is a pstats file.
+    """
+    
+    extension = PROFILE_MODES['cprofile']
+    
+    def __init__(self):
+        import cProfile
+        
+        self.profile = cProfile.Profile()
+        self.duration = 0.0
+    
+    def start(self):
+        self._start = time.perf_counter()
+        self.profile.enable()
+    
+    def stop(self):
+        self.profile.disable()
+        self.duration = time.perf_counter() - self._start
+    
+    def save(self, path):
+        self.profile.dump_stats(path)
+
+def make_profiler(mode='sampling', interval=0.005):
+    """
+    Create a profiler.
+    
+    Parameters:
+    - mode: 'sampling' or 'cprofile'
+    - interval: Seconds between samples of the sampling profiler
+    
+    Returns:
+    - SamplingProfiler or CProfiler, not yet started
+    """
+    if mode == 'sampling':
+        return SamplingProfiler(interval=interval)
+    if mode == 'cprofile':
+        return CProfiler()
+    raise ValueError(f"Unknown profiler: {mode}. Choose from {', '.join(PROFILE_MODES)}")
+
+@contextmanager
+def profile(mode='sampling', interval=0.005):
+    """
+    Profile a block of code in the current thread.
+    
+    Yields the profiler, or None when mode is None so callers can make
+    profiling optional without a second code path.
+    
+    Usage:
+        with profile('sampling') as profiler:
+            fit_compartmental_model(subjects_data)
+        profiler.save('fit.folded')
+    """
+    if mode is None:
+        yield None
+        return
+    
+    profiler = make_profiler(mode, interval)
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
@@ -1,19 +1,22 @@
-from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image, PageBreak
-from reportlab.lib.units import inch
-import matplotlib.pyplot as plt
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend
 import io
 import json
 import numpy as np
-import base64
 from datetime import datetime
 
+# reportlab and matplotlib are imported by the functions that use them, so
+# importing this module stays cheap until a report is generated
+
+def _pyplot():
+    """Import pyplot with the non-interactive backend."""
+    import matplotlib
+    matplotlib.use('Agg')  # Use non-interactive backend
+    import matplotlib.pyplot as plt
+    return plt
+
 def generate_plot(data, plot_type, title='', xlabel='', ylabel=''):
     """Generate a plot based on data and plot type."""
+    plt = _pyplot()
+    
     plt.figure(figsize=(8, 6))
     
     if plot_type == 'concentration_time':
@@ -97,6 +100,28 @@ def generate_plot(data, plot_type, title='', xlabel='', ylabel=''):
         plt.grid(True, linestyle='--', alpha=0.7)
         plt.legend()
     
+    elif plot_type == 'simulation_bands':
+        # Simulated prediction interval and median, with the observed percentiles when present
+        times = data['times']
+        bands = data['bands']
+        if 'p05' in bands and 'p95' in bands:
+            plt.fill_between(times, bands['p05'], bands['p95'], alpha=0.3, label='Simulated 5th-95th percentile')
+        if 'median' in bands:
+            plt.plot(times, bands['median'], '-', label='Simulated median')
+        
+        observed = data.get('observed')
+        if observed and observed['times']:
+            for key, style in (('p05', 'r--'), ('median', 'r-'), ('p95', 'r--')):
+                if key in observed:
+                    values = [np.nan if v is None else v for v in observed[key]]
+                    plt.plot(observed['times'], values, style, label=f"Observed {key}")
+        
+        plt.title(title or 'Visual Predictive Check')
+        plt.xlabel(xlabel or 'Time (h)')
+        plt.ylabel(ylabel or 'Concentration (ng/mL)')
+        plt.grid(True, linestyle='--', alpha=0.7)
+        plt.legend()
+    
     # Save plot to bytes buffer
     buf = io.BytesIO()
     plt.tight_layout()
@@ -110,6 +135,9 @@ def generate_plot(data, plot_type, title='', xlabel='', ylabel=''):
 
 def create_table(data, headers=None):
     """Create a table from data."""
+    from reportlab.lib import colors
+    from reportlab.platypus import Table, TableStyle
+    
     if headers:
         table_data = [headers]
     else:
@@ -151,6 +179,11 @@ def generate_report(analysis, report_type='pdf'):
     Returns:
     - Bytes data of the generated report
     """
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, PageBreak
+    from reportlab.lib.units import inch
+    
     # Currently supporting only PDF
     if report_type != 'pdf':
         raise ValueError(f"Unsupported report type: {report_type}")
@@ -456,6 +489,47 @@ def generate_report(analysis, report_type='pdf'):
                     elements.append(create_table(summary_data, headers=['Metric', 'Value']))
                     elements.append(Spacer(1, 0.25*inch))
     
+    elif analysis_type == 'Simulation':
+        elements.append(Paragraph("Population Simulation Results", heading1_style))
+        
+        model_type = parameters.get('model_type', 'Unknown')
+        absorption = parameters.get('absorption', 'Unknown')
+        summary = results.get('summary', {})
+        elements.append(Paragraph(f"Model: {model_type} with {absorption} absorption", body_style))
+        elements.append(Paragraph(f"Virtual Subjects: {summary.get('n_subjects', 'Unknown')} (seed {summary.get('seed', 'Unknown')})", body_style))
+        elements.append(Spacer(1, 0.25*inch))
+        
+        # Population parameters
+        if 'typical' in summary:
+            elements.append(Paragraph("Population Parameters", heading2_style))
+            
+            param_data = []
+            for key, value in summary['typical'].items():
+                param_data.append([key, f"{value:.4g}", f"{summary['cv'].get(key, 0) * 100:.1f}%"])
+            
+            elements.append(create_table(param_data, headers=['Parameter', 'Typical Value', 'CV%']))
+            elements.append(Spacer(1, 0.25*inch))
+        
+        # Simulated exposure
+        if 'exposure' in results:
+            elements.append(Paragraph("Simulated Exposure", heading2_style))
+            
+            exposure_data = []
+            for metric in ('cmax', 'tmax', 'auc'):
+                row = [metric.upper()]
+                for suffix in ('mean', 'geomean', 'p05', 'median', 'p95'):
+                    value = results['exposure'].get(f"{metric}_{suffix}")
+                    row.append(f"{value:.4g}" if value is not None else 'NA')
+                exposure_data.append(row)
+            
+            elements.append(create_table(exposure_data, headers=['Metric', 'Mean', 'Geo. Mean', 'P05', 'Median', 'P95']))
+            elements.append(Spacer(1, 0.25*inch))
+        
+        # Visual predictive check
+        plot_buf = generate_plot(results, 'simulation_bands')
+        img = Image(plot_buf, width=6*inch, height=4*inch)
+        elements.append(img)
+    
     # Build the PDF document
     doc.build(elements)
     
@@ -0,0 +1,181 @@
+import os
+import tempfile
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from pk_tools.profiles import ProfileSet, as_profile_set
+
+# Handoff backends: a POSIX shared memory block, or a file mapped by every process
+BACKENDS = ('shm', 'mmap')
+
+# The ProfileSet a worker attached to in its pool initializer
+_worker_profiles = None
+_worker_handle = None
+
+def _layout(n_subjects, n_samples):
+    """Offsets, times and concentrations packed back to back: (count, start) of each, in int64/float64 items."""
+    return (n_subjects + 1, 0), (n_samples, n_subjects + 1), (n_samples, n_subjects + 1 + n_samples)
+
+def _tracker_id():
+    """Identity of this process's resource tracker: the (device, inode) of the pipe to it."""
+    stat = os.fstat(resource_tracker.getfd())
+    return (stat.st_dev, stat.st_ino)
+
+def _views(buffer, n_subjects, n_samples):
+    (n_offsets, offsets_at), (_, times_at), (_, concentrations_at) = _layout(n_subjects, n_samples)
+    offsets = np.frombuffer(buffer, dtype=np.int64, count=n_offsets, offset=offsets_at * 8)
+    times = np.frombuffer(buffer, dtype=np.float64, count=n_samples, offset=times_at * 8)
+    concentrations = np.frombuffer(buffer, dtype=np.float64, count=n_samples, offset=concentrations_at * 8)
+    return offsets, times, concentrations
+
+class SharedProfileSet:
+    """
+    A ProfileSet placed in memory that other processes can map without copying.
+    
+    The offsets, times and concentrations are written once into a shared
+    memory block (backend 'shm') or a memory-mapped file (backend 'mmap').
+    Worker processes attach with attach_profiles(shared.spec): the spec is a
+    small picklable dict, so handing a dataset to a worker costs the same
+    whatever its size, and workers read the samples in place. Subject IDs
+    travel in the spec, once per worker.
+    
+    The creating process owns the memory and releases it with close(), or by
+    using the object as a context manager.
+    
+    Parameters:
+    - subjects_data: ProfileSet, or dictionary with subject IDs as keys and dicts with
+      'times' and 'concentrations' as values
+    - backend: 'shm' or 'mmap'
+    - directory: Directory of the mapped file with the 'mmap' backend (default: the temp directory)
+    """
+    
+    def __init__(self, subjects_data, backend='shm', directory=None):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend: {backend}. Choose from {', '.join(BACKENDS)}")
+        
+        source = as_profile_set(subjects_data)
+        n_subjects, n_samples = len(source), len(source.times)
+        size = max(8 * (n_subjects + 1 + 2 * n_samples), 1)
+        
+        tracker = None
+        if backend == 'shm':
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+            buffer = self._shm.buf
+            location = self._shm.name
+            tracker = _tracker_id()
+        else:
+            location = os.path.join(directory or tempfile.gettempdir(), f'pk-profiles-{uuid.uuid4().hex}.bin')
+            self._mmap = np.memmap(location, dtype=np.uint8, mode='w+', shape=(size,))
+            buffer = self._mmap
+        
+        offsets, times, concentrations = _views(buffer, n_subjects, n_samples)
+        offsets[:] = source.offsets
+        times[:] = source.times
+        concentrations[:] = source.concentrations
+        
+        self.backend = backend
+        self.spec = {
+            'backend': backend,
+            'location': location,
+            'size': size,
+            'n_subjects': n_subjects,
+            'n_samples': n_samples,
+            'subject_ids': list(source.subject_ids),
+            'tracker': tracker
+        }
+        self.profiles = ProfileSet(self.spec['subject_ids'], offsets, times, concentrations, presorted=True)
+    
+    def close(self):
+        """Release the memory; ProfileSets attached to it must no longer be used."""
+        self.profiles = None
+        if self.backend == 'shm':
+            self._shm.close()
+            self._shm.unlink()
+        else:
+            # The mapping goes with its last view; the file can be removed while still mapped
+            self._mmap = None
+            os.remove(self.spec['location'])
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+def attach_profiles(spec):
+    """
+    Map a SharedProfileSet in this process, without copying its samples.
+    
+    Returns:
+    - tuple: (read-only ProfileSet, handle that must be kept alive while the ProfileSet is in use)
+    """
+    if spec['backend'] == 'shm':
+        handle = shared_memory.SharedMemory(name=spec['location'])
+        buffer = handle.buf
+        # Attaching registers the block with this process's resource tracker, which would unlink it when
+        # this process exits. Processes started by the owner share its tracker, where the registration is
+        # the owner's own and must stay; any other process hands the block back to the owner.
+        if _tracker_id() != tuple(spec.get('tracker') or ()):
+            resource_tracker.unregister(handle._name, 'shared_memory')
+    else:
+        handle = np.memmap(spec['location'], dtype=np.uint8, mode='r', shape=(spec['size'],))
+        buffer = handle
+    
+    offsets, times, concentrations = _views(buffer, spec['n_subjects'], spec['n_samples'])
+    profiles = ProfileSet(spec['subject_ids'], offsets, times, concentrations, presorted=True)
+    return profiles, handle
+
+def subject_ranges(profiles, n_ranges):
+    """
+    Split the subjects into up to n_ranges contiguous (start, stop) ranges with similar sample counts.
+    """
+    n_subjects = len(profiles)
+    if n_subjects == 0:
+        return []
+    
+    n_ranges = max(1, min(n_ranges, n_subjects))
+    # Cut where the cumulative sample count crosses each equal share of the samples
+    targets = np.linspace(0, profiles.offsets[-1], n_ranges + 1)[1:-1]
+    cuts = np.searchsorted(profiles.offsets[1:], targets, side='left') + 1
+    bounds = np.unique(np.concatenate([[0], np.minimum(cuts, n_subjects), [n_subjects]]))
+    return [(int(start), int(stop)) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+def _attach_worker(spec):
+    global _worker_profiles, _worker_handle
+    _worker_profiles, _worker_handle = attach_profiles(spec)
+
+def _run_range(func, start, stop, kwargs):
+    return func(_worker_profiles.subset(start, stop), **kwargs)
+
+def map_subject_ranges(func, subjects_data, workers=None, n_ranges=None, backend='shm', mp_context=None, **kwargs):
+    """
+    Run func over ranges of subjects in a process pool, handing the data over through shared memory.
+    
+    Each worker maps the dataset once when it starts; a task then only
+    carries its (start, stop) subject range. func must be a module-level
+    function taking a ProfileSet and kwargs; its results are pickled back.
+    
+    Parameters:
+    - func: Function of (ProfileSet, **kwargs)
+    - subjects_data: ProfileSet, or dictionary with subject IDs as keys and dicts with
+      'times' and 'concentrations' as values
+    - workers: Number of worker processes (default: the CPU count)
+    - n_ranges: Number of subject ranges (default: four per worker, to balance uneven subjects)
+    - backend: 'shm' or 'mmap'
+    - mp_context: multiprocessing context of the pool (default: the platform default)
+    
+    Returns:
+    - List of func's results, in subject order
+    """
+    workers = workers or os.cpu_count() or 1
+    profiles = as_profile_set(subjects_data)
+    ranges = subject_ranges(profiles, n_ranges or 4 * workers)
+    
+    with SharedProfileSet(profiles, backend=backend) as shared:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context,
+                                 initializer=_attach_worker, initargs=(shared.spec,)) as pool:
+            futures = [pool.submit(_run_range, func, start, stop, kwargs) for start, stop in ranges]
+            return [future.result() for future in futures]
@@ -0,0 +1,248 @@
+import numpy as np
+
+from pk_tools.accumulators import ParameterSummary, TDigest
+from pk_tools.compartmental import (one_compartment_first_order, one_compartment_iv_bolus,
+                                    two_compartment_first_order, two_compartment_iv_bolus)
+from pk_tools.metrics import increment, stage
+
+# Subjects drawn from one random stream; chunks are whole blocks, so a seed gives
+# the same population whatever the chunk size
+BLOCK_SUBJECTS = 1024
+
+def one_compartment_zero_order(t, k0, V, k, tdur):
+    """
+    One-compartment model with zero-order absorption, for broadcast arrays.
+    
+    The same curve as pk_tools.compartmental.one_compartment_zero_order,
+    written without boolean indexing so that per-subject parameter columns
+    broadcast against a row of times.
+    """
+    return (k0 / (V * k)) * (1 - np.exp(-k * np.minimum(t, tdur))) * np.exp(-k * np.maximum(t - tdur, 0))
+
+# (model_type, absorption) -> (model function of (t, dose, **parameters), typical parameter values)
+# Parameters follow the fitted parameterization of pk_tools.compartmental, so the
+# fitted parameters of a compartmental analysis can be simulated directly
+SIMULATION_MODELS = {
+    ('one_compartment', 'iv_bolus'): (
+        lambda t, dose, V, k: one_compartment_iv_bolus(t, V, k),
+        {'V': 0.5, 'k': 0.1}
+    ),
+    ('one_compartment', 'first-order'): (
+        lambda t, dose, ka, V, k: one_compartment_first_order(t, ka, V, k, F=1, D=dose),
+        {'ka': 1.5, 'V': 50.0, 'k': 0.1}
+    ),
+    ('one_compartment', 'zero-order'): (
+        lambda t, dose, k0, V, k, tdur: one_compartment_zero_order(t, k0, V, k, tdur),
+        {'k0': 10.0, 'V': 50.0, 'k': 0.1, 'tdur': 2.0}
+    ),
+    ('two_compartment', 'iv_bolus'): (
+        lambda t, dose, A, alpha, B, beta: two_compartment_iv_bolus(t, A, alpha, B, beta),
+        {'A': 1.5, 'alpha': 0.8, 'B': 0.5, 'beta': 0.05}
+    ),
+    ('two_compartment', 'first-order'): (
+        lambda t, dose, ka, A, alpha, B, beta: two_compartment_first_order(t, ka, A, alpha, B, beta),
+        {'ka': 1.5, 'A': 1.5, 'alpha': 0.8, 'B': 0.5, 'beta': 0.05}
+    )
+}
+
+def get_simulation_model(model_type, absorption):
+    """
+    Return (model function, typical parameter values) for a model/absorption combination.
+    
+    The typical values are a copy and can be modified.
+    """
+    if (model_type, absorption) not in SIMULATION_MODELS:
+        raise ValueError(f"Cannot simulate {model_type} with {absorption} absorption")
+    
+    func, typical = SIMULATION_MODELS[(model_type, absorption)]
+    return func, dict(typical)
+
+def population_from_fits(results, model_type, absorption):
+    """
+    Typical values and between-subject variability of the subjects of a compartmental analysis.
+    
+    Parameters:
+    - results: Results of fit_compartmental_model
+    - model_type: Model type of the analysis
+    - absorption: Absorption type of the analysis
+    
+    Returns:
+    - tuple: (geometric means of the fitted parameters, their geometric CVs as fractions)
+    """
+    _, typical = get_simulation_model(model_type, absorption)
+    names = list(typical)
+    
+    fitted = np.array([
+        result['fitted_parameters'][:len(names)]
+        for subject_id, result in results.items()
+        if subject_id != 'summary' and 'fitted_parameters' in result
+    ], dtype=np.float64)
+    if fitted.size == 0:
+        raise ValueError("The analysis has no fitted subjects")
+    
+    logs = np.log(fitted)
+    log_sd = logs.std(axis=0, ddof=1) if len(fitted) > 1 else np.zeros(len(names))
+    typical = dict(zip(names, np.exp(logs.mean(axis=0)).tolist()))
+    cv = dict(zip(names, np.sqrt(np.exp(log_sd ** 2) - 1).tolist()))
+    return typical, cv
+
+def time_grid(t_max, n_times=100, t_min=0.0):
+    """Evenly spaced simulation times from t_min to t_max."""
+    return np.linspace(t_min, t_max, n_times)
+
+def chunk_subjects(n_times, max_chunk_bytes=32 * 1024 * 1024):
+    """Subjects per chunk that keep the chunk's float64 work arrays under max_chunk_bytes."""
+    # Concentrations, residual draws and model temporaries: about four arrays of chunk x times
+    per_block = BLOCK_SUBJECTS * n_times * 8 * 4
+    return BLOCK_SUBJECTS * max(1, max_chunk_bytes // per_block)
+
+def _draw_chunk(func, typical, omega, times, dose, first_block, n_blocks, n_subjects, seed,
+                proportional_error, additive_error):
+    """Simulate the subjects of blocks [first_block, first_block + n_blocks), as a (subjects x times) array."""
+    names = list(typical)
+    start = first_block * BLOCK_SUBJECTS
+    n_chunk = min(n_blocks * BLOCK_SUBJECTS, n_subjects - start)
+    
+    etas = np.empty((n_chunk, len(names)))
+    eps = np.empty((n_chunk, len(times), 2))
+    for b in range(n_blocks):
+        lo = b * BLOCK_SUBJECTS
+        hi = min(lo + BLOCK_SUBJECTS, n_chunk)
+        if lo >= hi:
+            break
+        rng = np.random.default_rng([seed, first_block + b])
+        etas[lo:hi] = rng.standard_normal((hi - lo, len(names)))
+        eps[lo:hi] = rng.standard_normal((hi - lo, len(times), 2))
+    
+    # Log-normal between-subject variability: one column of parameter values per subject
+    params = {
+        name: typical[name] * np.exp(omega[i] * etas[:, i:i + 1])
+        for i, name in enumerate(names)
+    }
+    if 'ka' in params and 'k' in params:
+        # Keep ka and k apart so the first-order absorption model stays defined
+        params['ka'] = np.maximum(params['ka'], params['k'] * 1.01)
+    
+    with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+        concentrations = func(times[None, :], dose, **params)
+    concentrations = np.nan_to_num(concentrations, nan=0.0, posinf=0.0, neginf=0.0)
+    
+    # Combined proportional and additive residual error
+    if proportional_error:
+        concentrations *= 1 + proportional_error * eps[:, :, 0]
+    if additive_error:
+        concentrations += additive_error * eps[:, :, 1]
+    return concentrations
+
+def simulate_population(model_type, absorption, times, n_subjects=1000, dose=1, typical=None, cv=0.3,
+                        proportional_error=0.1, additive_error=0.0, lloq=None, percentiles=(5, 50, 95),
+                        n_profiles=20, seed=0, max_chunk_bytes=32 * 1024 * 1024):
+    """
+    Simulate a virtual population from a compartmental model.
+    
+    Subjects are evaluated in chunks of whole (subjects x times) arrays, so
+    memory stays bounded by max_chunk_bytes however many subjects are
+    simulated. Each chunk is folded into streaming accumulators (a t-digest
+    and running sums per time point, ParameterSummary per exposure metric)
+    and then discarded.
+    
+    Parameters:
+    - model_type: 'one_compartment' or 'two_compartment'
+    - absorption: 'iv_bolus', 'first-order' or 'zero-order'
+    - times: Simulation times
+    - n_subjects: Number of virtual subjects
+    - dose: Dose, for the models that take it (first-order one-compartment)
+    - typical: Typical parameter values; missing ones use the model defaults
+    - cv: Between-subject CV (fraction) of every parameter, or a dict per parameter
+    - proportional_error: Standard deviation of the proportional residual error
+    - additive_error: Standard deviation of the additive residual error
+    - lloq: Lower limit of quantification; lower simulated values are reported as 0
+    - percentiles: Percentiles of the prediction bands (50 is reported as 'median')
+    - n_profiles: Number of individual profiles kept for plotting
+    - seed: Random seed; the same seed always gives the same population
+    - max_chunk_bytes: Memory budget of one chunk
+    
+    Returns:
+    - Dictionary with the times, the percentile bands, mean and (with lloq) fraction
+      below LLOQ per time, summaries of Cmax, Tmax and AUC, the first n_profiles
+      profiles, and a 'summary' of the run
+    """
+    func, model_typical = get_simulation_model(model_type, absorption)
+    model_typical.update({name: float(value) for name, value in (typical or {}).items() if name in model_typical})
+    typical = model_typical
+    
+    if not isinstance(cv, dict):
+        cv = {name: cv for name in typical}
+    omega = np.array([np.sqrt(np.log(1 + float(cv.get(name, 0.0)) ** 2)) for name in typical])
+    
+    times = np.asarray(times, dtype=np.float64)
+    n_subjects = int(n_subjects)
+    if n_subjects < 1 or times.size == 0:
+        raise ValueError("At least one subject and one time point are required")
+    
+    chunk_size = chunk_subjects(len(times), max_chunk_bytes)
+    blocks_per_chunk = chunk_size // BLOCK_SUBJECTS
+    n_blocks = -(-n_subjects // BLOCK_SUBJECTS)
+    
+    digests = [TDigest() for _ in times]
+    total = np.zeros(len(times))
+    below = np.zeros(len(times))
+    exposure = {'cmax': ParameterSummary(), 'tmax': ParameterSummary(), 'auc': ParameterSummary()}
+    half_steps = np.diff(times) / 2
+    profiles = []
+    n_chunks = 0
+    
+    for first_block in range(0, n_blocks, blocks_per_chunk):
+        with stage('simulate'):
+            concentrations = _draw_chunk(func, typical, omega, times, dose, first_block,
+                                         min(blocks_per_chunk, n_blocks - first_block), n_subjects, seed,
+                                         proportional_error, additive_error)
+            if lloq is not None:
+                censored = concentrations < lloq
+                below += censored.sum(axis=0)
+                concentrations[censored] = 0.0
+        
+        with stage('quantiles'):
+            for j, digest in enumerate(digests):
+                digest.add_many(concentrations[:, j])
+            total += concentrations.sum(axis=0)
+            
+            exposure['cmax'].add_many(concentrations.max(axis=1))
+            exposure['tmax'].add_many(times[np.argmax(concentrations, axis=1)])
+            # Linear trapezoidal AUC over the simulation grid
+            exposure['auc'].add_many((concentrations[:, 1:] + concentrations[:, :-1]) @ half_steps)
+        
+        if len(profiles) < n_profiles:
+            profiles.extend(concentrations[:n_profiles - len(profiles)].tolist())
+        
+        increment('simulated_subjects', len(concentrations))
+        n_chunks += 1
+        del concentrations
+    
+    bands = {
+        'median' if p == 50 else f'p{p:02d}': [digest.quantile(p / 100) for digest in digests]
+        for p in percentiles
+    }
+    
+    results = {
+        'times': times.tolist(),
+        'bands': bands,
+        'mean': (total / n_subjects).tolist(),
+        'exposure': {},
+        'profiles': {f'SIM{i + 1:04d}': profile for i, profile in enumerate(profiles)},
+        'summary': {
+            'n_subjects': n_subjects,
+            'n_times': len(times),
+            'chunk_subjects': chunk_size,
+            'chunks': n_chunks,
+            'seed': seed,
+            'typical': typical,
+            'cv': {name: float(cv.get(name, 0.0)) for name in typical}
+        }
+    }
+    if lloq is not None:
+        results['below_lloq'] = (below / n_subjects).tolist()
+    for name, accumulator in exposure.items():
+        results['exposure'].update(accumulator.as_dict(name))
+    
+    return results
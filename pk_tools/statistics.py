@@ -1,48 +1,70 @@
 import numpy as np
-import scipy.stats as stats
-import pandas as pd
+
+from pk_tools.profiles import as_profile_set
+
+def values_at_times(profiles):
+    """
+    Concentrations of every subject at every distinct sampling time.
+    
+    Parameters:
+    - profiles: ProfileSet
+    
+    Returns:
+    - tuple: (sorted distinct times, subjects x times array of concentrations,
+      boolean array of where a subject has a sample at that time); where a
+      subject has several samples at one time, the first is used
+    """
+    times = np.unique(profiles.times)
+    values = np.full((len(profiles), len(times)), np.nan)
+    present = np.zeros((len(profiles), len(times)), dtype=bool)
+    
+    for i, profile in enumerate(profiles.subjects()):
+        if len(profile.times) == 0:
+            continue
+        # Each subject is sorted by time, so the left insertion point is its first sample at that time
+        idx = np.searchsorted(profile.times, times)
+        found = profile.times[np.minimum(idx, len(profile.times) - 1)] == times
+        values[i, found] = profile.concentrations[idx[found]]
+        present[i] = found
+    
+    return times, values, present
 
 def perform_statistical_analysis(subjects_data, stat_type='ttest', alpha=0.05):
     """
     Perform statistical analysis on PK data.
     
     Parameters:
-    - subjects_data: Dictionary with subject IDs as keys and dicts with 'times' and 'concentrations' as values
+    - subjects_data: ProfileSet, or dictionary with subject IDs as keys and dicts with
+      'times' and 'concentrations' as values
     - stat_type: Type of statistical test to perform ('ttest', 'anova', 'regression')
     - alpha: Significance level
     
     Returns:
     - Dictionary with statistical results
     """
+    import scipy.stats as stats
+    
     results = {}
     
     # Extract data
-    subject_ids = list(subjects_data.keys())
+    profiles = as_profile_set(subjects_data)
+    subject_ids = list(profiles.keys())
     
     if stat_type == 'ttest':
         # Perform t-test at each time point where data exists for all subjects
         
         # Find common time points
-        all_times = set()
-        for subject_id in subject_ids:
-            all_times.update(subjects_data[subject_id]['times'])
-        
-        common_times = []
-        for time in sorted(all_times):
-            # Check if all subjects have this time point
-            if all(time in subjects_data[subject_id]['times'] for subject_id in subject_ids):
-                common_times.append(time)
+        all_times, values, present = values_at_times(profiles)
+        common = np.flatnonzero(present.all(axis=0)) if subject_ids else np.empty(0, dtype=int)
         
-        if len(common_times) < 2:
+        if len(common) < 2:
             return {'error': 'Insufficient common time points for t-test analysis'}
         
         # Perform t-test for each time point
         time_results = {}
-        for time in common_times:
-            concentrations = []
-            for subject_id in subject_ids:
-                time_idx = subjects_data[subject_id]['times'].index(time)
-                concentrations.append(subjects_data[subject_id]['concentrations'][time_idx])
+        for j in common:
+            time = all_times[j].item()
+            concentrations = values[:, j]
             
             # Calculate statistics
             mean_conc = np.mean(concentrations)
@@ -72,34 +94,23 @@ def perform_statistical_analysis(subjects_data, stat_type='ttest', alpha=0.05):
             }
         
         results['time_results'] = time_results
-        
+    
     elif stat_type == 'anova':
         # Perform one-way ANOVA across subjects at each time point
         
-        # Find common time points
-        all_times = set()
-        for subject_id in subject_ids:
-            all_times.update(subjects_data[subject_id]['times'])
-        
-        common_times = []
-        for time in sorted(all_times):
-            # Check if at least 3 subjects have this time point (minimum for ANOVA)
-            subjects_with_time = sum(1 for subject_id in subject_ids if time in subjects_data[subject_id]['times'])
-            if subjects_with_time >= 3:
-                common_times.append(time)
+        # Find time points with at least 3 subjects (minimum for ANOVA)
+        all_times, values, present = values_at_times(profiles)
+        common = np.flatnonzero(present.sum(axis=0) >= 3)
         
-        if len(common_times) < 1:
+        if len(common) < 1:
             return {'error': 'Insufficient common time points for ANOVA analysis'}
         
         # Perform ANOVA for each time point
         time_results = {}
-        for time in common_times:
+        for j in common:
+            time = all_times[j].item()
             # Group concentrations by subject
-            groups = []
-            for subject_id in subject_ids:
-                if time in subjects_data[subject_id]['times']:
-                    time_idx = subjects_data[subject_id]['times'].index(time)
-                    groups.append([subjects_data[subject_id]['concentrations'][time_idx]])
+            groups = [[value] for value in values[present[:, j], j]]
             
             # Perform one-way ANOVA
             f_stat, p_value = stats.f_oneway(*groups)
@@ -121,14 +132,15 @@ def perform_statistical_analysis(subjects_data, stat_type='ttest', alpha=0.05):
             }
         
         results['time_results'] = time_results
-        
+    
     elif stat_type == 'regression':
         # Perform linear regression for each subject
         
         regression_results = {}
-        for subject_id in subject_ids:
-            times = np.array(subjects_data[subject_id]['times'])
-            concentrations = np.array(subjects_data[subject_id]['concentrations'])
+        for profile in profiles.subjects():
+            subject_id = profile.subject_id
+            times = profile.times
+            concentrations = profile.concentrations
             
             # Filter out non-positive concentrations for log transformation
             valid_idx = concentrations > 0
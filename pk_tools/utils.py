@@ -1,5 +1,227 @@
+import json
+
 import numpy as np
-import pandas as pd
+
+from pk_tools.profiles import ProfileSet, flatten_subjects, unflatten_subjects
+
+# Required columns of an uploaded dataset
+REQUIRED_COLUMNS = ['subject_id', 'time', 'concentration']
+
+# Concentration entries meaning "below the limit of quantification"
+BLQ_MARKERS = {'blq', 'bql', 'bloq', 'lloq', '<lloq', '<loq', 'nd', 'n.d.'}
+
+# Maximum number of example rows/subjects listed per validation issue
+MAX_REPORTED_ROWS = 20
+
+# Order in which validation issues are reported
+VALIDATION_CHECKS = [
+    'missing_columns', 'missing_subject_id', 'non_numeric_time', 'blq_concentration',
+    'non_numeric_concentration', 'negative_time', 'negative_concentration', 'too_few_points',
+    'missing_time', 'missing_concentration', 'duplicate_time', 'unsorted_time'
+]
+
+def _numeric_column(values):
+    """Return a column as a float array plus a mask of cells that are present but not numeric."""
+    import pandas as pd
+    
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        return values.to_numpy(dtype=np.float64), np.zeros(len(values), dtype=bool)
+    
+    numeric = pd.to_numeric(values, errors='coerce')
+    invalid = numeric.isna().to_numpy() & values.notna().to_numpy()
+    return numeric.to_numpy(dtype=np.float64), invalid
+
+class DatasetValidator:
+    """
+    Collect every validation issue of a PK dataset.
+    
+    Feed the data with validate_chunk(), either as one DataFrame or as
+    consecutive chunks of a streamed file, then call report(). Each chunk is
+    checked with vectorized column operations and is never modified.
+    Row numbers in the report are 1-based data rows (the header is not counted).
+    """
+    
+    def __init__(self, min_points=3):
+        self.min_points = min_points
+        self.n_rows = 0
+        self.missing_columns = None
+        self._issues = {}
+        self._subject_codes = {}
+        self._counts = np.zeros(0, dtype=np.int64)
+        self._last_code = -1
+        self._last_time = np.nan
+        self._keys = []
+    
+    def _add_issue(self, level, check, message, rows):
+        rows = np.flatnonzero(rows) + self.n_rows + 1 if rows.dtype == bool else rows
+        if len(rows) == 0:
+            return
+        
+        issue = self._issues.setdefault(check, {
+            'level': level,
+            'check': check,
+            'message': message,
+            'count': 0,
+            'rows': []
+        })
+        issue['count'] += len(rows)
+        issue['rows'].extend(int(r) for r in rows[:MAX_REPORTED_ROWS - len(issue['rows'])])
+    
+    def validate_chunk(self, df):
+        """Check the next chunk of rows."""
+        import pandas as pd
+        
+        if self.missing_columns is None:
+            self.missing_columns = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+        if self.missing_columns:
+            self.n_rows += len(df)
+            return
+        
+        subject_codes, subject_ids = pd.factorize(df['subject_id'])
+        times, invalid_times = _numeric_column(df['time'])
+        concentrations, invalid_concs = _numeric_column(df['concentration'])
+        
+        # Non-numeric cells, with BLQ markers reported separately
+        blq = np.zeros(len(df), dtype=bool)
+        if invalid_concs.any():
+            markers = df['concentration'][invalid_concs].astype(str).str.strip().str.lower()
+            blq[invalid_concs] = markers.isin(BLQ_MARKERS).to_numpy()
+        
+        self._add_issue('error', 'missing_subject_id', "Subject ID is missing", subject_codes < 0)
+        self._add_issue('error', 'non_numeric_time', "Time values must be numeric", invalid_times)
+        self._add_issue('error', 'blq_concentration',
+                        "Concentrations reported below the limit of quantification must be replaced with numeric values",
+                        blq)
+        self._add_issue('error', 'non_numeric_concentration', "Concentration values must be numeric",
+                        invalid_concs & ~blq)
+        self._add_issue('error', 'negative_time', "Time values cannot be negative", times < 0)
+        self._add_issue('error', 'negative_concentration', "Concentration values cannot be negative",
+                        concentrations < 0)
+        # Samples are stored with a time, so rows without one cannot be imported
+        self._add_issue('error', 'missing_time', "Time values are missing",
+                        np.isnan(times) & ~invalid_times)
+        self._add_issue('warning', 'missing_concentration', "Concentration values are missing",
+                        np.isnan(concentrations) & ~invalid_concs)
+        
+        # Map chunk-local subject codes to codes that are stable across chunks
+        code_map = np.array([self._subject_codes.setdefault(s, len(self._subject_codes)) for s in subject_ids],
+                            dtype=np.int64)
+        codes = np.where(subject_codes >= 0, code_map[subject_codes] if len(code_map) else -1, -1)
+        
+        if len(self._counts) < len(self._subject_codes):
+            self._counts = np.concatenate([self._counts, np.zeros(len(self._subject_codes) - len(self._counts),
+                                                                  dtype=np.int64)])
+        self._counts += np.bincount(codes[codes >= 0], minlength=len(self._counts))
+        
+        # Times going backwards within a subject, including across the chunk boundary
+        if len(df):
+            previous_codes = np.concatenate(([self._last_code], codes[:-1]))
+            previous_times = np.concatenate(([self._last_time], times[:-1]))
+            self._add_issue('warning', 'unsorted_time', "Times are not in ascending order within subject",
+                            (codes >= 0) & (codes == previous_codes) & (times < previous_times))
+            self._last_code = codes[-1]
+            self._last_time = times[-1]
+        
+        # Keep the (subject, time) keys for the duplicate check in report()
+        keyed = (codes >= 0) & ~np.isnan(times)
+        self._keys.append((codes[keyed], times[keyed], np.flatnonzero(keyed) + self.n_rows + 1))
+        
+        self.n_rows += len(df)
+    
+    def report(self):
+        """
+        Return the structured validation report.
+        
+        Returns:
+        - Dictionary with 'valid', 'n_rows', 'n_subjects', and 'errors'/'warnings' lists. Each
+          issue has 'check', 'message', 'count' and example 'rows' (or 'subjects')
+        """
+        issues = dict(self._issues)
+        
+        if self.missing_columns:
+            issues = {'missing_columns': {
+                'level': 'error',
+                'check': 'missing_columns',
+                'message': f"Missing required columns: {', '.join(self.missing_columns)}",
+                'count': len(self.missing_columns),
+                'rows': []
+            }}
+        else:
+            self._check_duplicates(issues)
+            
+            # Subjects with too few time points
+            subject_ids = np.array(list(self._subject_codes), dtype=object)
+            too_few = subject_ids[self._counts < self.min_points] if len(subject_ids) else subject_ids
+            if len(too_few):
+                issues['too_few_points'] = {
+                    'level': 'error',
+                    'check': 'too_few_points',
+                    'message': f"These subjects have fewer than {self.min_points} time points",
+                    'count': len(too_few),
+                    'subjects': [str(s) for s in too_few[:MAX_REPORTED_ROWS]]
+                }
+        
+        ordered = [issues[check] for check in VALIDATION_CHECKS if check in issues]
+        errors = [issue for issue in ordered if issue['level'] == 'error']
+        warnings = [issue for issue in ordered if issue['level'] == 'warning']
+        
+        return {
+            'valid': not errors,
+            'n_rows': self.n_rows,
+            'n_subjects': len(self._subject_codes),
+            'errors': errors,
+            'warnings': warnings
+        }
+    
+    def _check_duplicates(self, issues):
+        if not self._keys:
+            return
+        
+        codes = np.concatenate([k[0] for k in self._keys])
+        times = np.concatenate([k[1] for k in self._keys])
+        rows = np.concatenate([k[2] for k in self._keys])
+        
+        order = np.lexsort((rows, times, codes))
+        codes, times, rows = codes[order], times[order], rows[order]
+        duplicate = np.zeros(len(rows), dtype=bool)
+        duplicate[1:] = (codes[1:] == codes[:-1]) & (times[1:] == times[:-1])
+        
+        if duplicate.any():
+            duplicate_rows = np.sort(rows[duplicate])
+            issues['duplicate_time'] = {
+                'level': 'warning',
+                'check': 'duplicate_time',
+                'message': "Subject has more than one sample at the same time",
+                'count': len(duplicate_rows),
+                'rows': duplicate_rows[:MAX_REPORTED_ROWS].tolist()
+            }
+
+def validate_dataset_report(df, min_points=3):
+    """
+    Validate a DataFrame for PK analysis and collect every issue.
+    
+    Parameters:
+    - df: Pandas DataFrame to validate (not modified)
+    - min_points: Minimum number of time points per subject
+    
+    Returns:
+    - Validation report dictionary (see DatasetValidator.report)
+    """
+    validator = DatasetValidator(min_points=min_points)
+    validator.validate_chunk(df)
+    return validator.report()
+
+def format_validation_issue(issue):
+    """Format a validation issue as a one-line message with example rows or subjects."""
+    if issue.get('subjects'):
+        return f"{issue['message']}: {', '.join(issue['subjects'])}"
+    
+    if issue['rows']:
+        rows = ', '.join(map(str, issue['rows']))
+        more = f" and {issue['count'] - len(issue['rows'])} more" if issue['count'] > len(issue['rows']) else ''
+        return f"{issue['message']} (rows {rows}{more})"
+    
+    return issue['message']
 
 def validate_dataset(df):
     """
@@ -11,88 +233,108 @@ def validate_dataset(df):
     Returns:
     - tuple: (is_valid, message)
     """
-    # Check required columns
-    required_columns = ['subject_id', 'time', 'concentration']
-    missing_columns = [col for col in required_columns if col not in df.columns]
+    report = validate_dataset_report(df)
     
-    if missing_columns:
-        return False, f"Missing required columns: {', '.join(missing_columns)}"
+    if not report['valid']:
+        return False, '; '.join(format_validation_issue(issue) for issue in report['errors'])
     
-    # Check data types
-    try:
-        df['time'] = pd.to_numeric(df['time'])
-        df['concentration'] = pd.to_numeric(df['concentration'])
-    except ValueError:
-        return False, "Time and concentration must be numeric"
+    return True, "Dataset is valid"
+
+def json_default(obj):
+    """Convert NumPy values the standard json module cannot encode."""
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def to_json(obj):
+    """
+    Serialize analysis results to a JSON string for storage.
+    
+    NumPy scalars and arrays are converted to plain numbers and lists; NaN
+    and infinity are kept as the json module writes them, so stored results
+    load back unchanged.
+    """
+    return json.dumps(obj, default=json_default)
+
+def _log_transform(concentrations, offsets):
+    # Replace zeros or negative values with a small positive value
+    return np.log(np.where(concentrations <= 0, 1e-10, concentrations))
+
+def _sqrt_transform(concentrations, offsets):
+    # Replace negative values with zero
+    return np.sqrt(np.where(concentrations < 0, 0, concentrations))
+
+def _normalize_transform(concentrations, offsets):
+    # Normalize each subject to the 0-1 range
+    lengths = np.diff(offsets)
+    starts = offsets[:-1][lengths > 0]
+    if starts.size == 0:
+        return concentrations.copy()
     
-    # Check for negative values
-    if (df['time'] < 0).any():
-        return False, "Time values cannot be negative"
+    min_vals = np.repeat(np.minimum.reduceat(concentrations, starts), lengths[lengths > 0])
+    max_vals = np.repeat(np.maximum.reduceat(concentrations, starts), lengths[lengths > 0])
     
-    if (df['concentration'] < 0).any():
-        return False, "Concentration values cannot be negative"
+    # Subjects with a flat profile are left unchanged
+    scale = np.where(max_vals > min_vals, max_vals - min_vals, 1.0)
+    shift = np.where(max_vals > min_vals, min_vals, 0.0)
+    return (concentrations - shift) / scale
+
+def _inverse_transform(concentrations, offsets):
+    # Replace zeros with a small value to avoid division by zero
+    return 1.0 / np.where(concentrations == 0, 1e-10, concentrations)
+
+TRANSFORMATIONS = {
+    'log': _log_transform,
+    'sqrt': _sqrt_transform,
+    'normalize': _normalize_transform,
+    'inverse': _inverse_transform
+}
+
+def apply_transformations(concentrations, offsets, transformations):
+    """
+    Apply a chain of transformations to flat concentration arrays.
     
-    # Check that each subject has at least 3 time points
-    counts = df['subject_id'].value_counts()
-    invalid_subjects = counts[counts < 3].index.tolist()
+    Parameters:
+    - concentrations: Flat concentration array (see flatten_subjects)
+    - offsets: Subject offsets into the flat array
+    - transformations: Sequence of transformation names, applied in order
     
-    if invalid_subjects:
-        return False, f"These subjects have fewer than 3 time points: {', '.join(map(str, invalid_subjects))}"
+    Returns:
+    - New array with transformed concentrations
+    """
+    for transformation in transformations:
+        if transformation not in TRANSFORMATIONS:
+            raise ValueError(f"Unknown transformation: {transformation}")
     
-    return True, "Dataset is valid"
+    transformed = concentrations
+    for transformation in transformations:
+        transformed = TRANSFORMATIONS[transformation](transformed, offsets)
+    
+    return transformed
 
 def transform_data(subjects_data, transformation='log'):
     """
     Apply transformation to concentration data.
     
     Parameters:
-    - subjects_data: Dictionary with subject IDs as keys and dicts with 'times' and 'concentrations' as values
-    - transformation: Type of transformation to apply ('log', 'sqrt', 'normalize')
+    - subjects_data: ProfileSet, or dictionary with subject IDs as keys and dicts with
+      'times' and 'concentrations' as values
+    - transformation: Type of transformation to apply ('log', 'sqrt', 'normalize', 'inverse'),
+      or a sequence of them to apply in order
     
     Returns:
-    - Dictionary with transformed data
+    - Transformed data, as a ProfileSet if one was given and as a dictionary otherwise
     """
-    transformed = {}
+    transformations = [transformation] if isinstance(transformation, str) else list(transformation)
     
-    for subject_id, data in subjects_data.items():
-        times = data['times']
-        concentrations = data['concentrations']
-        
-        # Make a copy of the data
-        transformed_concentrations = np.array(concentrations).copy()
-        
-        if transformation == 'log':
-            # Replace zeros or negative values with a small positive value
-            transformed_concentrations[transformed_concentrations <= 0] = 1e-10
-            transformed_concentrations = np.log(transformed_concentrations)
-        
-        elif transformation == 'sqrt':
-            # Replace negative values with zero
-            transformed_concentrations[transformed_concentrations < 0] = 0
-            transformed_concentrations = np.sqrt(transformed_concentrations)
-        
-        elif transformation == 'normalize':
-            # Normalize to 0-1 range
-            min_val = np.min(transformed_concentrations)
-            max_val = np.max(transformed_concentrations)
-            
-            if max_val > min_val:
-                transformed_concentrations = (transformed_concentrations - min_val) / (max_val - min_val)
-        
-        elif transformation == 'inverse':
-            # Replace zeros with a small value to avoid division by zero
-            transformed_concentrations[transformed_concentrations == 0] = 1e-10
-            transformed_concentrations = 1.0 / transformed_concentrations
-        
-        else:
-            raise ValueError(f"Unknown transformation: {transformation}")
-        
-        transformed[subject_id] = {
-            'times': times,
-            'concentrations': transformed_concentrations.tolist()
-        }
+    subject_ids, offsets, times, concentrations = flatten_subjects(subjects_data)
+    transformed = apply_transformations(concentrations, offsets, transformations)
     
-    return transformed
+    if isinstance(subjects_data, ProfileSet):
+        return ProfileSet(subject_ids, offsets, times, transformed, presorted=True)
+    return unflatten_subjects(subject_ids, offsets, times, transformed)
 
 def merge_datasets(dataset1, dataset2):
     """
@@ -103,43 +345,35 @@ def merge_datasets(dataset1, dataset2):
     - dataset2: Dictionary with subject IDs as keys and dicts with 'times' and 'concentrations' as values
     
     Returns:
-    - Dictionary with merged data
+    - Dictionary with merged data; where both datasets have a sample at the same
+      time, the one from dataset1 is kept
     """
-    merged = {}
-    
     # Find common subject IDs
-    common_subjects = set(dataset1.keys()) & set(dataset2.keys())
-    
-    for subject_id in common_subjects:
-        times1 = dataset1[subject_id]['times']
-        conc1 = dataset1[subject_id]['concentrations']
-        
-        times2 = dataset2[subject_id]['times']
-        conc2 = dataset2[subject_id]['concentrations']
-        
-        # Combine times and concentrations
-        all_times = []
-        all_conc = []
-        
-        # Add data from dataset1, avoiding duplicates
-        for t1, c1 in zip(times1, conc1):
-            all_times.append(t1)
-            all_conc.append(c1)
-        
-        # Add data from dataset2, avoiding duplicates
-        for t2, c2 in zip(times2, conc2):
-            if t2 not in times1:
-                all_times.append(t2)
-                all_conc.append(c2)
-        
-        # Sort by time
-        sorted_idx = np.argsort(all_times)
-        sorted_times = [all_times[i] for i in sorted_idx]
-        sorted_conc = [all_conc[i] for i in sorted_idx]
-        
-        merged[subject_id] = {
-            'times': sorted_times,
-            'concentrations': sorted_conc
-        }
+    common_subjects = [subject_id for subject_id in dataset1 if subject_id in dataset2]
+    
+    _, offsets1, times1, conc1 = flatten_subjects({s: dataset1[s] for s in common_subjects})
+    _, offsets2, times2, conc2 = flatten_subjects({s: dataset2[s] for s in common_subjects})
+    
+    subject_index = np.arange(len(common_subjects))
+    codes = np.concatenate([np.repeat(subject_index, np.diff(offsets1)),
+                            np.repeat(subject_index, np.diff(offsets2))])
+    source = np.concatenate([np.zeros(len(times1), dtype=np.int8), np.ones(len(times2), dtype=np.int8)])
+    times = np.concatenate([times1, times2])
+    concentrations = np.concatenate([conc1, conc2])
+    
+    # Sort on (subject, time); on equal keys dataset1 rows come first
+    order = np.lexsort((source, times, codes))
+    codes = codes[order]
+    source = source[order]
+    times = times[order]
+    concentrations = concentrations[order]
+    
+    # Merge-join: a dataset2 row is dropped when its key run starts with a dataset1 row
+    new_key = np.ones(len(codes), dtype=bool)
+    new_key[1:] = (codes[1:] != codes[:-1]) | (times[1:] != times[:-1])
+    key_source = source[new_key][np.cumsum(new_key) - 1]
+    keep = (source == 0) | (key_source == 1)
+    
+    offsets = np.searchsorted(codes[keep], np.arange(len(common_subjects) + 1))
     
-    return merged
+    return unflatten_subjects(common_subjects, offsets, times[keep], concentrations[keep])
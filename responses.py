@@ -0,0 +1,218 @@
+import gzip
+import hashlib
+import json
+
+import numpy as np
+from flask import current_app, request, Response
+
+from pk_tools.cache import ResultCache
+from pk_tools.utils import json_default
+
+# Optional faster encoders and compressors
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+def init_responses(app):
+    """Create the app's response cache, sized from the app config."""
+    # Serialized API payloads keyed by endpoint, object version and query arguments
+    app.extensions['response_cache'] = ResultCache(
+        max_entries=app.config['RESPONSE_CACHE_SIZE'],
+        max_bytes=app.config['RESPONSE_CACHE_MAX_BYTES']
+    )
+
+def get_response_cache():
+    return current_app.extensions['response_cache']
+
+def to_json_bytes(obj):
+    """
+    Serialize an API payload to UTF-8 JSON bytes.
+    
+    Uses orjson when it is installed, which encodes NumPy arrays natively and
+    writes NaN as null; otherwise falls back to the json module.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=json_default,
+                            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=json_default, separators=(',', ':')).encode('utf-8')
+
+# Binary plot payload: magic, uint32 header length, JSON header, then a little-endian float buffer
+BINARY_MAGIC = b'PKB1'
+BINARY_DTYPES = {'float32': '<f4', 'float64': '<f8'}
+
+def _is_number(value):
+    return value is None or (isinstance(value, (int, float, np.number)) and not isinstance(value, (bool, np.bool_)))
+
+def to_binary_bytes(payload, dtype='float32'):
+    """
+    Serialize a payload with its numeric arrays moved into one binary buffer.
+    
+    Every list of numbers (and every list of equal-length number lists, such
+    as [time, concentration] pairs) is replaced in the JSON structure by
+    {"$array": i}, where i indexes the header's "arrays" table of element
+    offsets, lengths and shapes into the buffer. None becomes NaN.
+    
+    Layout:
+    - 4 bytes: b'PKB1'
+    - 4 bytes: header length as little-endian uint32
+    - header: UTF-8 JSON {"dtype", "arrays", "payload"}, space padded so the buffer starts 8-byte aligned
+    - buffer: little-endian float32 or float64 values
+    
+    Parameters:
+    - payload: JSON-serializable payload
+    - dtype: 'float32' or 'float64'
+    
+    Returns:
+    - bytes
+    """
+    if dtype not in BINARY_DTYPES:
+        raise ValueError(f"Unsupported binary dtype: {dtype}")
+    
+    chunks = []
+    arrays = []
+    offset = 0
+    
+    def add_array(values, shape=None):
+        nonlocal offset
+        array = np.asarray(values, dtype=np.float64).astype(BINARY_DTYPES[dtype]).ravel()
+        entry = {'offset': offset, 'length': int(array.size)}
+        if shape is not None:
+            entry['shape'] = list(shape)
+        chunks.append(array.tobytes())
+        arrays.append(entry)
+        offset += array.size
+        return {'$array': len(arrays) - 1}
+    
+    def pack(obj):
+        if isinstance(obj, dict):
+            return {str(k): pack(v) for k, v in obj.items()}
+        if isinstance(obj, np.ndarray) and obj.dtype.kind in 'iuf' and obj.ndim in (1, 2):
+            return add_array(obj, obj.shape if obj.ndim == 2 else None)
+        if isinstance(obj, (list, tuple)) and obj:
+            if all(_is_number(v) for v in obj):
+                return add_array([np.nan if v is None else v for v in obj])
+            if (all(isinstance(v, (list, tuple)) and len(v) == len(obj[0]) and len(v) > 0 for v in obj) and
+                    all(_is_number(x) for v in obj for x in v)):
+                return add_array([[np.nan if x is None else x for x in v] for v in obj], (len(obj), len(obj[0])))
+            return [pack(v) for v in obj]
+        if isinstance(obj, np.generic):
+            return obj.item()
+        return obj
+    
+    header = to_json_bytes({'dtype': dtype, 'arrays': arrays, 'payload': pack(payload)})
+    header += b' ' * (-(8 + len(header)) % 8)
+    
+    return BINARY_MAGIC + np.uint32(len(header)).astype('<u4').tobytes() + header + b''.join(chunks)
+
+def object_version(obj):
+    """Version tag of a dataset or analysis; rows are immutable once created, so ID and creation time identify them."""
+    created_at = obj.created_at.isoformat() if obj.created_at else ''
+    return f"{obj.id}:{created_at}"
+
+def _compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=current_app.config['RESPONSE_GZIP_LEVEL'])
+
+def _entry_size(entry):
+    """Bytes of a response cache entry: the identity body and every compressed variant."""
+    return sum(len(value) for name, value in entry.items() if name != 'etag')
+
+def _negotiate_encoding(size):
+    """Pick the best content encoding the client accepts, or None for identity."""
+    if size < current_app.config['RESPONSE_COMPRESS_MIN_BYTES']:
+        return None
+    
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+def cached_json_response(kind, obj, build_payload):
+    """Serve a payload as JSON with cached_response."""
+    return cached_response(kind, obj, build_payload, to_json_bytes, 'application/json')
+
+def cached_plot_response(kind, obj, build_payload, default_dtype='float32'):
+    """
+    Serve a plot-data payload as JSON, or in the binary layout of
+    to_binary_bytes when the request has format=binary (with dtype=float32
+    or float64, default_dtype when the request does not say).
+    
+    float32 suits payloads that only hold plotted series; payloads that also
+    carry values shown as numbers (fitted parameters, summary tables) should
+    default to float64 so they keep their precision.
+    """
+    if request.args.get('format') != 'binary':
+        return cached_json_response(kind, obj, build_payload)
+    
+    dtype = request.args.get('dtype', default_dtype)
+    if dtype not in BINARY_DTYPES:
+        return Response(to_json_bytes({'success': False, 'error': f'Unsupported binary dtype: {dtype}'}),
+                        status=400, mimetype='application/json')
+    
+    return cached_response(kind, obj, build_payload, lambda payload: to_binary_bytes(payload, dtype),
+                           'application/octet-stream')
+
+def cached_response(kind, obj, build_payload, serialize, mimetype):
+    """
+    Serve a payload serialized once per object version.
+    
+    The payload is built and serialized on the first request for a given
+    endpoint, object version and query string; later requests reuse the
+    stored bytes (and their compressed variants). Responses carry a strong
+    ETag, and a matching If-None-Match is answered with 304 Not Modified.
+    
+    Parameters:
+    - kind: Name of the endpoint, part of the cache key
+    - obj: Dataset or Analysis the payload is built from
+    - build_payload: Function returning the payload
+    - serialize: Function converting the payload to bytes
+    - mimetype: Content type of the serialized payload
+    
+    Returns:
+    - Flask Response
+    """
+    key = (kind, object_version(obj), tuple(sorted(request.args.items(multi=True))))
+    entry = get_response_cache().get(key)
+    
+    if entry is None:
+        body = serialize(build_payload())
+        entry = {
+            'identity': body,
+            'etag': hashlib.sha256(body).hexdigest()[:32]
+        }
+        get_response_cache().put(key, entry, size=_entry_size(entry))
+    
+    encoding = _negotiate_encoding(len(entry['identity']))
+    
+    # Strong ETags must differ between encodings of the same payload
+    etag = entry['etag'] if encoding is None else f"{entry['etag']}-{encoding}"
+    
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        if encoding is None:
+            body = entry['identity']
+        else:
+            if encoding not in entry:
+                # Store the variant in a copy of the entry, re-put so the cache counts its bytes too
+                entry = dict(entry, **{encoding: _compress(entry['identity'], encoding)})
+                get_response_cache().put(key, entry, size=_entry_size(entry))
+            body = entry[encoding]
+        
+        response = Response(body, mimetype=mimetype)
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+    
+    response.set_etag(etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'no-cache'  # Revalidate with the ETag on every use
+    return response
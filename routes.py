@@ -1,44 +1,452 @@
 import os
 import uuid
 import json
-import pandas as pd
 import numpy as np
-from flask import render_template, request, jsonify, send_file, redirect, url_for, flash, session
+from flask import Blueprint, abort, current_app, render_template, request, jsonify, send_file, redirect, url_for, flash, session
 from werkzeug.utils import secure_filename
 from io import BytesIO
 import tempfile
 
-from app import app, db
-from models import Study, Dataset, Subject, Sample, Analysis, Report
+from app import db
+from models import Study, Dataset, Subject, Sample, Analysis, Report, NCAParameter
 from pk_tools.nca import calculate_nca_parameters
 from pk_tools.compartmental import fit_compartmental_model
 from pk_tools.bioequivalence import calculate_bioequivalence
 from pk_tools.statistics import perform_statistical_analysis
 from pk_tools.reports import generate_report
-from pk_tools.utils import validate_dataset, transform_data, merge_datasets
+from pk_tools.utils import (format_validation_issue, merge_datasets,
+                            flatten_subjects, unflatten_subjects, apply_transformations, to_json,
+                            TRANSFORMATIONS)
+from pk_tools.cache import ResultCache, make_cache_key
+from pk_tools.fileio import frame_to_subjects, ingest_dataset, write_dataset, FILE_TYPES, EXPORT_FORMATS
+from pk_tools.profiles import ProfileSet
+from pk_tools.datacache import open_profile_cache, write_profile_cache
+from pk_tools.metrics import MetricsRegistry, increment, stage, track_run
+from pk_tools.profiling import PROFILE_MODES, profile
+from pk_tools.downsample import downsample_indices, downsample_series, percentile_bands
+from pk_tools.simulation import population_from_fits, simulate_population, time_grid
+from responses import cached_json_response, cached_plot_response, get_response_cache
+
+bp = Blueprint('main', __name__)
+
+def init_routes(app):
+    """Register the views on an app and create its caches, sized from the app config."""
+    # Analysis results keyed by dataset content, analysis type, parameters and code version
+    app.extensions['result_cache'] = ResultCache(
+        max_entries=app.config['RESULT_CACHE_SIZE'],
+        max_bytes=app.config['RESULT_CACHE_MAX_BYTES']
+    )
+    
+    # Flat arrays of derived datasets evaluated from their recipe, keyed by dataset ID
+    app.extensions['derived_datasets'] = ResultCache(
+        max_entries=1024,
+        max_bytes=app.config['DERIVED_DATASET_CACHE_BYTES']
+    )
+    
+    # Stage timings and counters of analysis runs, served on /metrics
+    app.extensions['metrics'] = MetricsRegistry()
+    
+    app.register_blueprint(bp)
+
+def get_cache(name):
+    """One of the current app's caches: 'result_cache' or 'derived_datasets'."""
+    return current_app.extensions[name]
+
+def get_metrics():
+    return current_app.extensions['metrics']
+
+def profile_request():
+    """
+    Profile a block if the request asks for it with a 'profile' form or query value.
+    
+    'sampling' or 'cprofile' picks the profiler, any other non-empty value
+    except '0' the sampling one. Yields the profiler, or None when profiling
+    was not requested or the PROFILING setting is off.
+    """
+    mode = request.values.get('profile')
+    if not mode or mode == '0' or not current_app.config['PROFILING']:
+        mode = None
+    elif mode not in PROFILE_MODES:
+        mode = 'sampling'
+    return profile(mode, interval=current_app.config['PROFILE_SAMPLE_INTERVAL_MS'] / 1000)
+
+def save_profile(profiler):
+    """Write a finished profile to the upload folder; returns its path, or None without a profiler."""
+    if profiler is None:
+        return None
+    
+    file_path = os.path.abspath(os.path.join(current_app.config['UPLOAD_FOLDER'], f"{uuid.uuid4().hex}{profiler.extension}"))
+    profiler.save(file_path)
+    return file_path
+
+def send_profile(file_path, name):
+    if not file_path or not os.path.exists(file_path):
+        abort(404)
+    return send_file(file_path, as_attachment=True, download_name=f"{name}{os.path.splitext(file_path)[1]}")
 
 # Helper functions
 def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'csv', 'xlsx', 'xls'}
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in FILE_TYPES
+
+def parse_file(file_path):
+    """Read and validate a saved upload, returning (DataFrame, validation report)."""
+    return ingest_dataset(
+        file_path,
+        chunksize=current_app.config['INGEST_CHUNKSIZE'] or None,
+        engine=current_app.config['INGEST_ENGINE']
+    )
+
+def store_nca_parameters(analysis, results):
+    """Persist the scalar per-subject NCA parameters of an analysis into the parameter table."""
+    rows = []
+    for subject_id, subject_results in results.items():
+        if subject_id == 'summary':
+            continue
+        for parameter, value in subject_results.items():
+            if value is None or isinstance(value, (int, float)):
+                rows.append({
+                    'analysis_id': analysis.id,
+                    'subject_id': str(subject_id),
+                    'parameter': parameter,
+                    'value': None if value is None else float(value)
+                })
+    
+    if rows:
+        db.session.execute(db.insert(NCAParameter), rows)
+
+def load_nca_parameters(analysis_ids, parameters=None):
+    """
+    Fetch per-subject NCA parameters for one or more analyses with a single query.
+    
+    Parameters:
+    - analysis_ids: List of NCA analysis IDs
+    - parameters: Optional list of parameter names to restrict the query to
+    
+    Returns:
+    - Dictionary {analysis_id: {subject_id: {parameter: value}}}, subjects in the order they were analysed
+    """
+    query = db.session.query(
+        NCAParameter.analysis_id, NCAParameter.subject_id, NCAParameter.parameter, NCAParameter.value
+    ).filter(NCAParameter.analysis_id.in_(analysis_ids))
+    
+    if parameters:
+        query = query.filter(NCAParameter.parameter.in_(parameters))
+    
+    loaded = {analysis_id: {} for analysis_id in analysis_ids}
+    for analysis_id, subject_id, parameter, value in query.order_by(NCAParameter.id):
+        loaded[analysis_id].setdefault(subject_id, {})[parameter] = value
+    
+    return loaded
+
+def run_cached_analysis(analysis_type, analysis_func, subjects_data, **kwargs):
+    """
+    Run an analysis function, reusing a previous result for identical inputs.
+    
+    Returns:
+    - tuple: (results dict, results serialized as JSON)
+    """
+    cache_key = make_cache_key(subjects_data, analysis_type, kwargs)
+    results_json = get_cache('result_cache').get(cache_key)
+    
+    if results_json is None:
+        with stage('compute'):
+            results = analysis_func(subjects_data, **kwargs)
+        with stage('serialize'):
+            results_json = to_json(results)
+        get_cache('result_cache').put(cache_key, results_json)
+    else:
+        increment('result_cache_hits')
+        with stage('serialize'):
+            results = json.loads(results_json)
+    
+    return results, results_json
 
-def parse_file(file):
-    filename = secure_filename(file.filename)
-    file_ext = filename.rsplit('.', 1)[1].lower()
+def load_subjects_data(dataset):
+    """
+    Load a dataset's concentration-time data.
     
-    if file_ext == 'csv':
-        df = pd.read_csv(file)
-    else:  # Excel
-        df = pd.read_excel(file)
+    Uploaded datasets are mapped from their profile cache file when it
+    exists, so the samples are paged in as analyses read them, and otherwise
+    read with a single column query (writing the cache file for next time);
+    derived datasets are evaluated from their parent and transform pipeline.
     
-    return df
+    Returns:
+    - ProfileSet with the subjects in upload order and each subject's samples in time order
+    """
+    if dataset.parent_id is not None:
+        return ProfileSet(*materialize_derived_dataset(dataset))
+    
+    path = profile_cache_path(dataset)
+    if path is not None:
+        try:
+            profiles = open_profile_cache(path, chunk_samples=current_app.config['PROFILE_CACHE_CHUNK_SAMPLES'])
+            increment('mapped_datasets')
+            return profiles
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            current_app.logger.warning("Ignoring the profile cache of dataset %s: %s", dataset.id, e)
+    
+    rows = db.session.query(Subject.subject_id, Sample.time, Sample.concentration).outerjoin(
+        Sample, Sample.subject_id == Subject.id
+    ).filter(Subject.dataset_id == dataset.id).order_by(Subject.id, Sample.id)
+    
+    # Rows are grouped into subjects in one sort, without per-subject lists
+    subject_codes = {}
+    codes = []
+    times = []
+    concentrations = []
+    for subject_id, time, concentration in rows:
+        code = subject_codes.setdefault(subject_id, len(subject_codes))
+        if time is not None:
+            codes.append(code)
+            times.append(time)
+            concentrations.append(concentration)
+    
+    profiles = ProfileSet.from_codes(list(subject_codes), codes, times, concentrations)
+    # Datasets uploaded before the cache was enabled get their file on first use
+    store_profile_cache(dataset, profiles)
+    return profiles
+
+def profile_cache_path(dataset):
+    """Path of an uploaded dataset's profile cache file, or None when the cache is disabled."""
+    folder = current_app.config['PROFILE_CACHE_FOLDER']
+    if not folder or not dataset.file_path:
+        return None
+    # Named after the uploaded file, which is unique, so a reused dataset ID never finds a stale file
+    return os.path.join(folder, os.path.basename(dataset.file_path) + '.profiles')
+
+def store_profile_cache(dataset, profiles):
+    """Write a dataset's profile cache file; on failure analyses keep reading the database."""
+    path = profile_cache_path(dataset)
+    if path is None:
+        return
+    try:
+        write_profile_cache(path, profiles)
+    except OSError as e:
+        current_app.logger.warning("Could not write the profile cache of dataset %s: %s", dataset.id, e)
+
+def materialize_derived_dataset(dataset):
+    """Evaluate a derived dataset's recipe into flat (subject_ids, offsets, times, concentrations) arrays."""
+    flat = get_cache('derived_datasets').get(dataset.id)
+    if flat is None:
+        subject_ids, offsets, times, concentrations = flatten_subjects(load_subjects_data(dataset.parent))
+        concentrations = apply_transformations(concentrations, offsets, dataset.transform_pipeline)
+        flat = (subject_ids, offsets, times, concentrations)
+        
+        if current_app.config['DERIVED_DATASET_CACHE_BYTES'] > 0:
+            get_cache('derived_datasets').put(dataset.id, flat, size=offsets.nbytes + times.nbytes + concentrations.nbytes)
+    
+    return flat
+
+def sample_source(dataset):
+    """Return the dataset whose subjects and samples are stored for this dataset (the parent of a derived one)."""
+    return dataset.parent if dataset.parent_id is not None else dataset
+
+def count_subjects(dataset):
+    return db.session.query(db.func.count(Subject.id)).filter(
+        Subject.dataset_id == sample_source(dataset).id
+    ).scalar()
+
+def query_subject_page(dataset, limit, after=None):
+    """
+    Return up to limit (primary key, subject ID) pairs ordered by subject ID.
+    
+    Keyset pagination: pass the last subject ID of the previous page as after.
+    Served by the (dataset_id, subject_id) index without reading samples.
+    """
+    query = db.session.query(Subject.id, Subject.subject_id).filter(Subject.dataset_id == sample_source(dataset).id)
+    if after is not None:
+        query = query.filter(Subject.subject_id > after)
+    return query.order_by(Subject.subject_id).limit(limit).all()
+
+def query_sample_stats(subject_pks):
+    """Return {subject primary key: (sample count, first time, last time)} from the (subject_id, time) index."""
+    rows = db.session.query(
+        Sample.subject_id, db.func.count(Sample.id), db.func.min(Sample.time), db.func.max(Sample.time)
+    ).filter(Sample.subject_id.in_(subject_pks)).group_by(Sample.subject_id)
+    return {pk: (count, time_min, time_max) for pk, count, time_min, time_max in rows}
+
+def load_subjects_page(dataset, limit, after=None, samples=None):
+    """
+    Load one page of subjects with their samples in time order.
+    
+    Parameters:
+    - dataset: Dataset to read
+    - limit: Maximum number of subjects
+    - after: Subject ID after which the page starts (keyset pagination)
+    - samples: Maximum number of samples per subject (None for all)
+    
+    Returns:
+    - List of dicts with 'subject_id', 'n_samples', 'times' and 'concentrations'
+    """
+    subjects = query_subject_page(dataset, limit, after)
+    if not subjects:
+        return []
+    
+    subject_pks = [pk for pk, _ in subjects]
+    derived = dataset.parent_id is not None
+    
+    # Transforms such as normalize use the whole profile, so derived datasets read complete subjects
+    sample_limit = None if derived else samples
+    columns = (Sample.subject_id, Sample.time, Sample.concentration)
+    
+    if sample_limit is None:
+        rows = db.session.query(*columns).filter(Sample.subject_id.in_(subject_pks)).order_by(
+            Sample.subject_id, Sample.time, Sample.id
+        )
+    else:
+        # First sample_limit samples of each subject, numbered in time order
+        position = db.func.row_number().over(
+            partition_by=Sample.subject_id, order_by=(Sample.time, Sample.id)
+        ).label('position')
+        ranked = db.session.query(*columns, position).filter(Sample.subject_id.in_(subject_pks)).subquery()
+        rows = db.session.query(ranked.c.subject_id, ranked.c.time, ranked.c.concentration).filter(
+            ranked.c.position <= sample_limit
+        ).order_by(ranked.c.subject_id, ranked.c.position)
+    
+    page_data = {pk: {'times': [], 'concentrations': []} for pk in subject_pks}
+    for pk, time, concentration in rows:
+        page_data[pk]['times'].append(time)
+        page_data[pk]['concentrations'].append(concentration)
+    
+    if derived:
+        subject_ids, offsets, times, concentrations = flatten_subjects(page_data)
+        concentrations = apply_transformations(concentrations, offsets, dataset.transform_pipeline)
+        page_data = unflatten_subjects(subject_ids, offsets, times, concentrations)
+        if samples is not None:
+            for data in page_data.values():
+                data['times'] = data['times'][:samples]
+                data['concentrations'] = data['concentrations'][:samples]
+    
+    sample_stats = query_sample_stats(subject_pks)
+    return [
+        {
+            'subject_id': subject_id,
+            'n_samples': sample_stats.get(pk, (0,))[0],
+            'times': page_data[pk]['times'],
+            'concentrations': page_data[pk]['concentrations']
+        }
+        for pk, subject_id in subjects
+    ]
+
+def bounded_arg(name, default, maximum):
+    """Read a non-negative integer query argument, clamped to maximum."""
+    return min(max(request.args.get(name, default, type=int), 0), maximum)
+
+# Pairs of x/y series in per-subject results that plot-data responses downsample, by band name
+PLOT_SERIES = {
+    'observed': [('times', 'concentrations'), ('observed_times', 'observed_concentrations')],
+    'predicted': [('predicted_times', 'predicted_concentrations')]
+}
+
+def parse_plot_options():
+    """
+    Read the viewport, resolution and pagination options of a plot-data request.
+    
+    Query parameters:
+    - max_points: Maximum points per series (LTTB downsampling)
+    - x_min, x_max: Time range of the viewport
+    - page, per_page: Subject pagination (per_page enables it)
+    - bands: If true, add median and 5th/95th percentile bands across all subjects
+    - format, dtype: format=binary selects the binary array transport (see responses.to_binary_bytes)
+    """
+    options = {
+        'max_points': request.args.get('max_points', type=int),
+        'x_min': request.args.get('x_min', type=float),
+        'x_max': request.args.get('x_max', type=float),
+        'page': max(request.args.get('page', 1, type=int), 1),
+        'per_page': request.args.get('per_page', type=int),
+        'bands': request.args.get('bands', '').lower() in ('1', 'true', 'yes')
+    }
+    
+    if options['max_points'] is not None:
+        options['max_points'] = max(options['max_points'], 3)
+    if options['per_page'] is not None:
+        options['per_page'] = max(options['per_page'], 1)
+    
+    return options
+
+def paginate_subjects(subject_ids, options):
+    """Return the subject IDs on the requested page and the pagination block (None if not paginated)."""
+    per_page = options['per_page']
+    if per_page is None:
+        return subject_ids, None
+    
+    total = len(subject_ids)
+    start = (options['page'] - 1) * per_page
+    pagination = {
+        'page': options['page'],
+        'per_page': per_page,
+        'total_subjects': total,
+        'pages': (total + per_page - 1) // per_page
+    }
+    return subject_ids[start:start + per_page], pagination
+
+def downsample_subject_result(subject_result, options):
+    """Downsample the plotted series of one subject's analysis results."""
+    subject_result = dict(subject_result)
+    view = (options['max_points'], options['x_min'], options['x_max'])
+    
+    for pairs in PLOT_SERIES.values():
+        for x_key, y_key in pairs:
+            if x_key in subject_result and y_key in subject_result:
+                subject_result[x_key], subject_result[y_key] = downsample_series(
+                    subject_result[x_key], subject_result[y_key], *view
+                )
+    
+    points = subject_result.get('adjusted_points')
+    if points:
+        points = np.asarray(points, dtype=np.float64)
+        indices = downsample_indices(points[:, 0], points[:, 1], *view)
+        subject_result['adjusted_points'] = points[indices].tolist()
+    
+    return subject_result
+
+def plot_bands(subject_results, options):
+    """Percentile bands across subjects for each series kind present in the results."""
+    bands = {}
+    for name, pairs in PLOT_SERIES.items():
+        series = []
+        for subject_result in subject_results:
+            for x_key, y_key in pairs:
+                if x_key in subject_result and y_key in subject_result:
+                    series.append((subject_result[x_key], subject_result[y_key]))
+                    break
+        
+        if series:
+            bands[name] = percentile_bands(
+                series,
+                n_points=options['max_points'] or 100,
+                x_min=options['x_min'],
+                x_max=options['x_max']
+            )
+    
+    return bands
+
+def parse_typical_values(text):
+    """Parse 'name=value' pairs separated by commas, e.g. 'ka=1.5, V=50', into a dict."""
+    typical = {}
+    for item in (text or '').split(','):
+        if not item.strip():
+            continue
+        name, sep, value = item.partition('=')
+        if not sep:
+            raise ValueError(f"Expected name=value, got '{item.strip()}'")
+        typical[name.strip()] = float(value)
+    return typical
+
+def list_datasets():
+    """Datasets for the selection lists, with their study loaded in the same query."""
+    return Dataset.query.options(db.joinedload(Dataset.study)).order_by(Dataset.id).all()
 
 # Main routes
-@app.route('/')
+@bp.route('/')
 def index():
     return render_template('index.html')
 
 # Study management
-@app.route('/studies', methods=['GET', 'POST'])
+@bp.route('/studies', methods=['GET', 'POST'])
 def studies():
     if request.method == 'POST':
         name = request.form.get('name')
@@ -46,36 +454,36 @@ def studies():
         
         if not name:
             flash('Study name is required', 'danger')
-            return redirect(url_for('studies'))
+            return redirect(url_for('main.studies'))
         
         study = Study(name=name, description=description)
         db.session.add(study)
         db.session.commit()
         flash('Study created successfully', 'success')
-        return redirect(url_for('studies'))
+        return redirect(url_for('main.studies'))
     
-    studies = Study.query.all()
+    studies = Study.query.options(db.selectinload(Study.datasets)).all()
     return render_template('index.html', studies=studies)
 
-@app.route('/study/<int:study_id>')
+@bp.route('/study/<int:study_id>')
 def study_detail(study_id):
     study = Study.query.get_or_404(study_id)
     return render_template('index.html', study=study, active_tab='study')
 
 # Dataset management
-@app.route('/study/<int:study_id>/upload', methods=['POST'])
+@bp.route('/study/<int:study_id>/upload', methods=['POST'])
 def upload_dataset(study_id):
     study = Study.query.get_or_404(study_id)
     
     if 'file' not in request.files:
         flash('No file part', 'danger')
-        return redirect(url_for('study_detail', study_id=study_id))
+        return redirect(url_for('main.study_detail', study_id=study_id))
     
     file = request.files['file']
     
     if file.filename == '':
         flash('No selected file', 'danger')
-        return redirect(url_for('study_detail', study_id=study_id))
+        return redirect(url_for('main.study_detail', study_id=study_id))
     
     if file and allowed_file(file.filename):
         name = request.form.get('name')
@@ -83,71 +491,95 @@ def upload_dataset(study_id):
         
         if not name:
             flash('Dataset name is required', 'danger')
-            return redirect(url_for('study_detail', study_id=study_id))
+            return redirect(url_for('main.study_detail', study_id=study_id))
         
         # Generate unique filename
         filename = secure_filename(file.filename)
         file_ext = filename.rsplit('.', 1)[1].lower()
         unique_filename = f"{uuid.uuid4().hex}.{file_ext}"
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
+        file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
         
         # Save file
         file.save(file_path)
         
-        # Create dataset in database
-        dataset = Dataset(
-            name=name,
-            description=description,
-            file_path=file_path,
-            file_type=file_ext,
-            study_id=study_id
-        )
-        db.session.add(dataset)
-        db.session.commit()
+        # Process file: parse once from disk with typed columns, validating each chunk as it is read
+        try:
+            df, report = parse_file(file_path)
+        except Exception as e:
+            os.remove(file_path)
+            flash(f'Error processing dataset: {str(e)}', 'danger')
+            return redirect(url_for('main.study_detail', study_id=study_id))
+        
+        # Validate, reporting every issue rather than the first one
+        if not report['valid']:
+            os.remove(file_path)
+            message = '; '.join(format_validation_issue(issue) for issue in report['errors'])
+            flash(f'Invalid dataset: {message}', 'danger')
+            return redirect(url_for('main.study_detail', study_id=study_id))
+        
+        for issue in report['warnings']:
+            flash(f'Warning: {format_validation_issue(issue)}', 'warning')
         
-        # Process file
         try:
-            df = parse_file(file)
+            # Create dataset in database
+            dataset = Dataset(
+                name=name,
+                description=description,
+                file_path=file_path,
+                file_type=file_ext,
+                study_id=study_id
+            )
+            db.session.add(dataset)
+            db.session.flush()  # Get dataset.id
             
-            # Validate
-            valid, message = validate_dataset(df)
-            if not valid:
-                flash(f'Invalid dataset: {message}', 'danger')
-                return redirect(url_for('study_detail', study_id=study_id))
+            # Import into database: one bulk insert for the subjects, one query for their
+            # IDs and one bulk insert for the samples of all subjects
+            times = df['time'].to_numpy(dtype=np.float64)
+            concentrations = df['concentration'].to_numpy(dtype=np.float64)
+            groups = {str(subject_id): indices for subject_id, indices
+                      in df.groupby('subject_id', observed=True, sort=False).indices.items()}
+            if groups:
+                db.session.execute(
+                    db.insert(Subject),
+                    [{'subject_id': subject_id, 'dataset_id': dataset.id} for subject_id in groups]
+                )
+            subject_pks = dict(
+                db.session.query(Subject.subject_id, Subject.id).filter(Subject.dataset_id == dataset.id).all()
+            )
             
-            # Import into database
-            for _, group in df.groupby('subject_id'):
-                subject_id = group['subject_id'].iloc[0]
-                subject = Subject(subject_id=subject_id, dataset_id=dataset.id)
-                db.session.add(subject)
-                db.session.flush()  # Get subject.id
-                
-                for _, row in group.iterrows():
-                    sample = Sample(
-                        time=float(row['time']),
-                        concentration=float(row['concentration']),
-                        subject_id=subject.id
-                    )
-                    db.session.add(sample)
+            rows = []
+            for subject_id, indices in groups.items():
+                subject_pk = subject_pks[subject_id]
+                rows.extend(
+                    {'time': t, 'concentration': c, 'subject_id': subject_pk}
+                    for t, c in zip(times[indices].tolist(), concentrations[indices].tolist())
+                )
+            
+            if rows:
+                db.session.execute(db.insert(Sample), rows)
             
             db.session.commit()
+            # Analyses map this file rather than loading the samples back from the database
+            store_profile_cache(dataset, frame_to_subjects(df))
             flash('Dataset uploaded and processed successfully', 'success')
         except Exception as e:
             db.session.rollback()
             flash(f'Error processing dataset: {str(e)}', 'danger')
         
-        return redirect(url_for('study_detail', study_id=study_id))
+        return redirect(url_for('main.study_detail', study_id=study_id))
     
-    flash('Invalid file type. Please upload CSV or Excel file.', 'danger')
-    return redirect(url_for('study_detail', study_id=study_id))
+    flash('Invalid file type. Please upload a CSV, Excel, Parquet or Arrow file.', 'danger')
+    return redirect(url_for('main.study_detail', study_id=study_id))
 
-@app.route('/dataset/<int:dataset_id>')
+@bp.route('/dataset/<int:dataset_id>')
 def dataset_detail(dataset_id):
     dataset = Dataset.query.get_or_404(dataset_id)
-    return render_template('data_processing.html', dataset=dataset)
+    preview_subjects = load_subjects_page(dataset, limit=20, samples=10)
+    return render_template('data_processing.html', dataset=dataset, preview_subjects=preview_subjects,
+                           n_subjects=count_subjects(dataset))
 
 # NCA Analysis
-@app.route('/nca', methods=['GET', 'POST'])
+@bp.route('/nca', methods=['GET', 'POST'])
 def nca():
     if request.method == 'POST':
         dataset_id = request.form.get('dataset_id')
@@ -155,56 +587,59 @@ def nca():
         
         if not dataset_id or not name:
             flash('Dataset and analysis name are required', 'danger')
-            return redirect(url_for('nca'))
+            return redirect(url_for('main.nca'))
         
         dataset = Dataset.query.get_or_404(dataset_id)
         
-        # Get subjects and samples
-        subjects_data = {}
-        for subject in dataset.subjects:
-            times = []
-            concentrations = []
-            for sample in subject.samples:
-                times.append(sample.time)
-                concentrations.append(sample.concentration)
-            
-            subjects_data[subject.subject_id] = {
-                'times': times,
-                'concentrations': concentrations
-            }
-        
-        # Calculate NCA parameters
-        try:
-            results = calculate_nca_parameters(subjects_data)
-            
-            # Create analysis record
-            analysis = Analysis(
-                name=name,
-                type='NCA',
-                parameters=json.dumps({
-                    'method': request.form.get('method', 'linear-log'),
-                    'dose': float(request.form.get('dose', 0)),
-                    'dose_unit': request.form.get('dose_unit', 'mg'),
-                    'conc_unit': request.form.get('conc_unit', 'ng/mL'),
-                    'time_unit': request.form.get('time_unit', 'h')
-                }),
-                results=json.dumps(results),
-                dataset_id=dataset.id
-            )
-            db.session.add(analysis)
-            db.session.commit()
+        with track_run('NCA', get_metrics()) as run:
+            # Get subjects and samples
+            with stage('load'):
+                subjects_data = load_subjects_data(dataset)
+            increment('subjects', len(subjects_data))
             
-            flash('NCA analysis completed successfully', 'success')
-            return redirect(url_for('analysis_detail', analysis_id=analysis.id))
-        except Exception as e:
-            flash(f'Error performing NCA analysis: {str(e)}', 'danger')
-            return redirect(url_for('nca'))
+            # Calculate NCA parameters
+            try:
+                with profile_request() as profiler:
+                    results, results_json = run_cached_analysis(
+                        'NCA', calculate_nca_parameters, subjects_data
+                    )
+                
+                # Create analysis record
+                analysis = Analysis(
+                    name=name,
+                    type='NCA',
+                    parameters=json.dumps({
+                        'method': request.form.get('method', 'linear-log'),
+                        'dose': float(request.form.get('dose', 0)),
+                        'dose_unit': request.form.get('dose_unit', 'mg'),
+                        'conc_unit': request.form.get('conc_unit', 'ng/mL'),
+                        'time_unit': request.form.get('time_unit', 'h')
+                    }),
+                    results=results_json,
+                    profile_path=save_profile(profiler),
+                    dataset_id=dataset.id
+                )
+                with stage('store'):
+                    db.session.add(analysis)
+                    db.session.flush()  # Get analysis.id
+                    
+                    store_nca_parameters(analysis, results)
+                # Snapshot once the store stage has finished, so the saved metrics include it
+                analysis.metrics = run.as_dict()
+                db.session.commit()
+                
+                flash('NCA analysis completed successfully', 'success')
+                return redirect(url_for('main.analysis_detail', analysis_id=analysis.id))
+            except Exception as e:
+                run.fail(e)
+                flash(f'Error performing NCA analysis: {str(e)}', 'danger')
+                return redirect(url_for('main.nca'))
     
-    datasets = Dataset.query.all()
+    datasets = list_datasets()
     return render_template('nca.html', datasets=datasets)
 
 # Compartmental Analysis
-@app.route('/compartmental', methods=['GET', 'POST'])
+@bp.route('/compartmental', methods=['GET', 'POST'])
 def compartmental():
     if request.method == 'POST':
         dataset_id = request.form.get('dataset_id')
@@ -213,62 +648,63 @@ def compartmental():
         
         if not dataset_id or not name or not model_type:
             flash('Dataset, analysis name, and model type are required', 'danger')
-            return redirect(url_for('compartmental'))
+            return redirect(url_for('main.compartmental'))
         
         dataset = Dataset.query.get_or_404(dataset_id)
         
-        # Get subjects and samples
-        subjects_data = {}
-        for subject in dataset.subjects:
-            times = []
-            concentrations = []
-            for sample in subject.samples:
-                times.append(sample.time)
-                concentrations.append(sample.concentration)
-            
-            subjects_data[subject.subject_id] = {
-                'times': times,
-                'concentrations': concentrations
-            }
-        
-        # Fit compartmental model
-        try:
-            results = fit_compartmental_model(
-                subjects_data,
-                model_type=model_type,
-                dose=float(request.form.get('dose', 0)),
-                absorption=request.form.get('absorption', 'first-order')
-            )
-            
-            # Create analysis record
-            analysis = Analysis(
-                name=name,
-                type='Compartmental',
-                parameters=json.dumps({
-                    'model_type': model_type,
-                    'absorption': request.form.get('absorption', 'first-order'),
-                    'dose': float(request.form.get('dose', 0)),
-                    'dose_unit': request.form.get('dose_unit', 'mg'),
-                    'conc_unit': request.form.get('conc_unit', 'ng/mL'),
-                    'time_unit': request.form.get('time_unit', 'h')
-                }),
-                results=json.dumps(results),
-                dataset_id=dataset.id
-            )
-            db.session.add(analysis)
-            db.session.commit()
+        with track_run('Compartmental', get_metrics()) as run:
+            # Get subjects and samples
+            with stage('load'):
+                subjects_data = load_subjects_data(dataset)
+            increment('subjects', len(subjects_data))
             
-            flash('Compartmental analysis completed successfully', 'success')
-            return redirect(url_for('analysis_detail', analysis_id=analysis.id))
-        except Exception as e:
-            flash(f'Error performing compartmental analysis: {str(e)}', 'danger')
-            return redirect(url_for('compartmental'))
+            # Fit compartmental model
+            try:
+                with profile_request() as profiler:
+                    results, results_json = run_cached_analysis(
+                        'Compartmental',
+                        fit_compartmental_model,
+                        subjects_data,
+                        model_type=model_type,
+                        dose=float(request.form.get('dose', 0)),
+                        absorption=request.form.get('absorption', 'first-order')
+                    )
+                
+                # Create analysis record
+                analysis = Analysis(
+                    name=name,
+                    type='Compartmental',
+                    parameters=json.dumps({
+                        'model_type': model_type,
+                        'absorption': request.form.get('absorption', 'first-order'),
+                        'dose': float(request.form.get('dose', 0)),
+                        'dose_unit': request.form.get('dose_unit', 'mg'),
+                        'conc_unit': request.form.get('conc_unit', 'ng/mL'),
+                        'time_unit': request.form.get('time_unit', 'h')
+                    }),
+                    results=results_json,
+                    profile_path=save_profile(profiler),
+                    dataset_id=dataset.id
+                )
+                with stage('store'):
+                    db.session.add(analysis)
+                    db.session.flush()
+                # Snapshot once the store stage has finished, so the saved metrics include it
+                analysis.metrics = run.as_dict()
+                db.session.commit()
+                
+                flash('Compartmental analysis completed successfully', 'success')
+                return redirect(url_for('main.analysis_detail', analysis_id=analysis.id))
+            except Exception as e:
+                run.fail(e)
+                flash(f'Error performing compartmental analysis: {str(e)}', 'danger')
+                return redirect(url_for('main.compartmental'))
     
-    datasets = Dataset.query.all()
+    datasets = list_datasets()
     return render_template('compartmental.html', datasets=datasets)
 
 # Bioequivalence Analysis
-@app.route('/bioequivalence', methods=['GET', 'POST'])
+@bp.route('/bioequivalence', methods=['GET', 'POST'])
 def bioequivalence():
     if request.method == 'POST':
         test_dataset_id = request.form.get('test_dataset_id')
@@ -278,7 +714,7 @@ def bioequivalence():
         
         if not test_dataset_id or not reference_dataset_id or not name:
             flash('Test dataset, reference dataset, and analysis name are required', 'danger')
-            return redirect(url_for('bioequivalence'))
+            return redirect(url_for('main.bioequivalence'))
         
         test_dataset = Dataset.query.get_or_404(test_dataset_id)
         reference_dataset = Dataset.query.get_or_404(reference_dataset_id)
@@ -289,42 +725,59 @@ def bioequivalence():
         
         if not test_analysis or not ref_analysis:
             flash('NCA analysis must be performed on both datasets first', 'danger')
-            return redirect(url_for('bioequivalence'))
+            return redirect(url_for('main.bioequivalence'))
         
-        test_results = json.loads(test_analysis.results)
-        ref_results = json.loads(ref_analysis.results)
-        
-        # Calculate bioequivalence
-        try:
-            results = calculate_bioequivalence(test_results, ref_results, design=design)
-            
-            # Create analysis record
-            analysis = Analysis(
-                name=name,
-                type='Bioequivalence',
-                parameters=json.dumps({
-                    'design': design,
-                    'test_dataset_id': test_dataset_id,
-                    'reference_dataset_id': reference_dataset_id,
-                    'alpha': 0.05
-                }),
-                results=json.dumps(results),
-                dataset_id=test_dataset.id  # Associate with test dataset
-            )
-            db.session.add(analysis)
-            db.session.commit()
+        with track_run('Bioequivalence', get_metrics()) as run:
+            # Only the scalar BE parameters are needed, not the full result blobs
+            be_parameters = ['cmax', 'auc_last', 'auc_inf']
+            with stage('load'):
+                nca_parameters = load_nca_parameters([test_analysis.id, ref_analysis.id], be_parameters)
+                
+                # Analyses created before the parameter table existed only have the JSON blob
+                test_results = nca_parameters[test_analysis.id] or json.loads(test_analysis.results)
+                ref_results = nca_parameters[ref_analysis.id] or json.loads(ref_analysis.results)
+            increment('subjects', sum(1 for s in list(test_results) + list(ref_results) if s != 'summary'))
             
-            flash('Bioequivalence analysis completed successfully', 'success')
-            return redirect(url_for('analysis_detail', analysis_id=analysis.id))
-        except Exception as e:
-            flash(f'Error performing bioequivalence analysis: {str(e)}', 'danger')
-            return redirect(url_for('bioequivalence'))
+            # Calculate bioequivalence
+            try:
+                with stage('compute'), profile_request() as profiler:
+                    results = calculate_bioequivalence(test_results, ref_results, design=design)
+                with stage('serialize'):
+                    results_json = to_json(results)
+                
+                # Create analysis record
+                analysis = Analysis(
+                    name=name,
+                    type='Bioequivalence',
+                    parameters=json.dumps({
+                        'design': design,
+                        'test_dataset_id': test_dataset_id,
+                        'reference_dataset_id': reference_dataset_id,
+                        'alpha': 0.05
+                    }),
+                    results=results_json,
+                    profile_path=save_profile(profiler),
+                    dataset_id=test_dataset.id  # Associate with test dataset
+                )
+                with stage('store'):
+                    db.session.add(analysis)
+                    db.session.flush()
+                # Snapshot once the store stage has finished, so the saved metrics include it
+                analysis.metrics = run.as_dict()
+                db.session.commit()
+                
+                flash('Bioequivalence analysis completed successfully', 'success')
+                return redirect(url_for('main.analysis_detail', analysis_id=analysis.id))
+            except Exception as e:
+                run.fail(e)
+                flash(f'Error performing bioequivalence analysis: {str(e)}', 'danger')
+                return redirect(url_for('main.bioequivalence'))
     
-    datasets = Dataset.query.all()
+    datasets = list_datasets()
     return render_template('bioequivalence.html', datasets=datasets)
 
 # Data Processing
-@app.route('/data-processing', methods=['GET', 'POST'])
+@bp.route('/data-processing', methods=['GET', 'POST'])
 def data_processing():
     if request.method == 'POST':
         dataset_id = request.form.get('dataset_id')
@@ -332,65 +785,41 @@ def data_processing():
         
         if not dataset_id or not transformation:
             flash('Dataset and transformation are required', 'danger')
-            return redirect(url_for('data_processing'))
+            return redirect(url_for('main.data_processing'))
         
         dataset = Dataset.query.get_or_404(dataset_id)
         
-        # Get data
-        subjects_data = {}
-        for subject in dataset.subjects:
-            times = []
-            concentrations = []
-            for sample in subject.samples:
-                times.append(sample.time)
-                concentrations.append(sample.concentration)
-            
-            subjects_data[subject.subject_id] = {
-                'times': times,
-                'concentrations': concentrations
-            }
-        
-        # Apply transformation
+        # Create a derived dataset recipe; the transformed data is evaluated lazily on load
         try:
-            transformed_data = transform_data(subjects_data, transformation=transformation)
+            if transformation not in TRANSFORMATIONS:
+                raise ValueError(f"Unknown transformation: {transformation}")
+            
+            # Chain onto the parent's recipe so derived datasets always point at uploaded data
+            root = dataset.parent if dataset.parent_id is not None else dataset
+            pipeline = list(dataset.transform_pipeline or []) + [transformation]
             
-            # Create new dataset with transformed data
             new_dataset = Dataset(
                 name=f"{dataset.name} - {transformation}",
                 description=f"Transformed dataset: {transformation} applied to {dataset.name}",
                 file_type=dataset.file_type,
-                study_id=dataset.study_id
+                study_id=dataset.study_id,
+                parent_id=root.id,
+                transform_pipeline=pipeline
             )
             db.session.add(new_dataset)
-            db.session.flush()  # Get new_dataset.id
-            
-            # Add transformed data to new dataset
-            for subject_id, data in transformed_data.items():
-                subject = Subject(subject_id=subject_id, dataset_id=new_dataset.id)
-                db.session.add(subject)
-                db.session.flush()  # Get subject.id
-                
-                for i in range(len(data['times'])):
-                    sample = Sample(
-                        time=data['times'][i],
-                        concentration=data['concentrations'][i],
-                        subject_id=subject.id
-                    )
-                    db.session.add(sample)
-            
             db.session.commit()
             flash('Data transformation completed successfully', 'success')
-            return redirect(url_for('dataset_detail', dataset_id=new_dataset.id))
+            return redirect(url_for('main.dataset_detail', dataset_id=new_dataset.id))
         except Exception as e:
             db.session.rollback()
             flash(f'Error applying transformation: {str(e)}', 'danger')
-            return redirect(url_for('data_processing'))
+            return redirect(url_for('main.data_processing'))
     
-    datasets = Dataset.query.all()
+    datasets = list_datasets()
     return render_template('data_processing.html', datasets=datasets)
 
 # Statistics
-@app.route('/statistics', methods=['GET', 'POST'])
+@bp.route('/statistics', methods=['GET', 'POST'])
 def statistics():
     if request.method == 'POST':
         dataset_id = request.form.get('dataset_id')
@@ -399,53 +828,166 @@ def statistics():
         
         if not dataset_id or not stat_type or not name:
             flash('Dataset, statistical test type, and analysis name are required', 'danger')
-            return redirect(url_for('statistics'))
+            return redirect(url_for('main.statistics'))
         
         dataset = Dataset.query.get_or_404(dataset_id)
         
-        # Get data
-        subjects_data = {}
-        for subject in dataset.subjects:
-            times = []
-            concentrations = []
-            for sample in subject.samples:
-                times.append(sample.time)
-                concentrations.append(sample.concentration)
+        with track_run('Statistics', get_metrics()) as run:
+            # Get data
+            with stage('load'):
+                subjects_data = load_subjects_data(dataset)
+            increment('subjects', len(subjects_data))
             
-            subjects_data[subject.subject_id] = {
-                'times': times,
-                'concentrations': concentrations
-            }
+            # Perform statistical analysis
+            try:
+                with profile_request() as profiler:
+                    results, results_json = run_cached_analysis(
+                        'Statistics', perform_statistical_analysis, subjects_data, stat_type=stat_type
+                    )
+                
+                # Create analysis record
+                analysis = Analysis(
+                    name=name,
+                    type='Statistics',
+                    parameters=json.dumps({
+                        'stat_type': stat_type,
+                        'alpha': 0.05
+                    }),
+                    results=results_json,
+                    profile_path=save_profile(profiler),
+                    dataset_id=dataset.id
+                )
+                with stage('store'):
+                    db.session.add(analysis)
+                    db.session.flush()
+                # Snapshot once the store stage has finished, so the saved metrics include it
+                analysis.metrics = run.as_dict()
+                db.session.commit()
+                
+                flash('Statistical analysis completed successfully', 'success')
+                return redirect(url_for('main.analysis_detail', analysis_id=analysis.id))
+            except Exception as e:
+                run.fail(e)
+                flash(f'Error performing statistical analysis: {str(e)}', 'danger')
+                return redirect(url_for('main.statistics'))
+    
+    datasets = list_datasets()
+    return render_template('statistics.html', datasets=datasets)
+
+# Population Simulation
+@bp.route('/simulation', methods=['GET', 'POST'])
+def simulation():
+    if request.method == 'POST':
+        dataset_id = request.form.get('dataset_id')
+        name = request.form.get('analysis_name')
         
-        # Perform statistical analysis
-        try:
-            results = perform_statistical_analysis(subjects_data, stat_type=stat_type)
-            
-            # Create analysis record
-            analysis = Analysis(
-                name=name,
-                type='Statistics',
-                parameters=json.dumps({
-                    'stat_type': stat_type,
-                    'alpha': 0.05
-                }),
-                results=json.dumps(results),
-                dataset_id=dataset.id
-            )
-            db.session.add(analysis)
-            db.session.commit()
+        if not dataset_id or not name:
+            flash('Dataset and analysis name are required', 'danger')
+            return redirect(url_for('main.simulation'))
+        
+        dataset = Dataset.query.get_or_404(dataset_id)
+        
+        with track_run('Simulation', get_metrics()) as run:
+            # Observed data, for the visual predictive check
+            with stage('load'):
+                subjects_data = load_subjects_data(dataset)
+            increment('subjects', len(subjects_data))
             
-            flash('Statistical analysis completed successfully', 'success')
-            return redirect(url_for('analysis_detail', analysis_id=analysis.id))
-        except Exception as e:
-            flash(f'Error performing statistical analysis: {str(e)}', 'danger')
-            return redirect(url_for('statistics'))
+            try:
+                model_type = request.form.get('model_type', 'one_compartment')
+                absorption = request.form.get('absorption', 'first-order')
+                typical = parse_typical_values(request.form.get('typical'))
+                cv = float(request.form.get('cv_percent') or 30) / 100
+                
+                # Population from a compartmental fit: its model, typical values and between-subject CVs
+                source_id = request.form.get('source_analysis_id')
+                if source_id:
+                    source = Analysis.query.get_or_404(source_id)
+                    if source.type != 'Compartmental':
+                        raise ValueError('The population must come from a compartmental analysis')
+                    source_parameters = json.loads(source.parameters)
+                    model_type = source_parameters['model_type']
+                    absorption = source_parameters.get('absorption', 'first-order')
+                    typical, cv = population_from_fits(json.loads(source.results), model_type, absorption)
+                
+                n_subjects = min(int(request.form.get('n_subjects') or 1000), current_app.config['SIMULATION_MAX_SUBJECTS'])
+                n_times = min(max(int(request.form.get('n_times') or 100), 2), 1000)
+                last_observed = float(subjects_data.times.max()) if len(subjects_data.times) else 24
+                t_max = float(request.form.get('t_max') or last_observed)
+                lloq = float(request.form['lloq']) if request.form.get('lloq') else None
+                dose = float(request.form.get('dose') or 100)
+                seed = int(request.form.get('seed') or 0)
+                
+                with profile_request() as profiler:
+                    with stage('compute'):
+                        results = simulate_population(
+                            model_type,
+                            absorption,
+                            time_grid(t_max, n_times),
+                            n_subjects=n_subjects,
+                            dose=dose,
+                            typical=typical,
+                            cv=cv,
+                            proportional_error=float(request.form.get('proportional_error') or 10) / 100,
+                            lloq=lloq,
+                            seed=seed,
+                            max_chunk_bytes=current_app.config['SIMULATION_CHUNK_BYTES']
+                        )
+                        results['observed'] = percentile_bands(
+                            [(data['times'], data['concentrations']) for data in subjects_data.values()]
+                        )
+                    
+                    with stage('serialize'):
+                        results_json = to_json(results)
+                
+                # Create analysis record
+                analysis = Analysis(
+                    name=name,
+                    type='Simulation',
+                    parameters=json.dumps({
+                        'model_type': model_type,
+                        'absorption': absorption,
+                        'dose': dose,
+                        'n_subjects': n_subjects,
+                        'n_times': n_times,
+                        't_max': t_max,
+                        'lloq': lloq,
+                        'seed': seed,
+                        'source_analysis_id': int(source_id) if source_id else None
+                    }),
+                    results=results_json,
+                    profile_path=save_profile(profiler),
+                    dataset_id=dataset.id
+                )
+                with stage('store'):
+                    db.session.add(analysis)
+                    db.session.flush()
+                # Snapshot once the store stage has finished, so the saved metrics include it
+                analysis.metrics = run.as_dict()
+                db.session.commit()
+                
+                flash('Population simulation completed successfully', 'success')
+                return redirect(url_for('main.analysis_detail', analysis_id=analysis.id))
+            except Exception as e:
+                run.fail(e)
+                flash(f'Error performing population simulation: {str(e)}', 'danger')
+                return redirect(url_for('main.simulation'))
     
-    datasets = Dataset.query.all()
-    return render_template('statistics.html', datasets=datasets)
+    return render_template('simulation.html', **simulation_choices())
+
+def simulation_choices():
+    """Datasets and compartmental analyses for the simulation form."""
+    analyses = Analysis.query.options(
+        db.load_only(Analysis.id, Analysis.name)
+    ).filter(Analysis.type == 'Compartmental').order_by(Analysis.id).all()
+    return {
+        'datasets': list_datasets(),
+        'analyses': analyses,
+        'max_subjects': current_app.config['SIMULATION_MAX_SUBJECTS']
+    }
 
 # Reports
-@app.route('/reports', methods=['GET', 'POST'])
+@bp.route('/reports', methods=['GET', 'POST'])
 def reports():
     if request.method == 'POST':
         analysis_id = request.form.get('analysis_id')
@@ -454,45 +996,51 @@ def reports():
         
         if not analysis_id or not name:
             flash('Analysis and report name are required', 'danger')
-            return redirect(url_for('reports'))
+            return redirect(url_for('main.reports'))
         
         analysis = Analysis.query.get_or_404(analysis_id)
         
-        # Generate report
-        try:
-            report_data = generate_report(analysis, report_type=report_type)
-            
-            # Save report to file
-            unique_filename = f"{uuid.uuid4().hex}.{report_type}"
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-            
-            with open(file_path, 'wb') as f:
-                f.write(report_data)
-            
-            # Create report record
-            report = Report(
-                name=name,
-                file_path=file_path,
-                analysis_id=analysis.id
-            )
-            db.session.add(report)
-            db.session.commit()
-            
-            flash('Report generated successfully', 'success')
-            return redirect(url_for('report_detail', report_id=report.id))
-        except Exception as e:
-            flash(f'Error generating report: {str(e)}', 'danger')
-            return redirect(url_for('reports'))
+        with track_run('Report', get_metrics()) as run:
+            # Generate report
+            try:
+                with stage('render'), profile_request() as profiler:
+                    report_data = generate_report(analysis, report_type=report_type)
+                
+                with stage('store'):
+                    # Save report to file
+                    unique_filename = f"{uuid.uuid4().hex}.{report_type}"
+                    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
+                    
+                    with open(file_path, 'wb') as f:
+                        f.write(report_data)
+                    
+                    # Create report record
+                    report = Report(
+                        name=name,
+                        file_path=file_path,
+                        profile_path=save_profile(profiler),
+                        analysis_id=analysis.id
+                    )
+                    db.session.add(report)
+                    db.session.commit()
+                
+                flash('Report generated successfully', 'success')
+                return redirect(url_for('main.report_detail', report_id=report.id))
+            except Exception as e:
+                run.fail(e)
+                flash(f'Error generating report: {str(e)}', 'danger')
+                return redirect(url_for('main.reports'))
     
-    analyses = Analysis.query.all()
+    # Only names and types are listed; the results documents can be large
+    analyses = Analysis.query.options(db.defer(Analysis.results), db.defer(Analysis.parameters)).all()
     return render_template('reports.html', analyses=analyses)
 
-@app.route('/report/<int:report_id>')
+@bp.route('/report/<int:report_id>')
 def report_detail(report_id):
     report = Report.query.get_or_404(report_id)
     return render_template('reports.html', report=report)
 
-@app.route('/download-report/<int:report_id>')
+@bp.route('/download-report/<int:report_id>')
 def download_report(report_id):
     report = Report.query.get_or_404(report_id)
     
@@ -502,8 +1050,13 @@ def download_report(report_id):
         download_name=f"{report.name}.{report.file_path.split('.')[-1]}"
     )
 
+@bp.route('/report/<int:report_id>/profile')
+def download_report_profile(report_id):
+    report = Report.query.get_or_404(report_id)
+    return send_profile(report.profile_path, f"{report.name}-profile")
+
 # Analysis details
-@app.route('/analysis/<int:analysis_id>')
+@bp.route('/analysis/<int:analysis_id>')
 def analysis_detail(analysis_id):
     analysis = Analysis.query.get_or_404(analysis_id)
     
@@ -516,63 +1069,241 @@ def analysis_detail(analysis_id):
         return render_template('bioequivalence.html', analysis=analysis)
     elif analysis.type == 'Statistics':
         return render_template('statistics.html', analysis=analysis)
+    elif analysis.type == 'Simulation':
+        return render_template('simulation.html', analysis=analysis, results=json.loads(analysis.results),
+                               **simulation_choices())
     else:
         flash('Unknown analysis type', 'danger')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
+
+@bp.route('/analysis/<int:analysis_id>/profile')
+def download_analysis_profile(analysis_id):
+    analysis = Analysis.query.get_or_404(analysis_id)
+    return send_profile(analysis.profile_path, f"{analysis.name}-profile")
 
 # API endpoints for AJAX calls
-@app.route('/api/dataset/<int:dataset_id>/preview')
+@bp.route('/api/dataset/<int:dataset_id>/preview')
 def api_dataset_preview(dataset_id):
     dataset = Dataset.query.get_or_404(dataset_id)
+    return cached_json_response('dataset-preview', dataset, lambda: build_dataset_preview(dataset))
+
+def build_dataset_preview(dataset):
+    # First samples of a page of subjects, sorted by subject and time
+    n_subjects = bounded_arg('subjects', 5, 100)
+    page = load_subjects_page(dataset, n_subjects, after=request.args.get('after'),
+                              samples=bounded_arg('samples', 10, 1000))
     
-    # Get first 10 samples from the dataset
     samples_data = []
-    for subject in dataset.subjects[:5]:
-        for sample in subject.samples[:10]:
+    for subject in page:
+        for time, concentration in zip(subject['times'], subject['concentrations']):
             samples_data.append({
-                'subject_id': subject.subject_id,
-                'time': sample.time,
-                'concentration': sample.concentration
+                'subject_id': subject['subject_id'],
+                'time': time,
+                'concentration': concentration
             })
     
-    return jsonify({
+    return {
         'success': True,
-        'data': samples_data
-    })
+        'data': samples_data,
+        'next_after': page[-1]['subject_id'] if page and len(page) == n_subjects else None
+    }
+
+@bp.route('/api/dataset/<int:dataset_id>/subjects')
+def api_dataset_subjects(dataset_id):
+    dataset = Dataset.query.get_or_404(dataset_id)
+    return cached_json_response('dataset-subjects', dataset, lambda: build_dataset_subjects(dataset))
+
+def build_dataset_subjects(dataset):
+    limit = bounded_arg('limit', 50, 1000)
+    subjects = query_subject_page(dataset, limit, after=request.args.get('after'))
+    sample_stats = query_sample_stats([pk for pk, _ in subjects])
+    
+    data = []
+    for pk, subject_id in subjects:
+        n_samples, time_min, time_max = sample_stats.get(pk, (0, None, None))
+        data.append({
+            'subject_id': subject_id,
+            'n_samples': n_samples,
+            'time_min': time_min,
+            'time_max': time_max
+        })
+    
+    return {
+        'success': True,
+        'data': data,
+        'total_subjects': count_subjects(dataset),
+        'next_after': subjects[-1][1] if subjects and len(subjects) == limit else None
+    }
+
+@bp.route('/api/dataset/<int:dataset_id>/subjects/<subject_id>/samples')
+def api_subject_samples(dataset_id, subject_id):
+    dataset = Dataset.query.get_or_404(dataset_id)
+    subject = Subject.query.filter_by(dataset_id=sample_source(dataset).id, subject_id=subject_id).first_or_404()
+    return cached_json_response(f'subject-samples:{subject_id}', dataset,
+                                lambda: build_subject_samples(dataset, subject))
+
+def build_subject_samples(dataset, subject):
+    limit = bounded_arg('limit', 100, 10000)
+    offset = bounded_arg('offset', 0, 2 ** 31)
+    query = db.session.query(Sample.time, Sample.concentration).filter(Sample.subject_id == subject.id).order_by(
+        Sample.time, Sample.id
+    )
+    
+    if dataset.parent_id is None:
+        rows = query.offset(offset).limit(limit).all()
+        times = [time for time, _ in rows]
+        concentrations = [concentration for _, concentration in rows]
+        total = query.count()
+    else:
+        # Transform the whole profile, then slice the page
+        rows = query.all()
+        times = np.array([time for time, _ in rows], dtype=np.float64)
+        concentrations = np.array([np.nan if c is None else c for _, c in rows], dtype=np.float64)
+        concentrations = apply_transformations(concentrations, np.array([0, len(rows)]),
+                                               dataset.transform_pipeline)
+        times = times[offset:offset + limit].tolist()
+        concentrations = concentrations[offset:offset + limit].tolist()
+        total = len(rows)
+    
+    return {
+        'success': True,
+        'subject_id': subject.subject_id,
+        'data': {
+            'times': times,
+            'concentrations': concentrations
+        },
+        'total': total,
+        'offset': offset,
+        'limit': limit
+    }
 
-@app.route('/api/dataset/<int:dataset_id>/plot-data')
+@bp.route('/api/dataset/<int:dataset_id>/plot-data')
 def api_dataset_plot_data(dataset_id):
     dataset = Dataset.query.get_or_404(dataset_id)
+    return cached_plot_response('dataset-plot-data', dataset, lambda: build_dataset_plot_data(dataset))
+
+def build_dataset_plot_data(dataset):
+    options = parse_plot_options()
+    subjects_data = load_subjects_data(dataset)
+    page_ids, pagination = paginate_subjects(list(subjects_data), options)
     
     # Format data for plotting
     plot_data = []
-    for subject in dataset.subjects:
-        times = []
-        concentrations = []
-        for sample in subject.samples:
-            times.append(sample.time)
-            concentrations.append(sample.concentration)
-        
+    for subject_id in page_ids:
+        data = subjects_data[subject_id]
+        times, concentrations = downsample_series(
+            data['times'], data['concentrations'], options['max_points'], options['x_min'], options['x_max']
+        )
         plot_data.append({
-            'subject_id': subject.subject_id,
+            'subject_id': subject_id,
             'times': times,
             'concentrations': concentrations
         })
     
-    return jsonify({
+    response = {
         'success': True,
         'data': plot_data
+    }
+    if pagination is not None:
+        response['pagination'] = pagination
+    if options['bands']:
+        response['bands'] = plot_bands(subjects_data.values(), options)
+    
+    return response
+
+@bp.route('/api/dataset/<int:dataset_id>/export')
+def api_dataset_export(dataset_id):
+    dataset = Dataset.query.get_or_404(dataset_id)
+    file_format = request.args.get('format', 'csv')
+    
+    if file_format not in EXPORT_FORMATS:
+        return jsonify({
+            'success': False,
+            'error': f'Unsupported export format: {file_format}'
+        }), 400
+    
+    if dataset.parent_id is not None:
+        flat = materialize_derived_dataset(dataset)
+    else:
+        flat = flatten_subjects(load_subjects_data(dataset))
+    
+    output = BytesIO()
+    write_dataset(flat, output, file_format)
+    output.seek(0)
+    
+    extension, mimetype = EXPORT_FORMATS[file_format]
+    return send_file(
+        output,
+        mimetype=mimetype,
+        as_attachment=True,
+        download_name=f"{secure_filename(dataset.name) or 'dataset'}.{extension}"
+    )
+
+@bp.route('/api/cache/stats')
+def api_cache_stats():
+    return jsonify({
+        'success': True,
+        'data': get_cache('result_cache').stats(),
+        'responses': get_response_cache().stats()
     })
 
-@app.route('/api/analysis/<int:analysis_id>/plot-data')
-def api_analysis_plot_data(analysis_id):
+@bp.route('/api/analysis/<int:analysis_id>/metrics')
+def api_analysis_metrics(analysis_id):
     analysis = Analysis.query.get_or_404(analysis_id)
+    return jsonify({'success': True, 'data': analysis.metrics})
+
+@bp.route('/metrics')
+def metrics():
+    """Analysis metrics in the Prometheus text format."""
+    return current_app.response_class(get_metrics().render(), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/api/nca-parameters')
+def api_nca_parameters():
+    analysis_ids = request.args.getlist('analysis_id', type=int)
+    parameters = request.args.getlist('parameter')
     
-    results = json.loads(analysis.results)
+    if not analysis_ids:
+        return jsonify({
+            'success': False,
+            'error': 'At least one analysis_id is required'
+        }), 400
     
     return jsonify({
+        'success': True,
+        'data': load_nca_parameters(analysis_ids, parameters or None)
+    })
+
+@bp.route('/api/analysis/<int:analysis_id>/plot-data')
+def api_analysis_plot_data(analysis_id):
+    analysis = Analysis.query.get_or_404(analysis_id)
+    # The payload also holds the full results (fitted parameters, summaries), so keep float64 precision
+    return cached_plot_response('analysis-plot-data', analysis, lambda: build_analysis_plot_data(analysis),
+                                default_dtype='float64')
+
+def build_analysis_plot_data(analysis):
+    options = parse_plot_options()
+    
+    results = json.loads(analysis.results)
+    response = {
         'success': True,
         'data': results,
         'type': analysis.type,
         'parameters': json.loads(analysis.parameters)
-    })
+    }
+    
+    # Per-subject results (NCA, compartmental) can be paginated, downsampled and aggregated
+    if analysis.type in ('NCA', 'Compartmental'):
+        subject_results = {s: r for s, r in results.items() if s != 'summary'}
+        page_ids, pagination = paginate_subjects(list(subject_results), options)
+        
+        data = {s: downsample_subject_result(subject_results[s], options) for s in page_ids}
+        if 'summary' in results:
+            data['summary'] = results['summary']
+        response['data'] = data
+        
+        if pagination is not None:
+            response['pagination'] = pagination
+        if options['bands']:
+            response['bands'] = plot_bands(subject_results.values(), options)
+    
+    return response
@@ -89,15 +89,19 @@ function fetchAndRenderDatasetPlot(datasetId) {
     const plotContainer = document.getElementById('dataPlotPreview');
     if (!plotContainer) return;
     
-    fetch(`/api/dataset/${datasetId}/plot-data`)
-        .then(response => response.json())
+    // Maximum number of subjects drawn as individual traces
+    // (a function-level constant: this script can be included twice on a page)
+    const DATASET_PLOT_SUBJECTS = 50;
+    
+    // Individual traces for the first page of subjects, plus percentile bands across all subjects
+    fetchPlotData(`/api/dataset/${datasetId}/plot-data?${plotDataQuery(plotContainer, { per_page: DATASET_PLOT_SUBJECTS, bands: 1 })}`)
         .then(data => {
             if (!data.success) {
                 plotContainer.innerHTML = '<div class="alert alert-danger">Error loading plot data</div>';
                 return;
             }
             
-            renderDatasetPlot(plotContainer, data.data);
+            renderDatasetPlot(plotContainer, data.data, data.bands);
         })
         .catch(error => {
             console.error('Error fetching dataset plot data:', error);
@@ -105,7 +109,7 @@ function fetchAndRenderDatasetPlot(datasetId) {
         });
 }
 
-function renderDatasetPlot(container, data) {
+function renderDatasetPlot(container, data, bands) {
     if (!data || data.length === 0) {
         container.innerHTML = '<div class="alert alert-info">No plot data available</div>';
         return;
@@ -135,6 +139,29 @@ function renderDatasetPlot(container, data) {
         });
     });
     
+    // Median and 5th-95th percentile band across all subjects
+    const observed = bands && bands.observed;
+    if (observed && observed.times.length > 0) {
+        traces.push({
+            x: Array.from(observed.times).concat(Array.from(observed.times).reverse()),
+            y: Array.from(observed.p95).concat(Array.from(observed.p05).reverse()),
+            type: 'scatter',
+            fill: 'toself',
+            fillcolor: 'rgba(128, 128, 128, 0.2)',
+            line: { color: 'transparent' },
+            hoverinfo: 'skip',
+            name: '5th-95th percentile'
+        });
+        traces.push({
+            x: observed.times,
+            y: observed.median,
+            type: 'scatter',
+            mode: 'lines',
+            line: { color: 'white', width: 3 },
+            name: 'Median'
+        });
+    }
+    
     const layout = {
         title: 'Concentration vs. Time',
         xaxis: {
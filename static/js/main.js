@@ -358,6 +358,90 @@ function setupReportsFunctionality() {
     }
 }
 
+// Build the query string for plot-data requests: one point per horizontal pixel
+// of the plot is the most a line can show, so larger series are downsampled server-side
+function plotDataQuery(container, options = {}) {
+    const width = container && container.clientWidth ? container.clientWidth : 800;
+    const params = new URLSearchParams({ max_points: Math.max(100, Math.round(width)) });
+    Object.entries(options).forEach(([key, value]) => {
+        if (value !== undefined && value !== null) {
+            params.set(key, value);
+        }
+    });
+    return params.toString();
+}
+
+// Fetch plot data in the binary array transport and resolve with the decoded payload.
+// Number arrays arrive as Float32Array views of the response buffer (no per-number parsing).
+function fetchPlotData(url) {
+    const separator = url.includes('?') ? '&' : '?';
+    return fetch(`${url}${separator}format=binary`)
+        .then(response => {
+            const contentType = response.headers.get('Content-Type') || '';
+            if (!contentType.includes('application/octet-stream')) {
+                return response.json();
+            }
+            return response.arrayBuffer().then(decodePlotBuffer);
+        });
+}
+
+// Decode the binary plot layout: 'PKB1', uint32 header length (little-endian),
+// JSON header, then a little-endian float buffer referenced by {"$array": i} markers
+function decodePlotBuffer(buffer) {
+    const view = new DataView(buffer);
+    const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+    if (magic !== 'PKB1') {
+        throw new Error('Unexpected plot data format');
+    }
+
+    const headerLength = view.getUint32(4, true);
+    const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 8, headerLength)));
+    const base = 8 + headerLength;
+    const ArrayType = header.dtype === 'float64' ? Float64Array : Float32Array;
+    const littleEndian = new Uint8Array(new Uint16Array([1]).buffer)[0] === 1;
+
+    const arrays = header.arrays.map(entry => {
+        const start = base + entry.offset * ArrayType.BYTES_PER_ELEMENT;
+        let values;
+        if (littleEndian) {
+            values = new ArrayType(buffer, start, entry.length);
+        } else {
+            values = new ArrayType(entry.length);
+            for (let i = 0; i < entry.length; i++) {
+                values[i] = ArrayType === Float64Array
+                    ? view.getFloat64(start + 8 * i, true)
+                    : view.getFloat32(start + 4 * i, true);
+            }
+        }
+
+        if (entry.shape && entry.shape.length === 2) {
+            // Rows (e.g. [time, concentration] pairs) as views into the same buffer
+            const [rows, columns] = entry.shape;
+            return Array.from({ length: rows }, (_, i) => values.subarray(i * columns, (i + 1) * columns));
+        }
+        return values;
+    });
+
+    const resolve = value => {
+        if (Array.isArray(value)) {
+            return value.map(resolve);
+        }
+        if (value && typeof value === 'object') {
+            if ('$array' in value) {
+                return arrays[value.$array];
+            }
+            const resolved = {};
+            Object.keys(value).forEach(key => {
+                resolved[key] = resolve(value[key]);
+            });
+            return resolved;
+        }
+        return value;
+    };
+
+    return resolve(header.payload);
+}
+
 function loadAnalysisPlots() {
     // Check if we have an analysis to display
     const analysisIdElement = document.getElementById('analysisId');
@@ -367,8 +451,7 @@ function loadAnalysisPlots() {
     if (!analysisId) return;
     
     // Fetch analysis data for plotting
-    fetch(`/api/analysis/${analysisId}/plot-data`)
-        .then(response => response.json())
+    fetchPlotData(`/api/analysis/${analysisId}/plot-data?${plotDataQuery()}`)
         .then(data => {
             if (data.success) {
                 // Render appropriate plots based on analysis type
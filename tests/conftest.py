@@ -0,0 +1,27 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def app(tmp_path):
+    """An app with an empty SQLite database and upload folder under tmp_path."""
+    from app import create_app, db
+    
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'test.db'),
+        'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+        'PROFILE_CACHE_FOLDER': str(tmp_path / 'uploads' / 'profiles'),
+        'PERF_INSTRUMENTATION': False,
+        'AUTO_INIT_DB': True
+    })
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
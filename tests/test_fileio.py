@@ -0,0 +1,37 @@
+import pytest
+
+from pk_tools.fileio import ingest_dataset, read_dataset
+
+pytest.importorskip('pyarrow')
+
+CSV = "subject_id,time,concentration\n" + "".join(
+    f"{subject_id},{t},{10.0 / (1 + t)}\n" for subject_id in ('001', '01', '1') for t in (0.5, 1, 2)
+)
+
+def test_pyarrow_read_keeps_subject_id_strings(tmp_path):
+    path = tmp_path / 'leading_zeros.csv'
+    path.write_text(CSV)
+    
+    df = read_dataset(str(path), engine='pyarrow')
+    
+    assert list(df['subject_id'].astype(str)) == ['001'] * 3 + ['01'] * 3 + ['1'] * 3
+    assert df['time'].dtype == 'float64'
+
+def test_unchunked_pyarrow_ingest_does_not_merge_subjects(tmp_path):
+    path = tmp_path / 'leading_zeros.csv'
+    path.write_text(CSV)
+    
+    df, report = ingest_dataset(str(path), chunksize=None, engine='pyarrow')
+    
+    assert report['valid']
+    assert report['n_subjects'] == 3
+    assert set(df['subject_id'].astype(str)) == {'001', '01', '1'}
+
+def test_pyarrow_read_falls_back_to_strings_for_non_numeric_cells(tmp_path):
+    path = tmp_path / 'blq.csv'
+    path.write_text("subject_id,time,concentration\n001,0.5,BLQ\n001,1,8.0\n")
+    
+    df, report = ingest_dataset(str(path), chunksize=None, engine='pyarrow')
+    
+    assert not report['valid']
+    assert list(df['subject_id'].astype(str)) == ['001', '001']
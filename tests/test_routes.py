@@ -0,0 +1,42 @@
+import io
+import json
+
+import numpy as np
+
+def synthetic_csv(n_subjects=4, seed=0):
+    rng = np.random.default_rng(seed)
+    lines = ['subject_id,time,concentration']
+    for subject in range(1, n_subjects + 1):
+        for t in (0.5, 1, 2, 4, 8, 12, 24):
+            concentration = 100 * (np.exp(-0.1 * t) - np.exp(-1.2 * t)) * rng.lognormal(0, 0.05)
+            lines.append(f'{subject},{t},{concentration:.4f}')
+    return '\n'.join(lines).encode()
+
+def upload_dataset(client):
+    client.post('/studies', data={'name': 'Study', 'description': ''})
+    client.post('/study/1/upload', content_type='multipart/form-data', data={
+        'name': 'Dataset', 'description': '', 'file': (io.BytesIO(synthetic_csv()), 'dataset.csv')
+    })
+
+def saved_metrics(app, analysis_id):
+    from app import db
+    from models import Analysis
+    
+    with app.app_context():
+        metrics = db.session.get(Analysis, analysis_id).metrics
+    return json.loads(metrics) if isinstance(metrics, str) else metrics
+
+def test_saved_metrics_include_the_store_stage(app, client):
+    upload_dataset(client)
+    
+    response = client.post('/nca', data={'dataset_id': '1', 'analysis_name': 'NCA', 'dose': '100'})
+    assert response.status_code == 302
+    response = client.post('/statistics', data={'dataset_id': '1', 'analysis_name': 'Stats',
+                                                'stat_type': 'regression'})
+    assert response.status_code == 302
+    
+    for analysis_id in (1, 2):
+        metrics = saved_metrics(app, analysis_id)
+        assert metrics['status'] == 'ok'
+        assert 'store' in metrics['stages']
+        assert metrics['total_seconds'] >= sum(metrics['stages'][name] for name in ('load', 'store'))
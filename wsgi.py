@@ -0,0 +1,58 @@
+"""
+WSGI entry point for multi-process servers.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The schema is created or upgraded when the app is created, once in the
+master process with preload_app. Servers that create the app in every
+worker should set AUTO_INIT_DB=0 and run `flask --app main init-db` first.
+
+With gunicorn.conf.py the app and the numerical libraries are loaded once in
+the master process and shared copy-on-write by the forked workers; each
+worker then opens its own database connections (see post_fork there).
+"""
+import os
+
+from app import create_app
+
+# Modules the analyses import on first use, in the order they are needed
+PRELOAD_MODULES = [
+    'pandas',
+    'scipy.optimize',
+    'scipy.stats',
+    'pyarrow',
+    'matplotlib',
+    'reportlab.platypus',
+]
+
+def preload_libraries(modules=PRELOAD_MODULES):
+    """
+    Import the analysis libraries ahead of the first request.
+    
+    Parameters:
+    - modules: Module names to import; optional ones that are not installed are skipped
+    
+    Returns:
+    - List of the modules imported
+    """
+    import importlib
+    
+    loaded = []
+    for name in modules:
+        if name == 'matplotlib':
+            import matplotlib
+            matplotlib.use('Agg')  # Use non-interactive backend
+            import matplotlib.pyplot  # noqa: F401
+            loaded.append(name)
+            continue
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            continue
+        loaded.append(name)
+    return loaded
+
+app = create_app()
+
+if os.environ.get("PRELOAD_LIBRARIES", "1") == "1":
+    preload_libraries()